@@ -1,63 +1,180 @@
 import logging
 import os
 import json
-from config.config import GROQ_API_KEY, GROQ_MODEL, ROUTING_MODEL, SERVER_URL
-from agent.tools.entidades import extract_entities
+import threading
+from config.config import LOG_LEVEL, SESSION_CAPACITY, SESSION_TTL_SECONDS, TOOL_CACHE_SIZE, PROMPT_MAX_TOKENS, PROMPT_FILTER_TOOLS, PREFETCH_ENABLED
+from agent.tools.entity_engine import get_entity_engine
 from agent.tools.context_manager import ContextManager
+from agent.tools.session_store import SessionStore
+from agent.tools.tool_cache import ToolResultCache
+from agent.tools.tool_registry import ToolRegistry
+from agent.tools.transport import build_tool_transport
+from agent.tools.prompt_budget import PromptBudget
+from agent.tools.llm_client import get_llm_client
+from agent.tools.single_flight import SingleFlight
+from agent.tools.prefetch import ToolPrefetcher
 from agent.agents.agent_base import AgentBase
 from agent.orchestrator import Orchestrator
+from telemetry.logs import setup_logging
 
-# Asegurar que la carpeta logs existe
-log_dir = os.path.join(os.path.dirname(__file__), "..", "logs")
-os.makedirs(log_dir, exist_ok=True)
-log_path = os.path.join(log_dir, "agent_debug.log")
-logging.basicConfig(filename=log_path, level=logging.DEBUG)
+# Rutas relativas al paquete, no al directorio desde el que se arranca el proceso
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(AGENT_DIR)
+TOOLS_SCHEMA_PATH = os.path.join(AGENT_DIR, "tools_schema.json")
+AGENTS_CONFIG_PATH = os.path.join(PROJECT_DIR, "config", "agents_config.json")
+PATTERNS_PATH = os.path.join(PROJECT_DIR, "config", "entity_patterns.json")
+REFERENCE_MAP_PATH = os.path.join(PROJECT_DIR, "config", "reference_map.json")
+LOG_DIR = os.path.join(PROJECT_DIR, "logs")
 
-# Cargar tools desde archivo local
-with open("agent/tools_schema.json", "r", encoding="utf-8") as f:
-    tools = json.load(f)
-
-# Inicializar el ContextManager con los paths de los JSON
-patterns_path = os.path.join(os.path.dirname(__file__), "..", "config", "entity_patterns.json")
-reference_map_path = os.path.join(os.path.dirname(__file__), "..", "config", "reference_map.json")
-context_manager = ContextManager(patterns_path, reference_map_path)
+def configure_logging(log_dir=LOG_DIR, level=LOG_LEVEL):
+    """
+    Configura el log del agente en logs/agent.jsonl (cola + hilo escritor, ver telemetry/logs.py).
+    Lo llaman los puntos de entrada (agent_server, main.py); importar el paquete no toca la
+    configuración de logging.
+    """
+    setup_logging(os.path.join(log_dir, "agent.jsonl"), level=level)
 
 # Cargar agentes dinámicamente desde config/agents_config.json
-def load_agents_from_config(config_path):
+def load_agents_from_config(config_path, tool_cache=None, tool_transport=None, entity_engine=None, tool_registry=None, prompt_budget=None, llm_client=None, tool_flight=None):
     """
     Carga la configuración de agentes desde un archivo JSON y crea instancias de AgentBase.
-    
+
     Args:
         config_path (str): Ruta al archivo de configuración de agentes.
-    
+        tool_cache (ToolResultCache, opcional): Caché de resultados compartida por los agentes.
+        tool_transport (opcional): Transporte de herramientas compartido por los agentes.
+        entity_engine (EntityEngine, opcional): Motor de entidades compartido por los agentes.
+        tool_registry (ToolRegistry, opcional): Registro de herramientas compartido por los agentes.
+        prompt_budget (PromptBudget, opcional): Presupuesto de prompt compartido por los agentes.
+        llm_client (opcional): Cliente de Groq compartido por los agentes.
+        tool_flight (SingleFlight, opcional): Agrupación de llamadas a herramientas compartida por los agentes.
+
     Returns:
         list: Lista de instancias de AgentBase.
     """
     with open(config_path, 'r', encoding='utf-8') as f:
         configs = json.load(f)
     # No añadir allowed_roles por defecto, solo usar lo que venga en el JSON
-    return [AgentBase(**cfg) for cfg in configs]
+    return [
+        AgentBase(
+            **cfg, tool_cache=tool_cache, tool_transport=tool_transport, entity_engine=entity_engine,
+            tool_registry=tool_registry, prompt_budget=prompt_budget, llm_client=llm_client, tool_flight=tool_flight
+        )
+        for cfg in configs
+    ]
 
-agents_config_path = os.path.join(os.path.dirname(__file__), "..", "config", "agents_config.json")
-agents = load_agents_from_config(agents_config_path)
+class AgentApp:
+    """
+    Grafo completo del agente: registro de herramientas, cachés, transporte, sesiones,
+    agentes y orquestador, todos compartiendo un único cliente de Groq.
+    """
+    def __init__(self, llm_client=None, tool_transport=None, tools_schema_path=TOOLS_SCHEMA_PATH, agents_config_path=AGENTS_CONFIG_PATH):
+        """
+        Args:
+            llm_client (opcional): Cliente de Groq; por defecto el compartido del proceso.
+            tool_transport (opcional): Transporte de herramientas; por defecto el de TOOL_TRANSPORT.
+            tools_schema_path (str, opcional): Ruta de tools_schema.json.
+            agents_config_path (str, opcional): Ruta de agents_config.json.
+        """
+        self.llm_client = llm_client if llm_client is not None else get_llm_client()
+        # Registro de herramientas construido una sola vez (esquemas, validadores, metadata)
+        with open(tools_schema_path, "r", encoding="utf-8") as f:
+            self.tool_registry = ToolRegistry(json.load(f))
+        self.tools = self.tool_registry.tools
+        self.tool_cache = ToolResultCache(self.tool_registry.metadata, capacity=TOOL_CACHE_SIZE)
+        # Llamadas idénticas en curso a herramientas de solo lectura compartidas entre peticiones y agentes
+        self.tool_flight = SingleFlight("tools")
+        # Transporte compartido por todos los agentes para ejecutar herramientas (ver TOOL_TRANSPORT)
+        self.tool_transport = tool_transport if tool_transport is not None else build_tool_transport()
+        self.session_store = SessionStore(capacity=SESSION_CAPACITY, ttl_seconds=SESSION_TTL_SECONDS)
+        self.entity_engine = get_entity_engine()
+        self.context_manager = ContextManager(PATTERNS_PATH, REFERENCE_MAP_PATH, session_store=self.session_store, entity_engine=self.entity_engine)
+        # Presupuesto de tokens compartido: filtra herramientas por relevancia y mide cada etapa
+        self.prompt_budget = PromptBudget(max_prompt_tokens=PROMPT_MAX_TOKENS, filter_tools=PROMPT_FILTER_TOOLS, entity_types=self.entity_engine.patterns)
+        self.agents = load_agents_from_config(
+            agents_config_path, tool_cache=self.tool_cache, tool_transport=self.tool_transport,
+            entity_engine=self.entity_engine, tool_registry=self.tool_registry, prompt_budget=self.prompt_budget,
+            llm_client=self.llm_client, tool_flight=self.tool_flight
+        )
+        # Identificar router_agent y agentes normales
+        self.router_agent = next((a for a in self.agents if a.name == "router_agent"), None)
+        self.user_agents = [a for a in self.agents if a.name != "router_agent"]
+        # Precarga de herramientas mientras decide el router (PREFETCH_ENABLED)
+        self.prefetcher = ToolPrefetcher(self.tool_registry, self.tool_cache, self.entity_engine, self.prompt_budget) if PREFETCH_ENABLED else None
+        self.orchestrator = Orchestrator(
+            self.user_agents, self.router_agent, self.tools, self.context_manager,
+            agents_config_path=agents_config_path, prompt_budget=self.prompt_budget, llm_client=self.llm_client,
+            prefetcher=self.prefetcher
+        )
+
+    async def close(self):
+        await self.tool_transport.close()
+        if hasattr(self.llm_client, "close"):
+            await self.llm_client.close()
+
+_default_app = None
+_default_lock = threading.Lock()
+# Atributos del grafo accesibles como `agent.agent.<nombre>` (se construye al primer acceso)
+_APP_ATTRIBUTES = {
+    "tool_registry", "tools", "tool_cache", "tool_flight", "tool_transport", "session_store", "entity_engine",
+    "context_manager", "prompt_budget", "agents", "router_agent", "user_agents", "orchestrator", "llm_client", "prefetcher",
+}
+
+def get_agent_app(create=True):
+    """
+    Devuelve el grafo del agente del proceso, construyéndolo la primera vez.
+    Args:
+        create (bool): Si es False y aún no se ha construido, devuelve None.
+    Returns:
+        AgentApp | None
+    """
+    global _default_app
+    if _default_app is None and create:
+        with _default_lock:
+            if _default_app is None:
+                logging.info("[agent] Construyendo el grafo de agentes")
+                _default_app = AgentApp()
+    return _default_app
 
-# Identificar router_agent y agentes normales
-router_agent = next((a for a in agents if a.name == "router_agent"), None)
-user_agents = [a for a in agents if a.name != "router_agent"]
+def preload():
+    """
+    Construye el grafo y el estado de solo lectura (patrones, validadores, router local) antes
+    de que los workers hagan fork. Las conexiones (Groq, backend) se abren en cada worker al primer uso.
+    Returns:
+        AgentApp: Grafo construido.
+    """
+    return get_agent_app()
 
-# Crear el orquestador
-orchestrator = Orchestrator(user_agents, router_agent, tools, context_manager)
+def __getattr__(name):
+    if name in _APP_ATTRIBUTES:
+        return getattr(get_agent_app(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def responder(user_input: str, user_role: str = "cliente") -> dict:
+async def responder(user_input: str, user_role: str = "cliente", session_id: str = "default") -> dict:
     """
     Función principal de entrada para procesar la petición del usuario.
     Llama al orquestador para obtener la respuesta adecuada según el rol y la entrada.
-    
+    Es una corrutina: debe esperarse desde un event loop (FastAPI o `asyncio.run`).
+
     Args:
         user_input (str): Entrada del usuario.
         user_role (str, opcional): Rol del usuario. Por defecto es 'cliente'.
-    
+        session_id (str, opcional): Identificador de la conversación cuyo contexto se usa.
+
     Returns:
         dict: Respuesta generada por el orquestador.
     """
-    return orchestrator.responder(user_input, user_role=user_role)
+    return await get_agent_app().orchestrator.responder(user_input, user_role=user_role, session_id=session_id)
+
+async def responder_stream(user_input: str, user_role: str = "cliente", session_id: str = "default"):
+    """
+    Variante en streaming de `responder`: generador asíncrono de eventos {"event", "data"}
+    ("route", "tool", "token" y un "done" final con la respuesta completa).
+
+    Args:
+        user_input (str): Entrada del usuario.
+        user_role (str, opcional): Rol del usuario. Por defecto es 'cliente'.
+        session_id (str, opcional): Identificador de la conversación cuyo contexto se usa.
+    """
+    async for event in get_agent_app().orchestrator.responder_stream(user_input, user_role=user_role, session_id=session_id):
+        yield event
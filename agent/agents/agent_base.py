@@ -1,11 +1,21 @@
 import logging
 import json
-import requests
-from groq import Groq
-from config.config import GROQ_API_KEY, GROQ_MODEL, SERVER_URL
-from jsonschema import validate, ValidationError
-import os
-import re
+import asyncio
+import time
+from types import SimpleNamespace
+from config.config import GROQ_MODEL, TOOL_CONCURRENCY, TOOL_CALL_TIMEOUT_SECONDS, TOOL_RESULT_MAX_ROWS, PATTERN_ERROR_USE_LLM
+from agent.tools.transport import HttpToolTransport
+from agent.tools.tool_cache import canonical_args
+from agent.tools.entity_engine import get_entity_engine
+from agent.tools.tool_registry import ToolRegistry
+from agent.tools.error_catalog import get_error_catalog
+from agent.tools.llm_client import get_llm_client
+from agent.tools.prompt_budget import PromptBudget
+from agent.tools.single_flight import SingleFlight
+from telemetry.tracing import get_tracer
+from telemetry.logs import log_payload
+
+tracer = get_tracer("agent")
 
 class AgentBase:
     """
@@ -13,7 +23,7 @@ class AgentBase:
     Define la estructura y el comportamiento general de un agente,
     incluyendo el manejo de mensajes, herramientas y roles permitidos.
     """
-    def __init__(self, name, system_prompt, specialization, tools, allowed_roles=None):
+    def __init__(self, name, system_prompt, specialization, tools, allowed_roles=None, tool_cache=None, tool_transport=None, entity_engine=None, tool_registry=None, error_catalog=None, prompt_budget=None, llm_client=None, tool_flight=None):
         """
         Inicializa un agente base con sus propiedades principales.
         
@@ -23,40 +33,107 @@ class AgentBase:
             specialization (str): Especialización o dominio del agente.
             tools (list): Lista de herramientas que puede usar el agente.
             allowed_roles (list, opcional): Roles permitidos para este agente.
+            tool_cache (ToolResultCache, opcional): Caché de resultados de herramientas de solo lectura.
+            tool_transport (opcional): Transporte usado para ejecutar las herramientas
+                (HttpToolTransport o InProcessToolTransport).
+            entity_engine (EntityEngine, opcional): Motor de entidades usado para validar argumentos.
+            tool_registry (ToolRegistry, opcional): Registro de herramientas precompilado.
+            error_catalog (ErrorCatalog, opcional): Catálogo de mensajes para errores de formato.
+            prompt_budget (PromptBudget, opcional): Filtrado de herramientas y límite de tokens por llamada.
+            llm_client (opcional): Cliente de Groq; por defecto el compartido del proceso (`get_llm_client`).
+            tool_flight (SingleFlight, opcional): Agrupación de llamadas idénticas en curso a herramientas
+                de solo lectura, compartida por los agentes.
         """
         self.name = name
         self.system_prompt = system_prompt
         self.specialization = specialization
         self.tools = tools
         self.allowed_roles = allowed_roles if allowed_roles is not None else ["cliente", "admin", "soporte"]
-        self.client = Groq(api_key=GROQ_API_KEY)
+        self.client = llm_client if llm_client is not None else get_llm_client()
+        self.tool_cache = tool_cache
+        self.tool_transport = tool_transport if tool_transport is not None else HttpToolTransport()
+        self.entity_engine = entity_engine if entity_engine is not None else get_entity_engine()
+        self.tool_registry = tool_registry
+        self.error_catalog = error_catalog if error_catalog is not None else get_error_catalog()
+        self.prompt_budget = prompt_budget if prompt_budget is not None else PromptBudget(filter_tools=False)
+        self.tool_flight = tool_flight if tool_flight is not None else SingleFlight("tools")
 
-    def handle(self, user_input, entidades, context, tools_schema=None):
+    async def handle(self, user_input, entidades, context, tools_schema=None):
         """
         Procesa la entrada del usuario y genera una respuesta usando el modelo y las herramientas disponibles.
         """
         messages = self._build_messages(user_input, entidades)
-        tools_to_use = self._select_tools(tools_schema)
-        resp = self.client.chat.completions.create(
+        tools_to_use = self._prepare_tools(messages, user_input, entidades, tools_schema)
+        with tracer.span("agent_llm", agent=self.name):
+            resp = await self.client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=messages,
+                tools=tools_to_use,
+                tool_choice="auto",
+                max_completion_tokens=1024
+            )
+        log_payload("llm_response", resp, f"[{self.name}] Respuesta cruda", agent=self.name)
+        self.prompt_budget.record_usage(f"agent:{self.name}", getattr(resp, "usage", None))
+        msg = resp.choices[0].message
+        return await self._build_response(msg.content, getattr(msg, "tool_calls", None), tools_to_use, entidades)
+
+    async def handle_stream(self, user_input, entidades, context, tools_schema=None):
+        """
+        Igual que `handle`, pero pide la respuesta al modelo en streaming y va emitiendo eventos:
+        "token" por cada fragmento de texto, "tool" cuando el modelo pide herramientas y "done"
+        con la respuesta final (la misma que devolvería `handle`).
+        """
+        messages = self._build_messages(user_input, entidades)
+        tools_to_use = self._prepare_tools(messages, user_input, entidades, tools_schema)
+        start = time.perf_counter()
+        stream = await self.client.chat.completions.create(
             model=GROQ_MODEL,
             messages=messages,
             tools=tools_to_use,
             tool_choice="auto",
-            max_completion_tokens=1024
+            max_completion_tokens=1024,
+            stream=True
         )
-        logging.debug(f"[{self.name}] Respuesta cruda: {resp!r}")
-        msg = resp.choices[0].message
-        if getattr(msg, "tool_calls", None):
-            resultados = self._process_tool_calls(msg.tool_calls, tools_to_use, entidades)
+        content_parts = []
+        partial_calls = {}
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield {"event": "token", "data": {"content": delta.content}}
+            # Los argumentos de cada tool_call llegan troceados: se acumulan por índice
+            for tc in delta.tool_calls or []:
+                partial = partial_calls.setdefault(tc.index, {"name": "", "arguments": ""})
+                if tc.function and tc.function.name:
+                    partial["name"] += tc.function.name
+                if tc.function and tc.function.arguments:
+                    partial["arguments"] += tc.function.arguments
+        # En streaming se mide la generación completa, incluido el tiempo en que el cliente consume los eventos
+        tracer.observe("agent_llm", time.perf_counter() - start, agent=self.name)
+        tool_calls = [
+            SimpleNamespace(function=SimpleNamespace(name=c["name"], arguments=c["arguments"]))
+            for _, c in sorted(partial_calls.items())
+        ]
+        if tool_calls:
+            yield {"event": "tool", "data": {"agent": self.name, "tools": [c.function.name for c in tool_calls]}}
+        content = "".join(content_parts) if content_parts else None
+        yield {"event": "done", "data": await self._build_response(content, tool_calls, tools_to_use, entidades)}
+
+    async def _build_response(self, content, tool_calls, tools_to_use, entidades):
+        if tool_calls:
+            with tracer.span("tool_calls", agent=self.name, count=len(tool_calls)):
+                resultados = await self._process_tool_calls(tool_calls, tools_to_use, entidades)
             return {"type": "tool_calls", "agent": self.name, "results": resultados}
-        if msg.content is not None:
+        if content is not None:
             try:
-                parsed = json.loads(msg.content)
+                parsed = json.loads(content)
                 if isinstance(parsed, dict):
                     return parsed
             except Exception:
                 pass
-        return {"type": "chat", "agent": self.name, "response": msg.content}
+        return {"type": "chat", "agent": self.name, "response": content}
 
     def _build_messages(self, user_input, entidades):
         messages = []
@@ -67,81 +144,274 @@ class AgentBase:
                 "content": f"Entidades detectadas: {json.dumps(entidades)}"
             })
         messages.append({"role": "user", "content": user_input})
-        logging.debug(f"[{self.name}] Mensajes enviados: {messages}")
+        log_payload("llm_messages", messages, f"[{self.name}] Mensajes enviados", agent=self.name)
         return messages
 
     def _select_tools(self, tools_schema):
-        if tools_schema is None:
-            tools_schema = []
-        return [t for t in tools_schema if t["function"]["name"] in self.tools] if tools_schema else []
+        if self.tool_registry is None:
+            if not tools_schema:
+                return []
+            # Sin registro compartido se construye uno a partir del primer esquema recibido
+            self.tool_registry = ToolRegistry(tools_schema)
+        return self.tool_registry.tools_for(self.name, self.tools)
 
-    def _process_tool_calls(self, tool_calls, tools_to_use, entidades):
-        patterns_path = os.path.join(os.path.dirname(__file__), "..", "..", "config", "entity_patterns.json")
-        try:
-            with open(patterns_path, 'r', encoding='utf-8') as f:
-                entity_patterns = json.load(f)
-        except Exception:
-            entity_patterns = {}
+    def _prepare_tools(self, messages, user_input, entidades, tools_schema):
+        # Solo las herramientas relevantes para el mensaje, recortadas al presupuesto de tokens
+        tools = self.prompt_budget.relevant_tools(self._select_tools(tools_schema), user_input, entidades)
+        return self.prompt_budget.fit(f"agent:{self.name}", messages, tools)
+
+    def _has_tool(self, name):
+        return self.tool_registry is not None and name in self.tool_registry.schemas and name in self.tools
+
+    async def _process_tool_calls(self, tool_calls, tools_to_use, entidades):
         resultados = []
-        for call in tool_calls: # type: ignore
-            name = call.function.name
-            try:
-                args = json.loads(call.function.arguments)
-            except Exception:
-                logging.exception(f"[{self.name}] Error parseando arguments para {name}")
-                resultados.append({"tool": name, "error": "args invalidos"})
-                continue
-            tool_schema = next((t for t in tools_to_use if t["function"]["name"] == name), None)
-            args = self._fill_missing_args(args, tool_schema, entidades)
-            if not self._validate_args(args, tool_schema, name, resultados):
-                continue
-            # Validación de patrones: si falla, responde de forma amable usando el modelo
-            pattern_errors = []
-            for arg_name, arg_value in args.items():
-                if arg_name in entity_patterns:
-                    pattern = entity_patterns[arg_name]
-                    if not re.fullmatch(pattern, str(arg_value)):
-                        pattern_errors.append(f"El valor '{arg_value}' para '{arg_name}' no cumple el formato requerido.")
-            if pattern_errors:
-                logging.warning(f"[{self.name}] Validación de patrón fallida para {name}: {pattern_errors}")
-                # Llamar al modelo para que explique el error de forma concreta y breve
-                error_messages = [
-                    {"role": "system", "content": "Eres un asistente amable y conciso. Si el usuario comete un error de formato, explica el error de forma clara, breve y directa, sin explicaciones largas ni ejemplos extensos. Solo indica el campo, el valor y que revise el formato."},
-                    {"role": "user", "content": f"El usuario intentó consultar '{name}' pero: {'; '.join(pattern_errors)} Por favor, indícale el error de forma breve y concreta."}
-                ]
-                resp = self.client.chat.completions.create(
-                    model=GROQ_MODEL,
-                    messages=error_messages, # type: ignore
-                    max_completion_tokens=80
+        pending = []
+        with tracer.span("tool_validation"):
+            for call in tool_calls: # type: ignore
+                name = call.function.name
+                try:
+                    args = json.loads(call.function.arguments)
+                except Exception:
+                    logging.exception(f"[{self.name}] Error parseando arguments para {name}")
+                    resultados.append({"tool": name, "error": "args invalidos"})
+                    continue
+                args = self._fill_missing_args(args, name, entidades)
+                if not self._validate_args(args, name, resultados):
+                    continue
+                # Validación de patrones: si falla, responde con un mensaje del catálogo local
+                invalid = [(arg_name, arg_value) for arg_name, arg_value in args.items()
+                           if not self.entity_engine.validate(arg_name, arg_value)]
+                if invalid:
+                    logging.warning(f"[{self.name}] Validación de patrón fallida para {name}: {invalid}")
+                    if PATTERN_ERROR_USE_LLM:
+                        return [{"tool": name, "error": await self._explain_pattern_errors(name, invalid)}]
+                    return [{"tool": name, "error": self.error_catalog.render(name, invalid)}]
+                # Listados paginados: nunca más de TOOL_RESULT_MAX_ROWS filas por página
+                if self._has_tool(name):
+                    args = self.tool_registry.with_page_limit(name, args, TOOL_RESULT_MAX_ROWS)
+                # Hueco para el resultado: las llamadas válidas se ejecutan después en paralelo
+                pending.append((len(resultados), name, args))
+                resultados.append(None)
+        if pending:
+            misses = []
+            with tracer.span("tool_cache"):
+                for idx, name, args in pending:
+                    out = self.tool_cache.get(name, args) if self.tool_cache else None
+                    if out is not None:
+                        logging.info(f"[{self.name}] Resultado de {name} servido desde caché para args {args}")
+                        resultados[idx] = {"tool": name, "params": args, "response": out}
+                    else:
+                        misses.append((idx, name, args))
+            outcomes = await self._run_calls([(name, args) for _, name, args in misses])
+            for (idx, _, _), outcome in zip(misses, outcomes):
+                resultados[idx] = outcome
+        return resultados
+
+    async def _run_calls(self, calls):
+        """
+        Ejecuta llamadas a herramientas registrándolas en `tool_flight`. Las idénticas a una ya
+        en curso (de otra petición, de una precarga o repetida en esta misma lista) no se
+        ejecutan: esperan su resultado. Nunca lanza: los fallos son resultados.
+        Args:
+            calls (list): (nombre, argumentos) de cada llamada.
+        Returns:
+            list: Resultado de cada llamada, en orden.
+        """
+        own, led, shared = [], [], []
+        # Sin esperas entre join y lead: una repetida en la lista se une a la primera
+        for i, (name, args) in enumerate(calls):
+            key = self._flight_key(name, args)
+            future = self.tool_flight.join(key) if key is not None else None
+            if future is not None:
+                shared.append((i, name, future))
+            else:
+                own.append((i, name, args))
+                led.append((name, key, self.tool_flight.lead(key) if key is not None else None))
+        outcomes = [None] * len(calls)
+        try:
+            # Varias llamadas al backend en el mismo turno: una sola petición a /batch
+            own_calls = [(name, args) for _, name, args in own]
+            if len(own_calls) > 1:
+                own_outcomes = await self._execute_batch(own_calls)
+            elif own_calls:
+                own_outcomes = await self._execute_concurrently(own_calls)
+            else:
+                own_outcomes = []
+            for (i, _, _), (_, key, future), outcome in zip(own, led, own_outcomes):
+                outcomes[i] = outcome
+                if future is not None:
+                    self.tool_flight.resolve(key, future, outcome)
+        finally:
+            # Si el turno se cancela, los que esperaban estas llamadas no se quedan bloqueados
+            for name, key, future in led:
+                if future is not None and not future.done():
+                    self.tool_flight.resolve(key, future, {"tool": name, "error": "backend failure"})
+        if shared:
+            with tracer.span("tool_shared", tools=[name for _, name, _ in shared]):
+                results = await asyncio.gather(*(asyncio.shield(f) for _, _, f in shared), return_exceptions=True)
+            for (i, name, _), outcome in zip(shared, results):
+                outcomes[i] = {"tool": name, "error": "backend failure"} if isinstance(outcome, BaseException) else outcome
+        return outcomes
+
+    async def prefetch(self, calls):
+        """
+        Ejecuta de forma especulativa herramientas de solo lectura para dejar su resultado en la
+        caché (o en curso en `tool_flight`) antes de que el modelo las pida.
+        Args:
+            calls (list): (nombre, argumentos) de cada llamada.
+        Returns:
+            list: Resultado de cada llamada, en orden.
+        """
+        with tracer.span("tool_prefetch", agent=self.name, tools=[name for name, _ in calls]):
+            return await self._run_calls(calls)
+
+    def _is_write(self, name):
+        # Herramientas de escritura: las que invalidan resultados en tools_schema.json
+        metadata = self.tool_registry.metadata if self.tool_registry is not None else {}
+        return bool(metadata.get(name, {}).get("invalidates"))
+
+    def _flight_key(self, name, args):
+        # Solo se agrupan herramientas de solo lectura: las de escritura se ejecutan siempre
+        if self._is_write(name):
+            return None
+        return (name, canonical_args(args))
+
+    async def _explain_pattern_errors(self, name, invalid):
+        """
+        Pide al modelo que explique los errores de formato (solo si PATTERN_ERROR_USE_LLM está activo).
+        """
+        pattern_errors = [f"El valor '{arg_value}' para '{arg_name}' no cumple el formato requerido." for arg_name, arg_value in invalid]
+        error_messages = [
+            {"role": "system", "content": "Eres un asistente amable y conciso. Si el usuario comete un error de formato, explica el error de forma clara, breve y directa, sin explicaciones largas ni ejemplos extensos. Solo indica el campo, el valor y que revise el formato."},
+            {"role": "user", "content": f"El usuario intentó consultar '{name}' pero: {'; '.join(pattern_errors)} Por favor, indícale el error de forma breve y concreta."}
+        ]
+        with tracer.span("pattern_error_llm", tool=name):
+            resp = await self.client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=error_messages, # type: ignore
+                max_completion_tokens=80
+            )
+        self.prompt_budget.record_usage("pattern_error", getattr(resp, "usage", None))
+        return resp.choices[0].message.content
+
+    def _cap_rows(self, out):
+        """
+        Recorta a TOOL_RESULT_MAX_ROWS cada listado de una respuesta; el número de filas de cada
+        listado recortado queda en `totals` ({clave: filas}), el mismo formato que usan los
+        listados paginados del backend (cuyo total, si lo traen, se conserva).
+        """
+        if not TOOL_RESULT_MAX_ROWS or not isinstance(out, dict):
+            return out
+        totals = {key: len(value) for key, value in out.items()
+                  if isinstance(value, list) and len(value) > TOOL_RESULT_MAX_ROWS}
+        if not totals:
+            return out
+        capped = {key: value[:TOOL_RESULT_MAX_ROWS] if key in totals else value for key, value in out.items()}
+        capped["totals"] = dict(totals, **(out.get("totals") or {}))
+        return capped
+
+    def _record_result(self, name, args, out):
+        out = self._cap_rows(out)
+        if self.tool_cache:
+            self.tool_cache.store(name, args, out)
+            self.tool_cache.invalidate_for(name, args)
+        return {"tool": name, "params": args, "response": out}
+
+    async def _execute_batch(self, calls):
+        """
+        Ejecuta varias herramientas en una única petición al endpoint /batch del backend.
+        Si la petición completa falla (o devuelve un número de resultados distinto), las
+        herramientas de solo lectura se repiten con llamadas individuales concurrentes; las de
+        escritura se dan por fallidas, porque el backend puede haberlas aplicado ya.
+        """
+        logging.info(f"[{self.name}] Ejecutando en batch: {[name for name, _ in calls]}")
+        try:
+            with tracer.span("tool_batch", tools=[name for name, _ in calls]):
+                items = await asyncio.wait_for(
+                    self.tool_transport.call_batch([{"tool": name, "args": args} for name, args in calls]),
+                    timeout=TOOL_CALL_TIMEOUT_SECONDS
                 )
-                msg = resp.choices[0].message
-                return [{"tool": name, "error": msg.content}]
+            if len(items) != len(calls):
+                raise ValueError(f"/batch devolvió {len(items)} resultados para {len(calls)} llamadas")
+        except asyncio.TimeoutError:
+            logging.error(f"[{self.name}] Timeout en la petición batch")
+            return await self._retry_reads(calls, "backend timeout")
+        except Exception:
+            logging.exception(f"[{self.name}] Error en la petición batch")
+            return await self._retry_reads(calls, "backend failure")
+        outcomes = []
+        for (name, args), item in zip(calls, items):
+            if "error" in item:
+                logging.error(f"[{self.name}] Error del backend para {name} en batch: {item['error']}")
+                outcomes.append({"tool": name, "error": item["error"]})
+            else:
+                outcomes.append(self._record_result(name, args, item["response"]))
+        return outcomes
+
+    async def _retry_reads(self, calls, error):
+        # Tras un batch fallido: las de solo lectura se repiten una a una, las de escritura no
+        reads = [i for i, (name, _) in enumerate(calls) if not self._is_write(name)]
+        outcomes = [{"tool": name, "error": error} for name, _ in calls]
+        if reads:
+            logging.info(f"[{self.name}] Repitiendo en llamadas individuales: {[calls[i][0] for i in reads]}")
+            for i, outcome in zip(reads, await self._execute_concurrently([calls[i] for i in reads])):
+                outcomes[i] = outcome
+        return outcomes
+
+    async def _execute_concurrently(self, calls):
+        """
+        Ejecuta las herramientas en paralelo con un límite de concurrencia, conservando el orden.
+        """
+        semaphore = asyncio.Semaphore(TOOL_CONCURRENCY)
+        outcomes = await asyncio.gather(
+            *(self._execute_tool(name, args, semaphore) for name, args in calls),
+            return_exceptions=True
+        )
+        for i, ((name, _), outcome) in enumerate(zip(calls, outcomes)):
+            if isinstance(outcome, BaseException):
+                logging.error(f"[{self.name}] Error inesperado ejecutando {name}: {outcome!r}")
+                outcomes[i] = {"tool": name, "error": "backend failure"}
+        return outcomes
+
+    async def _execute_tool(self, name, args, semaphore):
+        """
+        Ejecuta una herramienta contra el backend con límite de concurrencia y timeout por
+        llamada. Nunca lanza: los fallos se devuelven como resultado.
+        """
+        async with semaphore:
             logging.info(f"[{self.name}] Ejecutando herramienta {name} con args {args}")
             try:
-                r = requests.post(f"{SERVER_URL}/{name}", json=args)
-                r.raise_for_status()
-                out = r.json()
+                with tracer.span("tool_call", tool=name):
+                    out = await asyncio.wait_for(
+                        self.tool_transport.call(name, args),
+                        timeout=TOOL_CALL_TIMEOUT_SECONDS
+                    )
+            except asyncio.TimeoutError:
+                logging.error(f"[{self.name}] Timeout al llamar al backend para {name}")
+                return {"tool": name, "error": "backend timeout"}
             except Exception:
                 logging.exception(f"[{self.name}] Error al llamar al backend para {name}")
-                resultados.append({"tool": name, "error": "backend failure"})
-                continue
-            resultados.append({"tool": name, "params": args, "response": out})
-        return resultados
+                return {"tool": name, "error": "backend failure"}
+        return self._record_result(name, args, out)
 
-    def _fill_missing_args(self, args, tool_schema, entidades):
-        reqs = tool_schema["function"]["parameters"].get("required", []) if tool_schema else []
-        for r in reqs:
+    def _fill_missing_args(self, args, name, entidades):
+        if not self._has_tool(name):
+            return args
+        for r in self.tool_registry.required[name]:
             if r not in args and r in entidades:
                 args[r] = entidades[r]
+        # Herramientas que aceptan dni o póliza: si no llega ninguno, el primero conocido de la sesión
+        alternatives = self.tool_registry.alternatives.get(name, ())
+        if alternatives and not any(args.get(f) for f in alternatives):
+            field = next((f for f in alternatives if entidades.get(f)), None)
+            if field is not None:
+                args[field] = entidades[field]
         return args
 
-    def _validate_args(self, args, tool_schema, name, resultados):
-        schema = tool_schema["function"]["parameters"] if tool_schema else None
-        if schema:
-            try:
-                validate(instance=args, schema=schema)
-            except ValidationError as e:
-                logging.warning(f"[{self.name}] Validación fallida para {name}: {e.message}")
-                resultados.append({"tool": name, "error": f"validación fallida: {e.message}"})
-                return False
+    def _validate_args(self, args, name, resultados):
+        error = self.tool_registry.validation_error(name, args) if self._has_tool(name) else None
+        if error:
+            logging.warning(f"[{self.name}] Validación fallida para {name}: {error}")
+            resultados.append({"tool": name, "error": f"validación fallida: {error}"})
+            return False
         return True
@@ -1,9 +1,24 @@
+import asyncio
 import logging
 import json
-from groq import Groq
-from config.config import GROQ_API_KEY, GROQ_MODEL, ROUTING_MODEL, SERVER_URL
+import os
+import time
+from types import SimpleNamespace
+from config.config import GROQ_MODEL, ROUTING_MODEL, SERVER_URL, LOCAL_ROUTER_THRESHOLD, ROUTING_CACHE_SIZE, ROUTING_CACHE_TTL_SECONDS, ROUTER_PROMPT_MODE
 from agent.agents.agent_base import AgentBase
 from agent.tools.context_manager import ContextManager
+from agent.tools.local_router import LocalRouter
+from agent.tools.lru_cache import LRUCache
+from agent.tools.single_flight import SingleFlight
+from agent.tools.llm_scheduler import LLMOverloaded
+from agent.tools.llm_client import get_llm_client
+from agent.tools.prompt_budget import PromptBudget, build_compact_router_prompt
+from telemetry.tracing import get_tracer
+from telemetry.logs import log_payload
+
+tracer = get_tracer("agent")
+
+GENERAL_ASSISTANT_PROMPT = "Eres un chatbot asistente general. Si no puedes ayudar con la petición, responde de forma breve y educada, por ejemplo: 'Lo siento, no tengo acceso a esa información.' o 'No puedo ayudarte con eso.' Da respuestas cortas y claras."
 
 class Orchestrator:
     """
@@ -11,7 +26,7 @@ class Orchestrator:
     Se encarga de seleccionar el agente adecuado según el rol del usuario y la entrada,
     gestionar el contexto y delegar la respuesta al agente correspondiente o al modelo general.
     """
-    def __init__(self, agents, router_agent, tools_schema, context_manager):
+    def __init__(self, agents, router_agent, tools_schema, context_manager, local_router_threshold=LOCAL_ROUTER_THRESHOLD, agents_config_path=None, prompt_budget=None, router_prompt_mode=ROUTER_PROMPT_MODE, llm_client=None, prefetcher=None):
         """
         Inicializa el orquestador con los agentes disponibles, el agente router,
         el esquema de herramientas y el gestor de contexto.
@@ -21,13 +36,75 @@ class Orchestrator:
             router_agent (AgentBase): Agente encargado de decidir el enrutamiento.
             tools_schema (dict): Esquema de herramientas disponibles para los agentes.
             context_manager (ContextManager): Gestor de contexto y entidades.
+            local_router_threshold (float, opcional): Confianza mínima del router local
+                para no consultar al ROUTING_MODEL.
+            agents_config_path (str, opcional): Ruta de agents_config.json; si cambia, se
+                invalida la caché de enrutamiento y se reentrena el router local.
+            prompt_budget (PromptBudget, opcional): Medición y límite de tokens de las llamadas al modelo.
+            router_prompt_mode (str, opcional): "full" usa el prompt del router_agent tal cual;
+                "compact" envía la lista de agentes con un ejemplo de cada uno.
+            llm_client (opcional): Cliente de Groq; por defecto el compartido del proceso (`get_llm_client`).
+            prefetcher (ToolPrefetcher, opcional): Precarga de herramientas mientras decide el router.
         """
         self.agents = agents
         self.router_agent = router_agent
         self.tools_schema = tools_schema
         self.context_manager = context_manager
         self.context = {}
-        self.client = Groq(api_key=GROQ_API_KEY)
+        self.client = llm_client if llm_client is not None else get_llm_client()
+        self.local_router = LocalRouter.from_agents(agents, router_agent)
+        self.local_router_threshold = local_router_threshold
+        self.routing_cache = LRUCache(capacity=ROUTING_CACHE_SIZE, ttl_seconds=ROUTING_CACHE_TTL_SECONDS)
+        self.router_flight = SingleFlight("router")
+        self.agents_config_path = agents_config_path
+        self._agents_config_mtime = self._get_agents_config_mtime()
+        self.prompt_budget = prompt_budget if prompt_budget is not None else PromptBudget(filter_tools=False)
+        self.router_system_prompt = self._build_router_prompt(router_prompt_mode)
+        self.prefetcher = prefetcher
+        self._prefetch_tasks = set()
+
+    def _build_router_prompt(self, mode):
+        if self.router_agent is None:
+            return ""
+        if mode == "compact":
+            return build_compact_router_prompt(self.router_agent.system_prompt, self.agents)
+        return self.router_agent.system_prompt
+
+    def _get_agents_config_mtime(self):
+        if not self.agents_config_path:
+            return None
+        try:
+            return os.stat(self.agents_config_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _check_agents_config(self):
+        """
+        Si agents_config.json ha cambiado desde la última comprobación, vacía la caché de
+        enrutamiento y reentrena el router local con la nueva configuración.
+        """
+        mtime = self._get_agents_config_mtime()
+        if mtime != self._agents_config_mtime:
+            logging.info("[routing_cache] agents_config.json ha cambiado, invalidando caché")
+            self.routing_cache.clear()
+            self._agents_config_mtime = mtime
+            self._rebuild_local_router()
+
+    def _rebuild_local_router(self):
+        try:
+            with open(self.agents_config_path, "r", encoding="utf-8") as f:
+                configs = [SimpleNamespace(**cfg) for cfg in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            logging.exception("[local_router] No se pudo leer agents_config.json; se mantiene el router actual")
+            return
+        # Solo agentes cargados: el router local no puede elegir uno que no existe en este proceso
+        loaded = {a.name for a in self.agents}
+        agents = [c for c in configs if getattr(c, "name", None) in loaded]
+        router_agent = next((c for c in configs if getattr(c, "name", None) == "router_agent"), self.router_agent)
+        hits, misses = self.local_router.hits, self.local_router.misses
+        self.local_router = LocalRouter.from_agents(agents, router_agent)
+        self.local_router.hits, self.local_router.misses = hits, misses
+        logging.info(f"[local_router] Reentrenado con {len(agents)} agentes")
 
     def get_allowed_agents(self, user_role):
         """
@@ -41,7 +118,7 @@ class Orchestrator:
         """
         return [a for a in self.agents if not hasattr(a, 'allowed_roles') or user_role in getattr(a, 'allowed_roles', ['cliente','admin','soporte'])]
 
-    def route(self, user_input, entidades, agent_name=None, allowed_agents=None):
+    async def route(self, user_input, entidades, agent_name=None, allowed_agents=None):
         """
         Determina y ejecuta el agente adecuado para manejar la petición del usuario.
         
@@ -58,67 +135,251 @@ class Orchestrator:
         if agent_name:
             agent = next((a for a in agents_to_use if a.name == agent_name), None)
             if agent:
-                return agent.handle(user_input, entidades, self.context, self.tools_schema)
+                return await agent.handle(user_input, entidades, self.context, self.tools_schema)
             else:
                 raise Exception(f"Agente '{agent_name}' no encontrado o no permitido")
         for agent in agents_to_use:
             for tool in getattr(agent, 'tools', []):
                 if tool.replace('_', ' ') in user_input.lower():
-                    return agent.handle(user_input, entidades, self.context, self.tools_schema)
-        return agents_to_use[0].handle(user_input, entidades, self.context, self.tools_schema)
+                    return await agent.handle(user_input, entidades, self.context, self.tools_schema)
+        return await agents_to_use[0].handle(user_input, entidades, self.context, self.tools_schema)
 
-    def responder(self, user_input: str, user_role: str = "cliente") -> dict:
+    async def select_agent_name(self, user_input, allowed_agents=None):
         """
-        Procesa la entrada del usuario, selecciona el agente adecuado y retorna la respuesta.
-        Si ningún agente es adecuado, responde usando el modelo general.
+        Decide qué agente debe responder. Primero consulta el router local; si su confianza
+        no alcanza el umbral, busca la consulta normalizada en la caché de enrutamiento y,
+        solo si no está, pregunta al router_agent (ROUTING_MODEL). Las consultas con la misma
+        forma normalizada que lleguen mientras la pregunta está en curso esperan su respuesta.
         
         Args:
             user_input (str): Entrada del usuario.
-            user_role (str, opcional): Rol del usuario. Por defecto es 'cliente'.
+            allowed_agents (list, optional): Agentes permitidos para el rol; si el router local
+                elige otro, decide el router LLM.
         
         Returns:
-            dict: Respuesta generada por el agente o el modelo general.
+            str: Nombre del agente elegido (tal como lo devuelve el router).
         """
-        allowed_agents = self.get_allowed_agents(user_role)
+        self._check_agents_config()
+        allowed = {a.name for a in allowed_agents} if allowed_agents is not None else None
+        with tracer.span("local_router"):
+            agent_name = self.local_router.decide(user_input, self.local_router_threshold, allowed)
+        if agent_name:
+            logging.debug(f"[local_router] Seleccionado: {agent_name}")
+            return agent_name
+        cache_key = self.context_manager.normalize_query(user_input)
+        agent_name = self.routing_cache.get(cache_key)
+        if agent_name:
+            logging.debug(f"[routing_cache] Seleccionado: {agent_name}")
+            return agent_name
+        # Consultas equivalentes simultáneas comparten una sola llamada al router
+        return await self.router_flight.do(cache_key, lambda: self._ask_router(user_input, cache_key))
+
+    async def _ask_router(self, user_input, cache_key):
         router_prompt = f"Usuario: {user_input}\nRespuesta:"
-        resp = self.client.chat.completions.create(
-            model=ROUTING_MODEL,
-            messages=[
-                {"role": "system", "content": self.router_agent.system_prompt},
-                {"role": "user", "content": router_prompt}
-            ],
-            max_completion_tokens=10
-        )
+        messages = [
+            {"role": "system", "content": self.router_system_prompt},
+            {"role": "user", "content": router_prompt}
+        ]
+        self.prompt_budget.fit("router", messages)
+        with tracer.span("router_llm"):
+            resp = await self.client.chat.completions.create(
+                model=ROUTING_MODEL,
+                messages=messages,
+                max_completion_tokens=10
+            )
+        self.prompt_budget.record_usage("router", getattr(resp, "usage", None))
         agent_name = resp.choices[0].message.content.strip() # type: ignore
         logging.debug(f"[router_agent] Seleccionado: {agent_name}")
+        self.routing_cache.set(cache_key, agent_name)
+        return agent_name
+
+    def _find_allowed_agent(self, agent_name, allowed_agents):
+        """
+        Busca entre los agentes permitidos el que corresponde al nombre devuelto por el router.
+        
+        Returns:
+            AgentBase | None: Agente encontrado, o None si no existe o no está permitido.
+        """
         agent_name_normalized = agent_name.strip().lower()
         allowed_names_normalized = [a.name.strip().lower() for a in allowed_agents]
         logging.debug(f"[responder] Nombres de agentes permitidos: {allowed_names_normalized}")
-        if agent_name_normalized in allowed_names_normalized:
-            entidades = self.context_manager.extract_and_update(user_input)
-            for entidad in self.context_manager.patterns.keys():
-                if entidad not in entidades:
-                    referencia = self.context_manager.resolve_reference(user_input)
-                    if entidad in referencia:
-                        entidades[entidad] = referencia[entidad]
-            logging.debug(f"Entidades extraídas: {entidades}")
+        if agent_name_normalized not in allowed_names_normalized:
+            return None
+        return allowed_agents[allowed_names_normalized.index(agent_name_normalized)]
+
+    def _resolve_entities(self, user_input, session_id):
+        """
+        Extrae las entidades del mensaje y completa las que falten con referencias al contexto de la sesión.
+        """
+        entidades = self.context_manager.extract_and_update(user_input, session_id=session_id)
+        for entidad in self.context_manager.patterns.keys():
+            if entidad not in entidades:
+                referencia = self.context_manager.resolve_reference(user_input, session_id=session_id)
+                if entidad in referencia:
+                    entidades[entidad] = referencia[entidad]
+        logging.debug(f"Entidades extraídas: {entidades}")
+        return entidades
+
+    def _peek_entities(self, user_input, session_id):
+        """
+        Entidades del mensaje (o referenciadas desde el contexto) sin modificar la sesión.
+        Returns:
+            dict: Contexto de la sesión con las entidades del mensaje, o {} si el mensaje no
+                menciona ninguna.
+        """
+        extraidas = self.context_manager.engine.extract(user_input)
+        if not extraidas and not self.context_manager.resolve_reference(user_input, session_id=session_id):
+            return {}
+        entidades = self.context_manager.get_context(session_id)
+        entidades.update(extraidas)
+        return entidades
+
+    def _start_prefetch(self, user_input, allowed_agents, session_id):
+        """
+        Lanza en segundo plano las herramientas más probables de los agentes candidatos según
+        el router local, para que su resultado esté listo cuando el agente elegido las pida.
+        Solo se precargan herramientas de agentes permitidos para el rol, y nada si el agente
+        más probable no lo está (como en `select_agent_name`, decidirá el router LLM).
+        Returns:
+            list: Precargas lanzadas (para anotar después si se aprovecharon).
+        """
+        if self.prefetcher is None:
+            return []
+        entidades = self._peek_entities(user_input, session_id)
+        if not entidades:
+            return []
+        allowed = {a.name: a for a in allowed_agents if getattr(a, "tools", None)}
+        # Puntuación contra todos los agentes, igual que la decisión local
+        ranked = [name for name, _ in self.local_router.rank(user_input)]
+        if not ranked or ranked[0] not in allowed:
+            return []
+        candidates = [allowed[name] for name in ranked if name in allowed]
+        planned = self.prefetcher.plan(candidates, user_input, entidades, flight=getattr(candidates[0], "tool_flight", None))
+        by_agent = {}
+        for agent, name, args in planned:
+            by_agent.setdefault(agent, []).append((name, args))
+        for agent, calls in by_agent.items():
+            task = asyncio.create_task(agent.prefetch(calls))
+            # Se guarda la referencia hasta que termina; un fallo de la precarga no afecta a la petición
+            self._prefetch_tasks.add(task)
+            task.add_done_callback(self._prefetch_done)
+        return planned
+
+    def _prefetch_done(self, task):
+        self._prefetch_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning(f"[prefetch] Error en la precarga: {task.exception()!r}")
+
+    def _record_prefetch(self, planned, respuesta):
+        if planned:
+            self.prefetcher.record(planned, respuesta)
+
+    def _general_messages(self, user_input):
+        messages = [
+            {"role": "system", "content": GENERAL_ASSISTANT_PROMPT},
+            {"role": "user", "content": user_input}
+        ]
+        self.prompt_budget.fit("general", messages)
+        return messages
+
+    async def responder(self, user_input: str, user_role: str = "cliente", session_id: str = "default") -> dict:
+        """
+        Procesa la entrada del usuario, selecciona el agente adecuado y retorna la respuesta.
+        Si ningún agente es adecuado, responde usando el modelo general.
+        
+        Args:
+            user_input (str): Entrada del usuario.
+            user_role (str, opcional): Rol del usuario. Por defecto es 'cliente'.
+            session_id (str, opcional): Identificador de la sesión cuyo contexto de entidades se usa.
+        
+        Returns:
+            dict: Respuesta generada por el agente o el modelo general.
+        """
+        allowed_agents = self.get_allowed_agents(user_role)
+        planned = self._start_prefetch(user_input, allowed_agents, session_id)
+        respuesta = None
+        try:
+            with tracer.span("route"):
+                agent_name = await self.select_agent_name(user_input, allowed_agents)
+            agente_obj = self._find_allowed_agent(agent_name, allowed_agents)
+            if agente_obj is not None:
+                with tracer.span("entities"):
+                    entidades = self._resolve_entities(user_input, session_id)
+                try:
+                    with tracer.span("agent", agent=agente_obj.name):
+                        respuesta = await self.route(user_input, entidades, agent_name=agente_obj.name, allowed_agents=allowed_agents)
+                    log_payload("agent_response", respuesta, f"[responder] Respuesta del agente '{agente_obj.name}'", agent=agente_obj.name)
+                except LLMOverloaded:
+                    # Saturación: la decide el servidor (503 con Retry-After), no es un error del agente
+                    raise
+                except Exception as e:
+                    logging.exception("Error en la coordinación de agentes")
+                    return {"type": "error", "error": str(e)}
+                return respuesta
+            else:
+                logging.debug(f"[responder] No se encontró agente válido para '{agent_name}', usando asistente general.")
+                messages = self._general_messages(user_input)
+                with tracer.span("general_llm"):
+                    resp = await self.client.chat.completions.create(model=GROQ_MODEL, messages=messages)
+                self.prompt_budget.record_usage("general", getattr(resp, "usage", None))
+                return {"type": "chat", "response": resp.choices[0].message.content}
+        finally:
+            self._record_prefetch(planned, respuesta)
+
+
+    async def responder_stream(self, user_input: str, user_role: str = "cliente", session_id: str = "default"):
+        """
+        Variante en streaming de `responder`. Genera eventos {"event", "data"}: "route" con el
+        agente elegido, los eventos del agente ("tool", "token") y un "done" final con la misma
+        respuesta que devolvería `responder`.
+        
+        Args:
+            user_input (str): Entrada del usuario.
+            user_role (str, opcional): Rol del usuario. Por defecto es 'cliente'.
+            session_id (str, opcional): Identificador de la sesión cuyo contexto de entidades se usa.
+        """
+        allowed_agents = self.get_allowed_agents(user_role)
+        planned = self._start_prefetch(user_input, allowed_agents, session_id)
+        try:
+            with tracer.span("route"):
+                agent_name = await self.select_agent_name(user_input, allowed_agents)
+        except BaseException:
+            self._record_prefetch(planned, None)
+            raise
+        agente_obj = self._find_allowed_agent(agent_name, allowed_agents)
+        if agente_obj is not None:
+            yield {"event": "route", "data": {"agent": agente_obj.name}}
+            with tracer.span("entities"):
+                entidades = self._resolve_entities(user_input, session_id)
+            respuesta = None
             try:
-                # Buscar el agente real usando el nombre normalizado
-                idx = allowed_names_normalized.index(agent_name_normalized)
-                agente_obj = allowed_agents[idx]
-                respuesta = self.route(user_input, entidades, agent_name=agente_obj.name, allowed_agents=allowed_agents)
-                logging.debug(f"[responder] Respuesta del agente '{agente_obj.name}': {respuesta}")
+                async for event in agente_obj.handle_stream(user_input, entidades, self.context, self.tools_schema):
+                    if event["event"] == "done":
+                        respuesta = event["data"]
+                    yield event
+            except LLMOverloaded:
+                raise
             except Exception as e:
                 logging.exception("Error en la coordinación de agentes")
-                return {"type": "error", "error": str(e)}
-            return respuesta
-        else:
-            logging.debug(f"[responder] No se encontró agente válido para '{agent_name}', usando asistente general.")
-            resp = self.client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": "Eres un chatbot asistente general. Si no puedes ayudar con la petición, responde de forma breve y educada, por ejemplo: 'Lo siento, no tengo acceso a esa información.' o 'No puedo ayudarte con eso.' Da respuestas cortas y claras."},
-                    {"role": "user", "content": user_input}
-                ]
-            )
-            return {"type": "chat", "response": resp.choices[0].message.content}
+                yield {"event": "done", "data": {"type": "error", "error": str(e)}}
+            finally:
+                self._record_prefetch(planned, respuesta)
+            return
+        # El asistente general no usa herramientas: las precargas se han desperdiciado
+        self._record_prefetch(planned, None)
+        logging.debug(f"[responder] No se encontró agente válido para '{agent_name}', usando asistente general.")
+        yield {"event": "route", "data": {"agent": None}}
+        start = time.perf_counter()
+        stream = await self.client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=self._general_messages(user_input),
+            stream=True
+        )
+        content_parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                content_parts.append(chunk.choices[0].delta.content)
+                yield {"event": "token", "data": {"content": chunk.choices[0].delta.content}}
+        # En streaming se mide la generación completa, incluido el tiempo en que el cliente consume los eventos
+        tracer.observe("general_llm", time.perf_counter() - start)
+        yield {"event": "done", "data": {"type": "chat", "response": "".join(content_parts)}}
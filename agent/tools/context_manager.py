@@ -1,90 +1,97 @@
-import json
-import re
-from pathlib import Path
+from agent.tools.entity_engine import EntityEngine
+from agent.tools.session_store import SessionStore
+from agent.tools.local_router import fold_text
+
+DEFAULT_SESSION = "default"
 
 class ContextManager:
     """
     Clase para la gestión de contexto y extracción de entidades en las conversaciones.
     Permite cargar patrones y referencias, extraer entidades del texto y resolver referencias contextuales.
+    El contexto se guarda por sesión en un SessionStore, de modo que las entidades de un usuario
+    nunca se mezclan con las de otro.
     """
-    def __init__(self, patterns_path, reference_map_path=None):
+    def __init__(self, patterns_path, reference_map_path=None, session_store=None, entity_engine=None):
         """
-        Inicializa el gestor de contexto cargando patrones y referencias desde archivos JSON.
+        Inicializa el gestor de contexto con el motor de entidades que compila patrones y referencias.
         
         Args:
             patterns_path (str): Ruta al archivo de patrones de entidades.
             reference_map_path (str, opcional): Ruta al archivo de referencias contextuales.
+            session_store (SessionStore, opcional): Almacén de contextos por sesión.
+            entity_engine (EntityEngine, opcional): Motor de entidades compartido; si no se indica
+                se crea uno a partir de las rutas anteriores.
         """
-        self.patterns = self._load_patterns(patterns_path)
-        self.context = {}
-        self.reference_map = self._load_reference_map(reference_map_path) if reference_map_path else {}
+        self.engine = entity_engine if entity_engine is not None else EntityEngine(patterns_path, reference_map_path)
+        self.sessions = session_store if session_store is not None else SessionStore()
 
-    def _load_patterns(self, path):
+    @property
+    def patterns(self):
         """
-        Carga los patrones de entidades desde un archivo JSON.
-        Args:
-            path (str): Ruta al archivo de patrones.
-        Returns:
-            dict: Diccionario de patrones de entidades.
+        dict: Patrones de entidades actualmente cargados.
         """
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return self.engine.patterns
 
-    def _load_reference_map(self, path):
+    def extract_and_update(self, text, session_id=DEFAULT_SESSION):
         """
-        Carga el mapa de referencias desde un archivo JSON.
+        Extrae entidades usando los patrones y actualiza el contexto de la sesión.
         Args:
-            path (str): Ruta al archivo de referencias.
+            text (str): Texto de entrada del usuario.
+            session_id (str, opcional): Identificador de la sesión.
         Returns:
-            dict: Diccionario de referencias.
+            dict: Contexto actualizado con las entidades extraídas.
         """
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        context = self.sessions.get(session_id)
+        context.update(self.engine.extract(text))
+        return context.copy()
 
-    def extract_and_update(self, text):
+    def normalize_query(self, text):
         """
-        Extrae entidades usando los patrones y actualiza el contexto.
+        Normaliza una consulta para usarla como clave de caché: sustituye las entidades
+        detectadas por su tipo (p.ej. <dni>), pasa a minúsculas, quita acentos y espacios sobrantes.
         Args:
             text (str): Texto de entrada del usuario.
         Returns:
-            dict: Contexto actualizado con las entidades extraídas.
+            str: Consulta normalizada.
         """
-        for entity, pattern in self.patterns.items():
-            match = re.search(pattern, text)
-            if match:
-                self.context[entity] = match.group()
-        return self.context.copy()
+        return " ".join(fold_text(self.engine.mask(text)).split())
 
-    def resolve_reference(self, text):
+    def resolve_reference(self, text, session_id=DEFAULT_SESSION):
         """
         Resuelve referencias usando patrones regex del reference_map.
         Args:
             text (str): Texto de entrada del usuario.
+            session_id (str, opcional): Identificador de la sesión.
         Returns:
             dict: Entidad referenciada encontrada en el contexto, si existe.
         """
-        for ref_pattern, entity in self.reference_map.items():
-            if re.search(ref_pattern, text, re.IGNORECASE) and entity in self.context:
-                return {entity: self.context[entity]}
-        return {}
+        context = self.sessions.get(session_id, create=False)
+        if not context:
+            return {}
+        return self.engine.resolve_reference(text, context)
 
-    def get_context(self):
+    def get_context(self, session_id=DEFAULT_SESSION):
         """
-        Retorna una copia del contexto actual.
+        Retorna una copia del contexto de la sesión.
+        Args:
+            session_id (str, opcional): Identificador de la sesión.
         Returns:
             dict: Contexto actual.
         """
-        return self.context.copy()
+        context = self.sessions.get(session_id, create=False)
+        return context.copy() if context else {}
 
-    def clear_context(self):
+    def clear_context(self, session_id=DEFAULT_SESSION):
         """
-        Limpia el contexto almacenado.
+        Limpia el contexto almacenado de la sesión.
+        Args:
+            session_id (str, opcional): Identificador de la sesión.
         """
-        self.context.clear()
+        self.sessions.pop(session_id)
 
 # Ejemplo de uso:
 # patterns_path = 'config/entity_patterns.json'
 # reference_map_path = 'config/reference_map.json'
 # cm = ContextManager(patterns_path, reference_map_path)
-# cm.extract_and_update('facturas dni 12345678A')
-# cm.resolve_reference('todos los datos de este abonado')
+# cm.extract_and_update('facturas dni 12345678A', session_id='abc')
+# cm.resolve_reference('todos los datos de este abonado', session_id='abc')
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "config")
+PATTERNS_PATH = os.path.join(CONFIG_DIR, "entity_patterns.json")
+REFERENCE_MAP_PATH = os.path.join(CONFIG_DIR, "reference_map.json")
+
+class CompiledEntities:
+    """
+    Conjunto inmutable de patrones compilados a partir de entity_patterns.json y reference_map.json.
+    """
+    def __init__(self, patterns, reference_map):
+        self.patterns = dict(patterns)
+        self.validators = {entity: re.compile(pattern) for entity, pattern in patterns.items()}
+        # Una sola alternancia con un grupo con nombre por entidad: un único recorrido del texto
+        combined = "|".join(f"(?P<{entity}>{pattern})" for entity, pattern in patterns.items())
+        self.scanner = re.compile(combined) if combined else None
+        self.references = [(re.compile(ref, re.IGNORECASE), entity) for ref, entity in reference_map.items()]
+
+class EntityEngine:
+    """
+    Motor de extracción de entidades compartido por todo el agente. Compila una vez los patrones
+    y el mapa de referencias, extrae todas las entidades en un solo recorrido del texto y recarga
+    los ficheros cuando cambia su mtime, sustituyendo de forma atómica el conjunto compilado.
+    """
+    def __init__(self, patterns_path=PATTERNS_PATH, reference_map_path=REFERENCE_MAP_PATH, check_interval=2.0):
+        """
+        Args:
+            patterns_path (str): Ruta a entity_patterns.json.
+            reference_map_path (str, opcional): Ruta a reference_map.json.
+            check_interval (float, opcional): Segundos mínimos entre comprobaciones de mtime.
+        """
+        self.patterns_path = patterns_path
+        self.reference_map_path = reference_map_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._next_check = 0.0
+        self._compiled = None
+        self.reload()
+
+    def _read_mtimes(self):
+        paths = [p for p in (self.patterns_path, self.reference_map_path) if p]
+        return tuple(os.stat(p).st_mtime_ns for p in paths)
+
+    def reload(self):
+        """
+        Lee y compila de nuevo los ficheros de patrones y referencias.
+        """
+        with self._lock:
+            mtimes = self._read_mtimes()
+            with open(self.patterns_path, "r", encoding="utf-8") as f:
+                patterns = json.load(f)
+            reference_map = {}
+            if self.reference_map_path:
+                with open(self.reference_map_path, "r", encoding="utf-8") as f:
+                    reference_map = json.load(f)
+            self._compiled = CompiledEntities(patterns, reference_map)
+            self._mtimes = mtimes
+
+    def _current(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            try:
+                if self._read_mtimes() != self._mtimes:
+                    logging.info("[entity_engine] Patrones modificados, recargando")
+                    self.reload()
+            except Exception:
+                # Si el fichero está a medio escribir o es inválido se sigue con el conjunto anterior
+                logging.exception("[entity_engine] Error recargando patrones")
+        return self._compiled
+
+    @property
+    def patterns(self):
+        """
+        dict: Patrones de entidad (sin compilar) actualmente en uso.
+        """
+        return self._current().patterns
+
+    def extract(self, text):
+        """
+        Extrae la primera aparición de cada tipo de entidad en un único recorrido del texto.
+        Args:
+            text (str): Texto de entrada.
+        Returns:
+            dict: Entidad -> valor encontrado, p.ej. {"dni": "12345678A"}.
+        """
+        compiled = self._current()
+        found = {}
+        if compiled.scanner is None:
+            return found
+        pending = len(compiled.patterns)
+        for match in compiled.scanner.finditer(text):
+            entity = match.lastgroup
+            if entity not in found:
+                found[entity] = match.group(entity)
+                pending -= 1
+                if not pending:
+                    break
+        return found
+
+    def extract_many(self, texts):
+        """
+        Extrae entidades de varios textos con el mismo conjunto compilado.
+        Args:
+            texts (iterable): Textos de entrada.
+        Returns:
+            list: Un dict de entidades por texto, en el mismo orden.
+        """
+        return [self.extract(text) for text in texts]
+
+    def mask(self, text):
+        """
+        Sustituye cada entidad encontrada por su tipo, p.ej. "dni 12345678A" -> "dni <dni>".
+        """
+        compiled = self._current()
+        if compiled.scanner is None:
+            return text
+        return compiled.scanner.sub(lambda m: f"<{m.lastgroup}>", text)
+
+    def validate(self, entity, value):
+        """
+        Comprueba si un valor cumple por completo el patrón de su entidad.
+        Args:
+            entity (str): Tipo de entidad (nombre del argumento).
+            value: Valor a validar.
+        Returns:
+            bool: True si cumple el patrón o si la entidad no tiene patrón.
+        """
+        validator = self._current().validators.get(entity)
+        return validator is None or validator.fullmatch(str(value)) is not None
+
+    def resolve_reference(self, text, context):
+        """
+        Resuelve referencias como "este abonado" contra las entidades de un contexto.
+        Args:
+            text (str): Texto de entrada.
+            context (dict): Entidades conocidas de la conversación.
+        Returns:
+            dict: Entidad referenciada encontrada en el contexto, si existe.
+        """
+        for ref_pattern, entity in self._current().references:
+            if entity in context and ref_pattern.search(text):
+                return {entity: context[entity]}
+        return {}
+
+_default_engine = None
+_default_lock = threading.Lock()
+
+def get_entity_engine():
+    """
+    Devuelve el motor de entidades compartido, creado a partir de la configuración del paquete.
+    """
+    global _default_engine
+    if _default_engine is None:
+        with _default_lock:
+            if _default_engine is None:
+                _default_engine = EntityEngine()
+    return _default_engine
@@ -0,0 +1,55 @@
+import json
+import os
+from config.config import ERROR_LOCALE
+
+ERROR_MESSAGES_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "config", "error_messages.json")
+
+class _Fields(dict):
+    # Deja intactos los marcadores que una plantilla use pero no estén definidos
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+class ErrorCatalog:
+    """
+    Catálogo local de mensajes de error de formato, por idioma, tipo de entidad y herramienta.
+    Sustituye a la llamada al modelo cuando un argumento no cumple su patrón.
+    """
+    def __init__(self, path=ERROR_MESSAGES_PATH, locale=ERROR_LOCALE):
+        """
+        Args:
+            path (str): Ruta a error_messages.json.
+            locale (str): Idioma por defecto de los mensajes.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            self.catalog = json.load(f)
+        self.locale = locale
+
+    def render(self, tool, errors, locale=None):
+        """
+        Construye el mensaje para los argumentos que no cumplen su patrón.
+        Args:
+            tool (str): Herramienta que se intentó usar.
+            errors (list): Pares (entidad/argumento, valor) inválidos.
+            locale (str, opcional): Idioma; por defecto el del catálogo.
+        Returns:
+            str: Mensaje para el usuario.
+        """
+        messages = self.catalog.get(locale or self.locale) or self.catalog[self.locale]
+        tool_templates = messages.get("tools", {}).get(tool, {})
+        parts = []
+        for campo, valor in errors:
+            entity = messages.get("entities", {}).get(campo, {})
+            template = tool_templates.get(campo) or entity.get("mensaje") or messages["default"]
+            parts.append(template.format_map(_Fields(entity, campo=campo, valor=valor)))
+        return " ".join(parts)
+
+_default_catalog = None
+
+def get_error_catalog():
+    """
+    Devuelve el catálogo de errores compartido.
+    """
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = ErrorCatalog()
+    return _default_catalog
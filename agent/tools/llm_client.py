@@ -0,0 +1,78 @@
+import os
+import threading
+import httpx
+from groq import AsyncGroq
+from agent.tools.llm_scheduler import ScheduledLLMClient, get_llm_scheduler
+from config.config import (
+    GROQ_API_KEY, GROQ_BASE_URL, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE,
+    LLM_HTTP_TIMEOUT_SECONDS, LLM_HTTP_CONNECT_TIMEOUT_SECONDS, LLM_MAX_RETRIES
+)
+
+class SharedLLMClient:
+    """
+    Cliente de Groq compartido por el orquestador y todos los agentes, con un único pool de
+    conexiones keep-alive. Expone la misma interfaz que `AsyncGroq` (`client.chat.completions`).
+
+    El `AsyncGroq` real se crea al primer uso y se vuelve a crear si el proceso cambia, de modo
+    que puede construirse antes de un fork (gunicorn --preload) sin compartir sockets entre workers.
+    """
+    def __init__(self, api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL, max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                 max_keepalive=LLM_HTTP_MAX_KEEPALIVE, timeout=LLM_HTTP_TIMEOUT_SECONDS,
+                 connect_timeout=LLM_HTTP_CONNECT_TIMEOUT_SECONDS, max_retries=LLM_MAX_RETRIES):
+        """
+        Args:
+            api_key (str): Clave de la API de Groq.
+            base_url (str, opcional): URL base de la API; por defecto la de Groq.
+            max_connections (int): Conexiones simultáneas máximas del pool.
+            max_keepalive (int): Conexiones ociosas que se mantienen abiertas.
+            timeout (float): Timeout de lectura/escritura en segundos.
+            connect_timeout (float): Timeout de conexión en segundos.
+            max_retries (int): Reintentos del SDK ante errores transitorios.
+        """
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    self._client = AsyncGroq(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=self.max_retries,
+                        timeout=self.timeout,
+                        http_client=httpx.AsyncClient(limits=self.limits, timeout=self.timeout),
+                    )
+                    self._pid = pid
+        return self._client
+
+    @property
+    def chat(self):
+        return self._get_client().chat
+
+    async def close(self):
+        if self._client is not None and self._pid == os.getpid():
+            await self._client.close()
+        self._client = None
+
+_default_client = None
+_default_lock = threading.Lock()
+
+def get_llm_client():
+    """
+    Devuelve el cliente de Groq compartido del proceso (se crea la primera vez). Sus llamadas
+    pasan por el planificador compartido (concurrencia, cuotas y reintentos; ver llm_scheduler).
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = ScheduledLLMClient(SharedLLMClient(), get_llm_scheduler())
+    return _default_client
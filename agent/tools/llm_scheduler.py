@@ -0,0 +1,373 @@
+"""
+Planificador de llamadas a Groq compartido por el orquestador y los agentes.
+
+- Límite de llamadas simultáneas por modelo; las que no caben esperan en una cola con dos
+  carriles: "interactive" (usuarios) pasa siempre delante de "batch" (pruebas, tareas en lote).
+- Cubos de tokens por modelo para peticiones y tokens por minuto (las cuotas de Groq).
+- Reintentos con backoff exponencial y jitter ante 429, timeouts y errores 5xx, respetando
+  `retry-after`; un 429 pausa al resto de llamadas a ese modelo durante ese tiempo.
+- Rechazo inmediato (`LLMOverloaded`) cuando la cola de un carril está llena, la espera en
+  cola supera LLM_QUEUE_TIMEOUT_SECONDS o la cuota no se liberaría a tiempo.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import groq
+from config.config import (
+    LLM_MODEL_LIMITS, LLM_DEFAULT_CONCURRENCY, LLM_DEFAULT_RPM, LLM_DEFAULT_TPM, LLM_QUEUE_LIMIT_INTERACTIVE,
+    LLM_QUEUE_LIMIT_BATCH, LLM_QUEUE_TIMEOUT_SECONDS, LLM_MAX_ATTEMPTS, LLM_BACKOFF_BASE_SECONDS,
+    LLM_BACKOFF_MAX_SECONDS, LLM_MAX_RATE_WAIT_SECONDS
+)
+from agent.tools.prompt_budget import count_prompt_tokens
+from telemetry.metrics import registry
+
+# Carriles de prioridad: menor valor, antes sale de la cola
+LANES = {"interactive": 0, "batch": 1}
+DEFAULT_COMPLETION_TOKENS = 512
+_RETRYABLE = (groq.RateLimitError, groq.APITimeoutError, groq.APIConnectionError, groq.InternalServerError)
+_current_lane = ContextVar("llm_lane", default="interactive")
+
+queue_wait = registry.histogram("llm_queue_wait_seconds", "Espera en cola antes de llamar al modelo", ("model", "lane"))
+retries = registry.counter("llm_retries_total", "Reintentos de llamadas al modelo por motivo", ("model", "reason"))
+shed = registry.counter("llm_shed_total", "Llamadas al modelo rechazadas por saturación", ("model", "lane", "reason"))
+
+class LLMOverloaded(Exception):
+    """
+    La llamada se rechaza porque el servicio está saturado: sin enviarla a Groq (cola llena,
+    cuota agotada) o tras agotar los reintentos ante 429, timeouts o errores transitorios.
+    """
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@contextmanager
+def llm_lane(lane):
+    """
+    Las llamadas al modelo hechas dentro del bloque usan el carril indicado ("interactive" o "batch").
+    """
+    if lane not in LANES:
+        raise ValueError(f"Carril desconocido: {lane}")
+    token = _current_lane.set(lane)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+def current_lane():
+    return _current_lane.get()
+
+class TokenBucket:
+    """
+    Cubo de tokens con reservas: una reserva siempre se concede y devuelve cuánto hay que
+    esperar hasta que los tokens estén disponibles (el saldo puede quedar negativo).
+    """
+    def __init__(self, per_minute, capacity=None):
+        """
+        Args:
+            per_minute (float): Tokens repuestos por minuto (0 = sin límite).
+            capacity (float, opcional): Ráfaga máxima; por defecto lo repuesto en un minuto.
+        """
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now=None):
+        """
+        Returns:
+            float: Segundos hasta que la reserva está cubierta (0 si ya lo está).
+        """
+        if not self.rate:
+            return 0.0
+        self._refill(time.monotonic() if now is None else now)
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+class _ModelState:
+    """
+    Huecos de concurrencia, cola por prioridad y cuotas de un modelo.
+    """
+    def __init__(self, model, concurrency, rpm, tpm):
+        self.model = model
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.waiters = []
+        self.queued = {lane: 0 for lane in LANES}
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self._seq = itertools.count()
+
+    async def acquire(self, lane, queue_limit, timeout):
+        if self.in_flight < self.concurrency and not self.waiters:
+            self.in_flight += 1
+            return
+        if self.queued[lane] >= queue_limit:
+            shed.inc(model=self.model, lane=lane, reason="queue_full")
+            raise LLMOverloaded(f"Cola de {self.model} llena ({lane})", retry_after=1)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (LANES[lane], next(self._seq), future))
+        self.queued[lane] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # El hueco llegó a la vez que el timeout o la cancelación: se devuelve
+                self.release()
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                shed.inc(model=self.model, lane=lane, reason="queue_timeout")
+                raise LLMOverloaded(f"Tiempo de espera en cola de {self.model} agotado ({lane})", retry_after=timeout) from None
+            raise
+        finally:
+            self.queued[lane] -= 1
+
+    def release(self):
+        self.in_flight -= 1
+        while self.waiters and self.in_flight < self.concurrency:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": dict(self.queued),
+            "blocked_for_s": round(max(0.0, self.blocked_until - time.monotonic()), 3),
+        }
+
+class _SlotStream:
+    """
+    Stream de la respuesta que devuelve su hueco de concurrencia una sola vez: al agotarse o
+    fallar, con `aclose()` o, si nunca se itera ni se cierra, al recolectarse.
+    """
+    def __init__(self, stream, state):
+        self._stream = stream
+        self._iterator = None
+        self._state = state
+        self._released = False
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            self._state.release()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._released:
+            raise StopAsyncIteration
+        if self._iterator is None:
+            self._iterator = self._stream.__aiter__()
+        try:
+            return await self._iterator.__anext__()
+        except BaseException:
+            self._release()
+            raise
+
+    async def aclose(self):
+        self._release()
+        close = getattr(self._stream, "aclose", None) or getattr(self._stream, "close", None)
+        if close is not None:
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+
+    def __del__(self):
+        self._release()
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value:
+            try:
+                return float(value) * scale
+            except ValueError:
+                pass
+    return None
+
+class LLMScheduler:
+    """
+    Admisión, cuotas y reintentos de las llamadas a chat completions (ver el docstring del módulo).
+    """
+    def __init__(self, model_limits=None, default_concurrency=LLM_DEFAULT_CONCURRENCY, default_rpm=LLM_DEFAULT_RPM,
+                 default_tpm=LLM_DEFAULT_TPM, queue_limits=None, queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS,
+                 max_attempts=LLM_MAX_ATTEMPTS, backoff_base=LLM_BACKOFF_BASE_SECONDS,
+                 backoff_max=LLM_BACKOFF_MAX_SECONDS, max_rate_wait=LLM_MAX_RATE_WAIT_SECONDS):
+        """
+        Args:
+            model_limits (dict, opcional): Modelo -> {"concurrency", "rpm", "tpm"}; por defecto LLM_MODEL_LIMITS.
+            default_concurrency (int): Llamadas simultáneas por modelo sin límite propio.
+            default_rpm (float): Peticiones por minuto por modelo sin límite propio (0 = sin límite).
+            default_tpm (float): Tokens por minuto por modelo sin límite propio (0 = sin límite).
+            queue_limits (dict, opcional): Carril -> llamadas en cola máximas por modelo.
+            queue_timeout (float): Espera máxima en cola antes de rechazar la llamada.
+            max_attempts (int): Intentos por llamada (1 = sin reintentos).
+            backoff_base (float): Espera base del backoff exponencial (segundos).
+            backoff_max (float): Espera máxima entre intentos (segundos).
+            max_rate_wait (float): Espera máxima por cuota; si hace falta más, se rechaza la llamada.
+        """
+        self.model_limits = model_limits if model_limits is not None else json.loads(LLM_MODEL_LIMITS or "{}")
+        self.default_limits = {"concurrency": default_concurrency, "rpm": default_rpm, "tpm": default_tpm}
+        self.queue_limits = queue_limits or {"interactive": LLM_QUEUE_LIMIT_INTERACTIVE, "batch": LLM_QUEUE_LIMIT_BATCH}
+        self.queue_timeout = queue_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_rate_wait = max_rate_wait
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _state(self, model):
+        with self._lock:
+            state = self._models.get(model)
+            if state is None:
+                limits = dict(self.default_limits, **self.model_limits.get(model, {}))
+                state = _ModelState(model, limits["concurrency"], limits["rpm"], limits["tpm"])
+                self._models[model] = state
+            return state
+
+    def _estimate_tokens(self, request):
+        completion = request.get("max_completion_tokens") or request.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+        return count_prompt_tokens(request.get("messages") or [], request.get("tools")) + completion
+
+    async def _admit(self, state, lane, estimate):
+        start = time.monotonic()
+        # La cuota se espera antes de pedir hueco: quien espera por cuota no ocupa un hueco de concurrencia
+        delay = max(state.blocked_until - start, state.requests.reserve(1, start), state.tokens.reserve(estimate, start))
+        if delay > self.max_rate_wait:
+            state.requests.refund(1)
+            state.tokens.refund(estimate)
+            shed.inc(model=state.model, lane=lane, reason="rate_limit")
+            raise LLMOverloaded(f"Cuota de {state.model} agotada", retry_after=delay)
+        try:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await state.acquire(lane, self.queue_limits[lane], self.queue_timeout)
+        except BaseException:
+            # Cancelada o rechazada en cola: la cuota reservada no se llega a usar
+            state.requests.refund(1)
+            state.tokens.refund(estimate)
+            raise
+        queue_wait.observe(time.monotonic() - start, model=state.model, lane=lane)
+
+    def _backoff(self, attempt, retry_after):
+        # Backoff exponencial con jitter completo; nunca menos de lo que pide retry-after
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        return max(delay, retry_after or 0.0)
+
+    async def create(self, client, **request):
+        """
+        Hace una llamada a `client.chat.completions.create` respetando los límites del modelo.
+        Args:
+            client: Cliente con la interfaz de `AsyncGroq`.
+            **request: Argumentos de la llamada (model, messages, tools, stream...).
+        Returns:
+            La respuesta del cliente; con `stream=True`, un iterador asíncrono que mantiene
+            ocupado el hueco de concurrencia hasta que se consume, se cierra o se descarta.
+        """
+        model = request.get("model", "")
+        lane = current_lane()
+        state = self._state(model)
+        estimate = self._estimate_tokens(request)
+        for attempt in range(1, self.max_attempts + 1):
+            await self._admit(state, lane, estimate)
+            try:
+                resp = await client.chat.completions.create(**request)
+            except _RETRYABLE as e:
+                state.release()
+                # Los tokens reservados para el intento fallido no se han consumido
+                state.tokens.refund(estimate)
+                retry_after = _retry_after(e)
+                delay = self._backoff(attempt, retry_after)
+                reason = type(e).__name__
+                if isinstance(e, groq.RateLimitError):
+                    # El resto de llamadas a este modelo también esperan a que pase el límite
+                    state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+                if attempt == self.max_attempts or delay > self.max_rate_wait:
+                    shed.inc(model=model, lane=lane, reason=reason)
+                    raise LLMOverloaded(f"{model} no disponible tras {attempt} intento(s): {reason}", retry_after=delay) from e
+                retries.inc(model=model, reason=reason)
+                logging.warning(f"[llm_scheduler] {reason} en {model}; reintento {attempt}/{self.max_attempts - 1} en {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                state.release()
+                state.tokens.refund(estimate)
+                raise
+            if request.get("stream"):
+                return _SlotStream(resp, state)
+            state.release()
+            usage = getattr(resp, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                # Ajusta la reserva al consumo real
+                state.tokens.refund(estimate - usage.total_tokens)
+            return resp
+
+    def stats(self):
+        """
+        Returns:
+            dict: Por modelo, límite de concurrencia, llamadas en curso, en cola por carril y pausa por 429.
+        """
+        with self._lock:
+            models = dict(self._models)
+        return {model: state.stats() for model, state in models.items()}
+
+class ScheduledLLMClient:
+    """
+    Envuelve un cliente con la interfaz de `AsyncGroq` para que sus llamadas pasen por el planificador.
+    """
+    def __init__(self, client, scheduler):
+        self.client = client
+        self.scheduler = scheduler
+        self.chat = _ScheduledChat(self)
+
+    async def close(self):
+        if hasattr(self.client, "close"):
+            await self.client.close()
+
+class _ScheduledChat:
+    def __init__(self, owner):
+        self.completions = _ScheduledCompletions(owner)
+
+class _ScheduledCompletions:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def create(self, **request):
+        return await self._owner.scheduler.create(self._owner.client, **request)
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_llm_scheduler():
+    """
+    Devuelve el planificador compartido del proceso (se crea la primera vez).
+    """
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = LLMScheduler()
+    return _default_scheduler
@@ -0,0 +1,151 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+STOPWORDS = {
+    "que", "cual", "cuales", "como", "cuando", "donde", "del", "las", "los", "una", "uno",
+    "por", "para", "con", "puedes", "puede", "decirme", "dame", "hay", "esta", "este",
+    "esa", "ese", "mis", "sus", "tiene", "todas", "todos", "usuario", "respuesta",
+}
+STEM_LENGTH = 5
+EXAMPLE_PATTERN = re.compile(r"Usuario:\s*(.+?)\s*\n\s*Respuesta:\s*(\S+)")
+
+def fold_text(text):
+    """
+    Normaliza un texto a minúsculas y sin acentos.
+    Args:
+        text (str): Texto original.
+    Returns:
+        str: Texto normalizado.
+    """
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def extract_features(text):
+    """
+    Obtiene los términos (raíces y bigramas de raíces) usados para clasificar un texto.
+    Se descartan stopwords, palabras cortas y tokens con dígitos (DNI, teléfonos, ...).
+    Args:
+        text (str): Texto de entrada.
+    Returns:
+        list: Lista de términos.
+    """
+    tokens = re.findall(r"\w+", fold_text(text).replace("_", " "))
+    stems = [t[:STEM_LENGTH] for t in tokens if len(t) > 2 and t not in STOPWORDS and not any(c.isdigit() for c in t)]
+    return stems + [f"{a} {b}" for a, b in zip(stems, stems[1:])]
+
+class LocalRouter:
+    """
+    Clasificador local de consultas por agente basado en términos ponderados (TF-IDF).
+    Se entrena con los ejemplos del prompt del router_agent y con las herramientas y
+    la especialización de cada agente, y devuelve el agente más probable junto a una
+    confianza entre 0 y 1.
+    """
+    def __init__(self, smoothing=1.0):
+        """
+        Inicializa un clasificador vacío.
+        Args:
+            smoothing (float, opcional): Peso añadido al denominador de la confianza para que
+                coincidencias débiles no den confianza alta.
+        """
+        self.smoothing = smoothing
+        self.weights = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_agents(cls, agents, router_agent=None, **kwargs):
+        """
+        Construye y entrena el clasificador a partir de la configuración de agentes.
+        Args:
+            agents (list): Agentes candidatos (AgentBase).
+            router_agent (AgentBase, opcional): Agente router cuyo prompt contiene ejemplos.
+        Returns:
+            LocalRouter: Clasificador entrenado.
+        """
+        router = cls(**kwargs)
+        documents = defaultdict(list)
+        for agent in agents:
+            documents[agent.name].extend(extract_features(agent.specialization) * 2)
+            for tool in agent.tools:
+                documents[agent.name].extend(extract_features(tool))
+        if router_agent is not None:
+            known = set(documents)
+            for example, agent_name in EXAMPLE_PATTERN.findall(router_agent.system_prompt):
+                if agent_name in known:
+                    documents[agent_name].extend(extract_features(example))
+        router.train(documents)
+        return router
+
+    def train(self, documents):
+        """
+        Calcula los pesos TF-IDF de cada término por agente.
+        Args:
+            documents (dict): Nombre de agente -> lista de términos de entrenamiento.
+        """
+        counts = {name: Counter(terms) for name, terms in documents.items()}
+        document_frequency = Counter(term for c in counts.values() for term in c)
+        total = len(counts)
+        self.weights = {
+            name: {term: (1 + math.log(tf)) * math.log(total / document_frequency[term]) for term, tf in c.items()}
+            for name, c in counts.items()
+        }
+
+    def classify(self, text, candidates=None):
+        """
+        Clasifica una consulta.
+        Args:
+            text (str): Consulta del usuario.
+            candidates (iterable, opcional): Nombres de agentes entre los que elegir.
+        Returns:
+            tuple: (nombre del agente o None, confianza entre 0 y 1).
+        """
+        scores = self.rank(text, candidates)
+        if not scores:
+            return None, 0.0
+        top = scores[0][1]
+        second = scores[1][1] if len(scores) > 1 else 0.0
+        return scores[0][0], top / (top + second + self.smoothing)
+
+    def rank(self, text, candidates=None):
+        """
+        Puntúa la consulta contra cada agente.
+        Args:
+            text (str): Consulta del usuario.
+            candidates (iterable, opcional): Nombres de agentes entre los que elegir.
+        Returns:
+            list: (nombre, puntuación) de los agentes con puntuación positiva, de mayor a menor.
+        """
+        features = extract_features(text)
+        names = [n for n in self.weights if candidates is None or n in candidates]
+        scores = sorted(((sum(self.weights[n].get(f, 0.0) for f in features), n) for n in names), reverse=True)
+        return [(n, score) for score, n in scores if score > 0]
+
+    def decide(self, text, threshold, allowed=None):
+        """
+        Devuelve el agente si la confianza supera el umbral, actualizando los contadores.
+        La confianza se calcula siempre contra todos los agentes: si el ganador no está entre
+        los permitidos no se elige otro, se delega en el router LLM.
+        Args:
+            text (str): Consulta del usuario.
+            threshold (float): Confianza mínima para evitar la llamada al router LLM.
+            allowed (iterable, opcional): Nombres de agentes que se pueden devolver.
+        Returns:
+            str | None: Nombre del agente, o None si hay que consultar al router LLM.
+        """
+        agent_name, confidence = self.classify(text)
+        if agent_name is not None and confidence >= threshold and (allowed is None or agent_name in allowed):
+            self.hits += 1
+            return agent_name
+        self.misses += 1
+        return None
+
+    def stats(self):
+        """
+        Retorna los contadores de decisiones locales y llamadas delegadas al LLM.
+        Returns:
+            dict: Aciertos (llamadas LLM evitadas), fallos y ratio de aciertos.
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Caché clave-valor con capacidad acotada, expulsión LRU y caducidad (TTL) por entrada.
+    Todas las operaciones son O(1) y seguras entre hilos.
+    """
+    def __init__(self, capacity=1024, ttl_seconds=300, clock=time.monotonic):
+        """
+        Inicializa la caché.
+
+        Args:
+            capacity (int): Número máximo de entradas.
+            ttl_seconds (float): Segundos de vida por defecto de cada entrada (None = sin caducidad).
+            clock (callable, opcional): Reloj monotónico.
+        """
+        if capacity <= 0:
+            raise ValueError("capacity debe ser mayor que 0")
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        """
+        Devuelve el valor asociado a la clave si existe y no ha caducado.
+
+        Args:
+            key (hashable): Clave buscada.
+            default (opcional): Valor devuelto en caso de fallo.
+
+        Returns:
+            Valor almacenado o `default`.
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl_seconds=None):
+        """
+        Guarda un valor, expulsando la entrada usada hace más tiempo si la caché está llena.
+
+        Args:
+            key (hashable): Clave.
+            value: Valor a guardar.
+            ttl_seconds (float, opcional): TTL específico de esta entrada.
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = self._clock() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """
+        Elimina una entrada concreta.
+
+        Args:
+            key (hashable): Clave a invalidar.
+        """
+        with self._lock:
+            if self._entries.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def clear(self):
+        """
+        Vacía la caché.
+        """
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def keys(self):
+        """
+        Retorna una instantánea de las claves actuales.
+        """
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Retorna estadísticas de uso de la caché.
+
+        Returns:
+            dict: Tamaño, capacidad, aciertos, fallos, ratio de aciertos, expulsiones e invalidaciones.
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
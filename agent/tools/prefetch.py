@@ -0,0 +1,154 @@
+import random
+import threading
+from collections import deque
+from agent.tools.tool_cache import canonical_args
+from config.config import TOOL_RESULT_MAX_ROWS, PREFETCH_TOP_AGENTS, PREFETCH_MAX_TOOLS, PREFETCH_WASTE_BUDGET, PREFETCH_WINDOW, PREFETCH_PROBE_RATE
+from telemetry.metrics import registry
+
+prefetch_outcomes = registry.counter("agent_prefetch_total", "Precargas de herramientas por resultado", ("tool", "outcome"))
+
+class ToolPrefetcher:
+    """
+    Precarga especulativa de herramientas mientras se decide el agente: con las entidades ya
+    detectadas en el mensaje (DNI, póliza...) se ejecutan las herramientas de solo lectura más
+    probables de los agentes candidatos, de modo que cuando el modelo las pida el resultado ya
+    está en la caché o en curso.
+
+    Cada precarga se marca como acierto si el agente acaba llamando a esa herramienta con esos
+    argumentos, o como desperdicio si no. Una herramienta cuyo desperdicio en las últimas
+    `window` precargas supera `waste_budget` deja de precargarse (salvo una fracción
+    `probe_rate` de sondeo, para detectar si vuelve a acertar).
+    """
+    def __init__(self, tool_registry, tool_cache, entity_engine, prompt_budget=None, top_agents=PREFETCH_TOP_AGENTS,
+                 max_tools=PREFETCH_MAX_TOOLS, waste_budget=PREFETCH_WASTE_BUDGET, window=PREFETCH_WINDOW,
+                 probe_rate=PREFETCH_PROBE_RATE, seed=None):
+        """
+        Args:
+            tool_registry (ToolRegistry): Registro de herramientas (esquemas y metadata).
+            tool_cache (ToolResultCache): Caché donde quedan los resultados precargados.
+            entity_engine (EntityEngine): Motor de entidades, para validar los argumentos.
+            prompt_budget (PromptBudget, opcional): Ordena las herramientas por relevancia.
+            top_agents (int): Agentes candidatos (según el router local) cuyas herramientas se precargan.
+            max_tools (int): Precargas máximas por mensaje.
+            waste_budget (float): Fracción máxima de precargas desperdiciadas por herramienta.
+            window (int): Precargas recientes por herramienta con las que se calcula el desperdicio.
+            probe_rate (float): Fracción de precargas que se hacen aunque se haya superado el presupuesto.
+            seed (int, opcional): Semilla del sondeo.
+        """
+        self.tool_registry = tool_registry
+        self.tool_cache = tool_cache
+        self.entity_engine = entity_engine
+        self.prompt_budget = prompt_budget
+        self.top_agents = top_agents
+        self.max_tools = max_tools
+        self.waste_budget = waste_budget
+        self.window = window
+        self.probe_rate = probe_rate
+        self._random = random.Random(seed)
+        self._history = {}
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "wasted": 0, "skipped_budget": 0, "cached": 0}
+
+    def _allowed(self, name):
+        with self._lock:
+            history = self._history.get(name)
+            if history is None or len(history) < min(10, self.window):
+                return True
+            waste = 1 - sum(history) / len(history)
+        return waste <= self.waste_budget or self._random.random() < self.probe_rate
+
+    def _args_for(self, tool, entidades):
+        # Solo argumentos que salen de entidades detectadas; si falta alguno obligatorio no se precarga
+        params = tool["function"].get("parameters") or {}
+        required = params.get("required", [])
+        if required:
+            if any(r not in entidades for r in required):
+                return None
+            return self._page_args(tool["function"]["name"], {r: entidades[r] for r in required})
+        # Mismo criterio que AgentBase._fill_missing_args: un solo identificador, el preferido
+        alternatives = self.tool_registry.alternatives.get(tool["function"]["name"], ())
+        field = next((f for f in alternatives if entidades.get(f)), None)
+        return {field: entidades[field]} if field is not None else None
+
+    def _page_args(self, name, args):
+        # Mismo tamaño de página que pediría el agente, para que la clave de la llamada coincida
+        return self.tool_registry.with_page_limit(name, args, TOOL_RESULT_MAX_ROWS)
+
+    def plan(self, candidates, user_input, entidades, flight=None):
+        """
+        Elige las llamadas a precargar.
+        Args:
+            candidates (list): Agentes candidatos, del más al menos probable.
+            user_input (str): Entrada del usuario.
+            entidades (dict): Entidades detectadas (sin modificar el contexto de la sesión).
+            flight (SingleFlight, opcional): Llamadas en curso; las que ya lo están no se repiten.
+        Returns:
+            list: (agente, nombre, argumentos) de cada precarga.
+        """
+        if not entidades:
+            return []
+        planned, seen = [], set()
+        for agent in candidates[:self.top_agents]:
+            tools = self.tool_registry.tools_for(agent.name, agent.tools)
+            if self.prompt_budget is not None:
+                tools = self.prompt_budget.relevant_tools(tools, user_input, entidades)
+            for tool in tools:
+                if len(planned) >= self.max_tools:
+                    return planned
+                name = tool["function"]["name"]
+                # Solo herramientas cacheables: las de escritura nunca, las demás no dejarían resultado
+                if not self.tool_cache.ttl_for(name):
+                    continue
+                args = self._args_for(tool, entidades)
+                if args is None or self.tool_registry.validation_error(name, args):
+                    continue
+                if not all(self.entity_engine.validate(k, v) for k, v in args.items()):
+                    continue
+                key = (name, canonical_args(args))
+                if key in seen:
+                    continue
+                seen.add(key)
+                if self.tool_cache.get(name, args) is not None or (flight is not None and flight.running(key)):
+                    self._count(name, "cached")
+                    continue
+                if not self._allowed(name):
+                    self._count(name, "skipped_budget")
+                    continue
+                planned.append((agent, name, args))
+        return planned
+
+    def record(self, planned, respuesta):
+        """
+        Anota qué precargas se han aprovechado comparándolas con las herramientas que ha
+        llamado el agente en la respuesta final.
+        Args:
+            planned (list): Precargas devueltas por `plan`.
+            respuesta (dict | None): Respuesta del orquestador.
+        """
+        used = set()
+        if isinstance(respuesta, dict):
+            for result in respuesta.get("results") or []:
+                if isinstance(result, dict) and isinstance(result.get("params"), dict):
+                    used.add((result.get("tool"), canonical_args(result["params"])))
+        for _, name, args in planned:
+            hit = (name, canonical_args(args)) in used
+            self._count(name, "hits" if hit else "wasted")
+            with self._lock:
+                self._history.setdefault(name, deque(maxlen=self.window)).append(hit)
+
+    def _count(self, name, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+        prefetch_outcomes.inc(tool=name, outcome=outcome)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Aciertos, desperdicios, omitidas por presupuesto o ya en caché, ratio de
+                aciertos y desperdicio reciente por herramienta.
+        """
+        with self._lock:
+            counts = dict(self.counts)
+            recent = {name: round(1 - sum(h) / len(h), 4) for name, h in self._history.items() if h}
+        done = counts["hits"] + counts["wasted"]
+        return dict(counts, hit_rate=round(counts["hits"] / done, 4) if done else 0.0, recent_waste=recent)
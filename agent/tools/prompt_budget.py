@@ -0,0 +1,214 @@
+import json
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from agent.tools.local_router import EXAMPLE_PATTERN, extract_features
+from telemetry.metrics import registry
+
+llm_tokens = registry.counter("agent_llm_tokens_total", "Tokens informados por la API de Groq", ("stage", "kind"))
+
+# Palabras, números y signos sueltos: aproximación al número de tokens BPE sin cargar el tokenizador
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Tokens extra por mensaje (rol y separadores de la plantilla de chat)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+class PromptBudgetExceeded(Exception):
+    """
+    El prompt de una llamada supera el máximo de tokens configurado incluso tras recortarlo.
+    """
+
+def count_tokens(text):
+    """
+    Estima el número de tokens de un texto. Cada palabra cuenta un token por cada 4 caracteres
+    (las palabras largas se trocean en varios tokens) y cada signo de puntuación cuenta uno.
+    Args:
+        text (str): Texto a medir.
+    Returns:
+        int: Tokens estimados.
+    """
+    if not text:
+        return 0
+    return sum(math.ceil(len(t) / 4) for t in _TOKEN_PATTERN.findall(text))
+
+def count_prompt_tokens(messages, tools=None):
+    """
+    Estima los tokens de entrada de una llamada de chat: mensajes más definiciones de herramientas.
+    Args:
+        messages (list): Mensajes {"role", "content"}.
+        tools (list, opcional): Herramientas enviadas al modelo.
+    Returns:
+        int: Tokens estimados.
+    """
+    total = sum(count_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    if tools:
+        total += count_tokens(json.dumps(tools, ensure_ascii=False, separators=(",", ":")))
+    return total
+
+def build_compact_router_prompt(router_prompt, agents, examples_per_agent=1):
+    """
+    Construye una versión reducida del prompt del router: la lista de agentes con sus herramientas
+    y solo `examples_per_agent` ejemplos de cada uno, en lugar de todos los ejemplos del prompt.
+    Args:
+        router_prompt (str): Prompt completo del router_agent (agents_config.json).
+        agents (list): Agentes candidatos (AgentBase).
+        examples_per_agent (int, opcional): Ejemplos que se conservan por agente.
+    Returns:
+        str: Prompt compacto.
+    """
+    examples = EXAMPLE_PATTERN.findall(router_prompt)
+    known = {a.name: a for a in agents}
+    # Solo los agentes que el prompt completo ofrece al router (los que tienen ejemplos)
+    names = list(dict.fromkeys(name for _, name in examples if name in known)) or list(known)
+    lines = [f"Responde SOLO con el nombre del agente adecuado: {', '.join(names)}. Sin explicaciones."]
+    for name in names:
+        tools = ", ".join(known[name].tools)
+        lines.append(f"- {name}: {tools}" if tools else f"- {name}")
+    kept = {}
+    for example, name in examples:
+        if name in names and kept.get(name, 0) < examples_per_agent:
+            kept[name] = kept.get(name, 0) + 1
+            lines.append(f"Usuario: {example}\nRespuesta: {name}")
+    return "\n".join(lines)
+
+class PromptBudget:
+    """
+    Control del tamaño de los prompts enviados a Groq. Filtra las herramientas de cada agente
+    según las entidades detectadas y la intención del mensaje, recorta hasta un máximo de tokens
+    por llamada y acumula, por etapa (router, agente, asistente general), los tokens estimados
+    y los que informa la API.
+    """
+    def __init__(self, max_prompt_tokens=None, filter_tools=True, entity_types=()):
+        """
+        Args:
+            max_prompt_tokens (int, opcional): Máximo de tokens de entrada por llamada (None o 0 = sin límite).
+            filter_tools (bool, opcional): Si se envían solo las herramientas relevantes.
+            entity_types (iterable, opcional): Nombres de argumento que son entidades extraídas
+                por patrón (dni, poliza, ...); una herramienta que exige una que no se ha detectado
+                se ofrece al modelo después de las demás.
+        """
+        self.max_prompt_tokens = max_prompt_tokens or None
+        self.filter_tools = filter_tools
+        self.entity_types = set(entity_types)
+        self._tool_features = {}
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _features_for(self, tool):
+        name = tool["function"]["name"]
+        features = self._tool_features.get(name)
+        if features is None:
+            features = set(extract_features(f"{name} {tool['function'].get('description', '')}"))
+            self._tool_features[name] = features
+        return features
+
+    def relevant_tools(self, tools, user_input, entidades):
+        """
+        Selecciona las herramientas que merece la pena enviar al modelo, de más a menos relevante.
+        Se prefieren las que comparten con el mensaje términos poco comunes entre herramientas y,
+        a igualdad, las que no exigen una entidad sin detectar. Estas últimas se ofrecen igualmente
+        (después): un valor mal escrito (p.ej. un DNI sin una cifra) no se detecta como entidad y
+        el modelo debe poder llamar a la herramienta para que la validación de patrones responda
+        con el error de formato. Si ninguna coincide se envían todas, primero las compatibles.
+        Args:
+            tools (list): Herramientas del agente.
+            user_input (str): Entrada del usuario.
+            entidades (dict): Entidades detectadas.
+        Returns:
+            list: Herramientas a enviar.
+        """
+        if not self.filter_tools or not tools:
+            return tools
+        present = set(entidades or {})
+        missing = [
+            bool((set(t["function"].get("parameters", {}).get("required", [])) & self.entity_types) - present)
+            for t in tools
+        ]
+        query = set(extract_features(user_input))
+        # Los términos comunes a más de la mitad de las herramientas ("abonado", "dni", ...) no discriminan
+        frequency = Counter(f for t in tools for f in self._features_for(t))
+        common = {f for f, n in frequency.items() if n > max(1, len(tools) // 2)}
+        query -= common
+        scored = [(len(query & self._features_for(t)), missing[i], i, t) for i, t in enumerate(tools)]
+        matching = [item for item in scored if item[0]]
+        if not matching:
+            return [t for _, _, _, t in sorted(scored, key=lambda item: (item[1], item[2]))]
+        matching.sort(key=lambda item: (-item[0], item[1], item[2]))
+        return [t for _, _, _, t in matching]
+
+    def fit(self, stage, messages, tools=None):
+        """
+        Mide el prompt de una llamada y, si supera el máximo, quita herramientas empezando por
+        las menos relevantes (el final de la lista) hasta que quepa.
+        Args:
+            stage (str): Etapa a la que se atribuye la llamada (p.ej. "router" o "agent:factura_agent").
+            messages (list): Mensajes de la llamada.
+            tools (list, opcional): Herramientas, ordenadas de más a menos relevante.
+        Returns:
+            list: Herramientas que caben en el presupuesto.
+        Raises:
+            PromptBudgetExceeded: Si los mensajes por sí solos ya superan el máximo.
+        """
+        tools = list(tools or [])
+        tokens = count_prompt_tokens(messages, tools)
+        if self.max_prompt_tokens and tokens > self.max_prompt_tokens:
+            while tools and tokens > self.max_prompt_tokens:
+                dropped = tools.pop()
+                tokens = count_prompt_tokens(messages, tools)
+                logging.info(f"[prompt_budget] {stage}: se descarta la herramienta {dropped['function']['name']} por presupuesto")
+            if tokens > self.max_prompt_tokens:
+                self._record(stage, tokens, rejected=True)
+                raise PromptBudgetExceeded(f"El prompt de {stage} ocupa ~{tokens} tokens (máximo {self.max_prompt_tokens})")
+        self._record(stage, tokens, tools=len(tools))
+        logging.debug(f"[prompt_budget] {stage}: ~{tokens} tokens, {len(tools)} herramientas")
+        return tools
+
+    def _record(self, stage, tokens, tools=0, rejected=False):
+        with self._lock:
+            s = self._stages.setdefault(stage, {
+                "calls": 0, "estimated_tokens": 0, "max_estimated_tokens": 0, "tools_sent": 0,
+                "rejected": 0, "reported_calls": 0, "reported_prompt_tokens": 0,
+            })
+            if rejected:
+                s["rejected"] += 1
+                return
+            s["calls"] += 1
+            s["estimated_tokens"] += tokens
+            s["max_estimated_tokens"] = max(s["max_estimated_tokens"], tokens)
+            s["tools_sent"] += tools
+
+    def record_usage(self, stage, usage):
+        """
+        Registra los tokens de entrada que informa la API para una llamada (campo `usage`).
+        """
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        if prompt_tokens is None:
+            return
+        llm_tokens.inc(prompt_tokens, stage=stage, kind="prompt")
+        llm_tokens.inc(getattr(usage, "completion_tokens", 0) or 0, stage=stage, kind="completion")
+        logging.debug(f"[prompt_budget] {stage}: {prompt_tokens} tokens de entrada según la API")
+        with self._lock:
+            s = self._stages.get(stage)
+            if s is not None:
+                s["reported_calls"] += 1
+                s["reported_prompt_tokens"] += prompt_tokens
+
+    def stats(self):
+        """
+        Retorna los tamaños de prompt acumulados por etapa.
+        Returns:
+            dict: Máximo configurado y, por etapa, llamadas, tokens estimados (total, medio y máximo),
+                herramientas enviadas de media, llamadas rechazadas y tokens informados por la API.
+        """
+        with self._lock:
+            stages = {}
+            for stage, s in self._stages.items():
+                calls = s["calls"]
+                stages[stage] = dict(
+                    s,
+                    avg_estimated_tokens=round(s["estimated_tokens"] / calls, 1) if calls else 0.0,
+                    avg_tools_sent=round(s["tools_sent"] / calls, 2) if calls else 0.0,
+                    avg_reported_prompt_tokens=round(s["reported_prompt_tokens"] / s["reported_calls"], 1) if s["reported_calls"] else None,
+                )
+            return {"max_prompt_tokens": self.max_prompt_tokens, "stages": stages}
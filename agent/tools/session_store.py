@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+class SessionStore:
+    """
+    Almacén de contextos de conversación indexado por id de sesión.
+    Cada sesión guarda únicamente sus entidades (dni, telefono, ...), con capacidad
+    acotada, expulsión LRU y caducidad por inactividad (TTL). Las búsquedas son O(1).
+    """
+    def __init__(self, capacity=10000, ttl_seconds=1800, clock=time.monotonic):
+        """
+        Inicializa el almacén de sesiones.
+
+        Args:
+            capacity (int): Número máximo de sesiones que se mantienen en memoria.
+            ttl_seconds (float): Segundos de inactividad tras los que una sesión caduca.
+            clock (callable, opcional): Reloj monotónico usado para medir la inactividad.
+        """
+        if capacity <= 0:
+            raise ValueError("capacity debe ser mayor que 0")
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._sessions = OrderedDict()  # session_id -> (last_access, context)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, last_access, now):
+        return self.ttl_seconds is not None and now - last_access > self.ttl_seconds
+
+    def _purge_expired(self, now):
+        # El OrderedDict está ordenado por último acceso: las sesiones caducadas están al principio
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if not self._expired(last_access, now):
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def get(self, session_id, create=True):
+        """
+        Devuelve el contexto de la sesión, marcándola como usada recientemente.
+
+        Args:
+            session_id (str): Identificador de la sesión.
+            create (bool, opcional): Si es True, crea un contexto vacío cuando no existe.
+
+        Returns:
+            dict | None: Contexto mutable de la sesión, o None si no existe y create es False.
+        """
+        now = self._clock()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and self._expired(entry[0], now):
+                del self._sessions[session_id]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self.hits += 1
+                context = entry[1]
+                self._sessions[session_id] = (now, context)
+                self._sessions.move_to_end(session_id)
+                return context
+            self.misses += 1
+            if not create:
+                return None
+            self._purge_expired(now)
+            while len(self._sessions) >= self.capacity:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            context = {}
+            self._sessions[session_id] = (now, context)
+            return context
+
+    def pop(self, session_id):
+        """
+        Elimina la sesión indicada del almacén.
+
+        Args:
+            session_id (str): Identificador de la sesión.
+
+        Returns:
+            dict | None: Contexto eliminado, si existía.
+        """
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        return entry[1] if entry else None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def stats(self):
+        """
+        Retorna estadísticas de uso del almacén.
+
+        Returns:
+            dict: Tamaño, capacidad, aciertos, fallos, expulsiones y caducidades.
+        """
+        with self._lock:
+            self._purge_expired(self._clock())
+            return {
+                "size": len(self._sessions),
+                "capacity": self.capacity,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
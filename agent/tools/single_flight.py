@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+class _LeaderCancelled(Exception):
+    # La llamada compartida se canceló con la petición que la lanzó: los demás la repiten
+    pass
+
+class SingleFlight:
+    """
+    Agrupa llamadas idénticas concurrentes: mientras una llamada con una clave está en curso,
+    las siguientes con la misma clave esperan su resultado (o su excepción) en lugar de
+    repetirla. No guarda nada cuando termina; de eso se encargan las cachés.
+    """
+    def __init__(self, name):
+        """
+        Args:
+            name (str): Nombre para estadísticas y logs (p.ej. "router", "tools").
+        """
+        self.name = name
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.deduplicated = 0
+
+    def join(self, key):
+        """
+        Devuelve el futuro de la llamada en curso con esa clave, o None si no hay ninguna.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None and future.get_loop() is asyncio.get_running_loop():
+                self.deduplicated += 1
+                return future
+            return None
+
+    def running(self, key):
+        """
+        True si hay una llamada en curso con esa clave (sin contarla como agrupada).
+        """
+        with self._lock:
+            return key in self._inflight
+
+    def lead(self, key):
+        """
+        Registra una llamada nueva con esa clave. Quien la registra debe llamar a `resolve`.
+        Si ya hay una en curso con esa clave en este event loop, devuelve su futuro sin
+        sustituirlo (los que ya esperaban no se quedan sin resultado).
+        Returns:
+            asyncio.Future: Futuro en el que esperarán las llamadas agrupadas.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None and not future.done() and future.get_loop() is loop:
+                return future
+            future = loop.create_future()
+            self._inflight[key] = future
+            self.calls += 1
+        return future
+
+    def resolve(self, key, future, result=None, error=None):
+        """
+        Publica el resultado (o la excepción) de una llamada registrada con `lead` y la retira.
+        """
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            # Marcada como consultada: sin seguidores no debe avisar de "exception never retrieved"
+            future.exception()
+        else:
+            future.set_result(result)
+
+    async def do(self, key, fn):
+        """
+        Ejecuta `fn()` o, si ya hay una llamada con la misma clave en curso, espera su resultado.
+        Args:
+            key: Clave canónica (hashable) de la llamada.
+            fn (callable): Función sin argumentos que devuelve la corrutina a ejecutar.
+        Returns:
+            Resultado de la llamada (compartido entre todas las agrupadas).
+        """
+        future = self.join(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                return await self.do(key, fn)
+        future = self.lead(key)
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self.resolve(key, future, error=_LeaderCancelled())
+            raise
+        except Exception as e:
+            self.resolve(key, future, error=e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    def stats(self):
+        """
+        Returns:
+            dict: Llamadas ejecutadas, llamadas agrupadas en otra en curso y llamadas en curso.
+        """
+        with self._lock:
+            total = self.calls + self.deduplicated
+            return {
+                "calls": self.calls,
+                "deduplicated": self.deduplicated,
+                "dedup_rate": round(self.deduplicated / total, 4) if total else 0.0,
+                "in_flight": len(self._inflight),
+            }
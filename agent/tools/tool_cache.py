@@ -0,0 +1,107 @@
+import json
+import logging
+from agent.tools.lru_cache import LRUCache
+
+def canonical_args(args):
+    """
+    Serializa los argumentos de una herramienta de forma canónica (claves ordenadas,
+    cadenas sin espacios sobrantes) para usarlos como parte de una clave de caché.
+    Args:
+        args (dict): Argumentos de la llamada.
+    Returns:
+        str: Representación JSON canónica.
+    """
+    cleaned = {k: v.strip() if isinstance(v, str) else v for k, v in args.items()}
+    return json.dumps(cleaned, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+def split_tool_metadata(tools):
+    """
+    Separa la clave `metadata` de cada herramienta de tools_schema.json, ya que no forma
+    parte del formato de herramientas que se envía al modelo.
+    Args:
+        tools (list): Herramientas tal como están en tools_schema.json.
+    Returns:
+        tuple: (lista de herramientas sin metadata, dict nombre -> metadata).
+    """
+    clean, metadata = [], {}
+    for tool in tools:
+        tool = dict(tool)
+        meta = tool.pop("metadata", None)
+        if meta:
+            metadata[tool["function"]["name"]] = meta
+        clean.append(tool)
+    return clean, metadata
+
+class ToolResultCache:
+    """
+    Caché de resultados de herramientas de solo lectura, indexada por (herramienta, argumentos canónicos).
+    El TTL de cada herramienta se declara en `metadata.cache_ttl` de tools_schema.json; las herramientas
+    sin TTL no se cachean. Las herramientas de escritura declaran en `metadata.invalidates` qué entradas
+    deben invalidar y por qué argumentos (p.ej. {"incidencias_por_dni": ["dni"]}).
+    """
+    def __init__(self, tool_metadata, capacity=4096):
+        """
+        Inicializa la caché.
+        Args:
+            tool_metadata (dict): Nombre de herramienta -> metadata de tools_schema.json.
+            capacity (int, opcional): Número máximo de resultados guardados.
+        """
+        self.tool_metadata = tool_metadata
+        self.cache = LRUCache(capacity=capacity, ttl_seconds=None)
+
+    def ttl_for(self, name):
+        return self.tool_metadata.get(name, {}).get("cache_ttl")
+
+    def get(self, name, args):
+        """
+        Devuelve el resultado cacheado de una llamada, si existe y no ha caducado.
+        Args:
+            name (str): Nombre de la herramienta.
+            args (dict): Argumentos de la llamada.
+        Returns:
+            dict | None: Respuesta del backend cacheada.
+        """
+        if not self.ttl_for(name):
+            return None
+        return self.cache.get((name, canonical_args(args)))
+
+    def store(self, name, args, response):
+        """
+        Guarda la respuesta de una herramienta cacheable. Las respuestas de error no se guardan.
+        Args:
+            name (str): Nombre de la herramienta.
+            args (dict): Argumentos de la llamada.
+            response: Respuesta del backend.
+        """
+        ttl = self.ttl_for(name)
+        if not ttl or (isinstance(response, dict) and "error" in response):
+            return
+        self.cache.set((name, canonical_args(args)), response, ttl_seconds=ttl)
+
+    def invalidate_for(self, name, args):
+        """
+        Invalida las entradas afectadas por una herramienta de escritura.
+        Args:
+            name (str): Nombre de la herramienta de escritura ejecutada.
+            args (dict): Argumentos con los que se ejecutó.
+        """
+        invalidates = self.tool_metadata.get(name, {}).get("invalidates")
+        if not invalidates:
+            return
+        for key in self.cache.keys():
+            tool, key_args = key
+            if tool not in invalidates:
+                continue
+            match_on = invalidates[tool]
+            if match_on:
+                cached_args = json.loads(key_args)
+                if any(cached_args.get(arg) != str(args.get(arg, "")).strip() for arg in match_on):
+                    continue
+            self.cache.pop(key)
+            logging.debug(f"[tool_cache] Invalidada {tool} {key_args} tras {name}")
+
+    def stats(self):
+        """
+        Retorna las estadísticas de la caché (tamaño, aciertos, fallos, ratio...).
+        """
+        return self.cache.stats()
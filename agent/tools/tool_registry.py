@@ -0,0 +1,90 @@
+from jsonschema import validators
+from jsonschema.exceptions import best_match
+from agent.tools.tool_cache import split_tool_metadata
+
+# Campos que identifican a un abonado, por orden de preferencia (resumen_abonado, datos_abonado)
+IDENTIFIER_FIELDS = ("dni", "poliza")
+
+class ToolRegistry:
+    """
+    Registro de herramientas construido una sola vez a partir de tools_schema.json.
+    Guarda por nombre el esquema, un validador jsonschema ya compilado, los campos obligatorios
+    (o alternativos, si basta con uno de ellos) y la metadata, además de la lista filtrada de
+    herramientas de cada agente, de modo que en cada petición solo se hacen búsquedas en
+    diccionarios.
+    """
+    def __init__(self, raw_tools):
+        """
+        Args:
+            raw_tools (list): Herramientas tal como están en tools_schema.json (con metadata).
+        """
+        self.tools, self.metadata = split_tool_metadata(raw_tools)
+        self.schemas = {t["function"]["name"]: t for t in self.tools}
+        self.validators = {}
+        self.required = {}
+        for name, tool in self.schemas.items():
+            schema = tool["function"].get("parameters")
+            if schema:
+                validator_cls = validators.validator_for(schema)
+                validator_cls.check_schema(schema)
+                self.validators[name] = validator_cls(schema)
+            self.required[name] = tuple(schema.get("required", [])) if schema else ()
+        # Herramientas sin obligatorios que identifican al abonado por cualquiera de varios campos
+        self.alternatives = {}
+        for name, tool in self.schemas.items():
+            params = tool["function"].get("parameters") or {}
+            fields = tuple(f for f in IDENTIFIER_FIELDS if f in params.get("properties", {}))
+            if fields and not self.required[name]:
+                self.alternatives[name] = fields
+        # Herramientas con paginación (aceptan `limit` y `cursor`)
+        self.paginated = {name for name, tool in self.schemas.items()
+                          if "limit" in (tool["function"].get("parameters") or {}).get("properties", {})}
+        self._agent_tools = {}
+
+    def tools_for(self, agent_name, tool_names):
+        """
+        Devuelve (y memoriza) la lista de herramientas que se envía al modelo para un agente.
+        Args:
+            agent_name (str): Nombre del agente.
+            tool_names (list): Herramientas que el agente puede usar.
+        Returns:
+            list: Definiciones de herramientas del agente, en el orden de tools_schema.json.
+        """
+        tools = self._agent_tools.get(agent_name)
+        if tools is None:
+            allowed = set(tool_names)
+            tools = [t for t in self.tools if t["function"]["name"] in allowed]
+            self._agent_tools[agent_name] = tools
+        return tools
+
+    def with_page_limit(self, name, args, max_rows):
+        """
+        Acota el tamaño de página de una herramienta paginada.
+        Args:
+            name (str): Nombre de la herramienta.
+            args (dict): Argumentos de la llamada.
+            max_rows (int): Filas máximas (0 = sin límite).
+        Returns:
+            dict: Los mismos argumentos con `limit` <= max_rows (sin cambios si no es paginada).
+        """
+        if not max_rows or name not in self.paginated:
+            return args
+        limit = args.get("limit")
+        if isinstance(limit, int) and 0 < limit <= max_rows:
+            return args
+        return dict(args, limit=max_rows)
+
+    def validation_error(self, name, args):
+        """
+        Valida los argumentos de una llamada con el validador precompilado.
+        Args:
+            name (str): Nombre de la herramienta.
+            args (dict): Argumentos de la llamada.
+        Returns:
+            str | None: Mensaje del error más relevante, o None si los argumentos son válidos.
+        """
+        validator = self.validators.get(name)
+        if validator is None:
+            return None
+        error = best_match(validator.iter_errors(args))
+        return error.message if error is not None else None
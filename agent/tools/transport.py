@@ -0,0 +1,144 @@
+import inspect
+import logging
+from abc import ABC, abstractmethod
+import httpx
+from telemetry.tracing import trace_headers
+from config.config import (
+    SERVER_URL, TOOL_TRANSPORT, TOOL_HTTP_MAX_CONNECTIONS, TOOL_HTTP_MAX_KEEPALIVE,
+    TOOL_HTTP_TIMEOUT_SECONDS, TOOL_HTTP_CONNECT_TIMEOUT_SECONDS
+)
+
+class ToolTransport(ABC):
+    """
+    Interfaz común de los transportes de herramientas.
+    """
+    @abstractmethod
+    async def call(self, name, args):
+        """
+        Invoca una herramienta del backend.
+        Args:
+            name (str): Nombre de la herramienta.
+            args (dict): Argumentos JSON.
+        Returns:
+            Respuesta JSON de la herramienta.
+        """
+
+    async def call_batch(self, calls):
+        """
+        Ejecuta varias herramientas en una sola petición al endpoint /batch del backend.
+        Args:
+            calls (list): Lista de {"tool": nombre, "args": argumentos}.
+        Returns:
+            list: Por cada llamada, en orden, {"tool", "response"} o {"tool", "error"}.
+        """
+        out = await self.call("batch", {"calls": calls})
+        return out["results"]
+
+    async def close(self):
+        pass
+
+class HttpToolTransport(ToolTransport):
+    """
+    Transporte de herramientas sobre HTTP con un único cliente asíncrono con pool de
+    conexiones keep-alive y timeouts configurables.
+    """
+    def __init__(self, base_url=SERVER_URL, max_connections=TOOL_HTTP_MAX_CONNECTIONS,
+                 max_keepalive=TOOL_HTTP_MAX_KEEPALIVE, timeout=TOOL_HTTP_TIMEOUT_SECONDS,
+                 connect_timeout=TOOL_HTTP_CONNECT_TIMEOUT_SECONDS):
+        """
+        Args:
+            base_url (str): URL base del backend de herramientas.
+            max_connections (int): Conexiones simultáneas máximas del pool.
+            max_keepalive (int): Conexiones ociosas que se mantienen abiertas.
+            timeout (float): Timeout de lectura/escritura en segundos.
+            connect_timeout (float): Timeout de conexión en segundos.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._client = None
+
+    def _get_client(self):
+        # Se crea al primer uso para que quede ligado al event loop que lo utiliza
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, limits=self.limits, timeout=self.timeout)
+        return self._client
+
+    async def call(self, name, args):
+        """
+        Invoca una herramienta del backend.
+        Args:
+            name (str): Nombre de la herramienta (ruta del backend).
+            args (dict): Argumentos JSON.
+        Returns:
+            Respuesta JSON del backend.
+        """
+        # La traza en curso viaja en la cabecera X-Trace-Id para enlazar los spans del backend
+        r = await self._get_client().post(f"/{name}", json=args, headers=trace_headers())
+        r.raise_for_status()
+        return r.json()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class InProcessToolTransport(ToolTransport):
+    """
+    Transporte que llama directamente a los handlers de las rutas de `backend.server`,
+    sin socket ni serialización HTTP. Los argumentos se validan con los mismos modelos
+    pydantic que usaría FastAPI y la respuesta se codifica con `jsonable_encoder`, de modo
+    que el resultado tiene la misma forma que por HTTP.
+    """
+    def __init__(self, app=None, init=None):
+        """
+        Args:
+            app (FastAPI, opcional): Aplicación del backend; por defecto `backend.server.app`.
+            init (callable, opcional): Arranque del backend en proceso, antes de la primera
+                llamada; por defecto `backend.server.init_in_process` (si `app` es la de backend.server).
+        """
+        from backend.dispatch import build_invokers
+        if app is None:
+            from backend.server import app, init_in_process
+            init = init if init is not None else init_in_process
+        self.app = app
+        self.init = init
+        self.invokers = build_invokers(app)
+        self._started = False
+
+    async def _startup(self):
+        # Solo el arranque de datos del backend (no su logging: se usa el del agente), una sola vez
+        self._started = True
+        if self.init is not None:
+            result = self.init()
+            if inspect.isawaitable(result):
+                await result
+
+    async def call(self, name, args):
+        """
+        Invoca una herramienta llamando a su handler en el mismo proceso.
+        Args:
+            name (str): Nombre de la herramienta.
+            args (dict): Argumentos JSON.
+        Returns:
+            Respuesta con la misma forma JSON que devolvería el backend.
+        """
+        from backend.dispatch import invoke
+        if not self._started:
+            await self._startup()
+        return await invoke(self.invokers, name, args)
+
+def build_tool_transport(kind=TOOL_TRANSPORT):
+    """
+    Crea el transporte de herramientas indicado en la configuración.
+    Args:
+        kind (str): "http" (por defecto) o "inprocess".
+    Returns:
+        HttpToolTransport | InProcessToolTransport
+    """
+    if kind == "inprocess":
+        logging.info("[transport] Herramientas ejecutadas en proceso (backend.server)")
+        return InProcessToolTransport()
+    if kind != "http":
+        raise ValueError(f"TOOL_TRANSPORT desconocido: {kind}")
+    return HttpToolTransport()
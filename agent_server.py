@@ -1,36 +1,253 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from pydantic import BaseModel
-from agent.agent import responder
+from typing import Optional
+from agent.agent import responder, responder_stream, get_agent_app, preload, configure_logging
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import json
+import uuid
+import threading
+import time
+from telemetry.metrics import registry, route_label, CONTENT_TYPE
+from telemetry.tracing import TRACE_HEADER, start_trace, end_trace
+from config.config import AGENT_PRELOAD
+from agent.tools.llm_scheduler import LANES, LLMOverloaded, llm_lane, get_llm_scheduler
 
-app = FastAPI()
+# Cabecera con la que un cliente marca su tráfico como "batch" (por defecto "interactive")
+PRIORITY_HEADER = "X-Priority"
+OVERLOADED_REPLY = "⏳ El servicio está saturado en este momento. Inténtalo de nuevo en unos segundos."
 
-# Permitir CORS para desarrollo (ajusta origins en producción)
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+http_latency = registry.histogram(
+    "agent_http_request_duration_seconds", "Duración de las peticiones HTTP a agent_server", ("method", "path", "status")
 )
 
+def _cache_stats():
+    # Sin construir el grafo: mientras no haya llegado ninguna petición no hay cachés que medir
+    agent_app = get_agent_app(create=False)
+    if agent_app is None:
+        return {}
+    return {
+        "tool_cache": agent_app.tool_cache.stats(),
+        "routing_cache": agent_app.orchestrator.routing_cache.stats(),
+        "local_router": agent_app.orchestrator.local_router.stats(),
+        "sessions": agent_app.session_store.stats(),
+    }
+
+def _cache_metric(field):
+    return lambda: {(cache,): stats.get(field) for cache, stats in _cache_stats().items()}
+
+registry.callback("agent_cache_hits_total", "Aciertos por caché", _cache_metric("hits"), ("cache",), kind="counter")
+registry.callback("agent_cache_misses_total", "Fallos por caché", _cache_metric("misses"), ("cache",), kind="counter")
+registry.callback("agent_cache_hit_ratio", "Ratio de aciertos por caché", _cache_metric("hit_rate"), ("cache",))
+registry.callback("agent_cache_entries", "Entradas por caché", _cache_metric("size"), ("cache",))
+
+def _flight_metric(field):
+    def collect():
+        agent_app = get_agent_app(create=False)
+        if agent_app is None:
+            return {}
+        flights = (agent_app.orchestrator.router_flight, agent_app.tool_flight)
+        return {(flight.name,): flight.stats()[field] for flight in flights}
+    return collect
+
+registry.callback("agent_singleflight_calls_total", "Llamadas ejecutadas por grupo de single-flight", _flight_metric("calls"), ("flight",), kind="counter")
+registry.callback("agent_singleflight_deduplicated_total", "Llamadas agrupadas en otra idéntica en curso", _flight_metric("deduplicated"), ("flight",), kind="counter")
+
+def _scheduler_metric(field):
+    def collect():
+        out = {}
+        for model, stats in get_llm_scheduler().stats().items():
+            if field == "queued":
+                out.update({(model, lane): n for lane, n in stats["queued"].items()})
+            else:
+                out[(model,)] = stats[field]
+        return out
+    return collect
+
+registry.callback("llm_in_flight", "Llamadas al modelo en curso", _scheduler_metric("in_flight"), ("model",))
+registry.callback("llm_queued", "Llamadas al modelo esperando en cola", _scheduler_metric("queued"), ("model", "lane"))
+
+def _prefetch_hit_rate():
+    agent_app = get_agent_app(create=False)
+    if agent_app is None or agent_app.prefetcher is None:
+        return None
+    return agent_app.prefetcher.stats()["hit_rate"]
+
+registry.callback("agent_prefetch_hit_ratio", "Ratio de precargas aprovechadas por el agente", _prefetch_hit_rate)
+
 class ChatRequest(BaseModel):
     message: str
     role: str = "admin"  # Campo para el rol del usuario
+    session_id: Optional[str] = None  # Conversación a la que pertenece el mensaje; si falta se crea una nueva
+
+def _normalize_reply(result):
+    # El resultado puede ser dict o string, normalizamos la respuesta
+    if isinstance(result, dict):
+        # Si es un dict, serializar como JSON válido para el frontend
+        return result.get("response") or result.get("respuesta") or json.dumps(result, ensure_ascii=False)
+    return str(result)
+
+def _lane(request):
+    lane = (request.headers.get(PRIORITY_HEADER) or "interactive").lower()
+    return lane if lane in LANES else "interactive"
+
+def _overloaded(session_id, error):
+    retry_after = max(1, round(error.retry_after or 1))
+    return JSONResponse(
+        {"reply": OVERLOADED_REPLY, "session_id": session_id},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def _sse(event, data):
+    # Formato Server-Sent Events: nombre del evento y una línea de datos JSON
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def create_app(preload_agents=AGENT_PRELOAD):
+    """
+    Crea la aplicación FastAPI del agente. El grafo de agentes se construye en la primera
+    petición, o aquí mismo con `preload_agents` (AGENT_PRELOAD) para que gunicorn --preload lo
+    construya una vez antes del fork y los workers lo hereden.
+
+    Uso: `uvicorn agent_server:app` (se crea al acceder a `app`, no al importar el módulo) o
+    `uvicorn --factory agent_server:create_app`.
+
+    Args:
+        preload_agents (bool, opcional): Construir el grafo de agentes al crear la aplicación.
+    Returns:
+        FastAPI: Aplicación.
+    """
+    configure_logging()
+    if preload_agents:
+        preload()
+    app = FastAPI()
+
+    # Permitir CORS para desarrollo (ajusta origins en producción)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.middleware("http")
+    async def trace_requests(request: Request, call_next):
+        # Reutiliza el identificador de traza del cliente si lo envía; se devuelve en la respuesta
+        trace, token = start_trace(request.headers.get(TRACE_HEADER))
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers[TRACE_HEADER] = trace.trace_id
+            return response
+        finally:
+            http_latency.observe(time.perf_counter() - start, method=request.method, path=route_label(request), status=status)
+            end_trace(trace, token, "agent")
+
+    @app.get("/metrics")
+    async def metrics():
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+
+    @app.on_event("shutdown")
+    async def close_agent_app():
+        agent_app = get_agent_app(create=False)
+        if agent_app is not None:
+            await agent_app.close()
+
+    @app.post("/api/chat")
+    async def chat_endpoint(data: ChatRequest, request: Request):
+        session_id = data.session_id or uuid.uuid4().hex
+        try:
+            with llm_lane(_lane(request)):
+                result = await responder(data.message, user_role=data.role, session_id=session_id)  # Pasar el rol y la sesión al responder
+            return {"reply": _normalize_reply(result), "session_id": session_id}
+        except LLMOverloaded as e:
+            logging.warning(f"Petición rechazada por saturación: {e}")
+            return _overloaded(session_id, e)
+        except Exception as e:
+            logging.exception("Error en el endpoint /api/chat")
+            return {"reply": f"❌ Error procesando la solicitud: {str(e)}", "session_id": session_id}
+
+    @app.post("/api/chat/stream")
+    async def chat_stream_endpoint(data: ChatRequest, request: Request):
+        """
+        Igual que /api/chat pero responde con Server-Sent Events: "session", "route" (agente elegido),
+        "tool" (herramientas en curso), "token" (fragmentos del texto del modelo) y "done" con la
+        misma respuesta que devolvería /api/chat. Si algo falla se emite "error".
+        """
+        session_id = data.session_id or uuid.uuid4().hex
+        lane = _lane(request)
+
+        async def events():
+            yield _sse("session", {"session_id": session_id})
+            try:
+                with llm_lane(lane):
+                    async for event in responder_stream(data.message, user_role=data.role, session_id=session_id):
+                        if event["event"] == "done":
+                            yield _sse("done", {"reply": _normalize_reply(event["data"]), "session_id": session_id})
+                        else:
+                            yield _sse(event["event"], event["data"])
+            except LLMOverloaded as e:
+                logging.warning(f"Petición rechazada por saturación: {e}")
+                yield _sse("error", {"error": OVERLOADED_REPLY, "retry_after": e.retry_after})
+            except Exception as e:
+                logging.exception("Error en el endpoint /api/chat/stream")
+                yield _sse("error", {"error": f"❌ Error procesando la solicitud: {str(e)}"})
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            # Sin caché ni buffering en proxies para que los tokens lleguen según se generan
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/api/sessions/stats")
+    async def sessions_stats():
+        return get_agent_app().session_store.stats()
+
+    @app.get("/api/router/stats")
+    async def router_stats():
+        orchestrator = get_agent_app().orchestrator
+        return {
+            "local_router": orchestrator.local_router.stats(),
+            "routing_cache": orchestrator.routing_cache.stats(),
+            "single_flight": orchestrator.router_flight.stats(),
+        }
+
+    @app.get("/api/tools/stats")
+    async def tools_stats():
+        agent_app = get_agent_app()
+        return dict(agent_app.tool_cache.stats(), single_flight=agent_app.tool_flight.stats())
+
+    @app.get("/api/prefetch/stats")
+    async def prefetch_stats():
+        prefetcher = get_agent_app().prefetcher
+        return prefetcher.stats() if prefetcher is not None else {"enabled": False}
+
+    @app.get("/api/llm/stats")
+    async def llm_stats():
+        return get_llm_scheduler().stats()
+
+    @app.get("/api/prompt/stats")
+    async def prompt_stats():
+        return get_agent_app().prompt_budget.stats()
+
+    return app
+
+_app = None
+_app_lock = threading.Lock()
 
-@app.post("/api/chat")
-async def chat_endpoint(data: ChatRequest):
-    try:
-        result = responder(data.message, user_role=data.role)  # Pasar el rol al responder
-        # El resultado puede ser dict o string, normalizamos la respuesta
-        if isinstance(result, dict):
-            # Si es un dict, serializar como JSON válido para el frontend
-            reply = result.get("response") or result.get("respuesta") or json.dumps(result, ensure_ascii=False)
-        else:
-            reply = str(result)
-        return {"reply": reply}
-    except Exception as e:
-        logging.exception("Error en el endpoint /api/chat")
-        return {"reply": f"❌ Error procesando la solicitud: {str(e)}"}
+def __getattr__(name):
+    # `agent_server:app` se crea al pedirlo (uvicorn, gunicorn), no al importar el módulo:
+    # importar agent_server no configura el logging ni arranca su hilo escritor
+    global _app
+    if name == "app":
+        if _app is None:
+            with _app_lock:
+                if _app is None:
+                    _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
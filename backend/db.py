@@ -0,0 +1,379 @@
+import asyncio
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+
+# Pragmas aplicados a cada conexión al abrirla
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -int(os.getenv("DB_CACHE_SIZE_KB", "20000")),
+    "mmap_size": int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+# Conexión de la transacción en curso (ver ConnectionPool.transaction); run_query la reutiliza
+_transaction_connection = contextvars.ContextVar("transaction_connection", default=None)
+
+class PoolExhausted(Exception):
+    """
+    No se ha liberado ninguna conexión del pool en el tiempo de espera configurado.
+    """
+
+class ConnectionPool:
+    """
+    Pool de conexiones SQLite reutilizables. Las conexiones se abren una sola vez (bajo demanda,
+    hasta `size`), con WAL y pragmas ajustados, y las consultas se ejecutan en un pool de hilos
+    propio para no bloquear el event loop de FastAPI.
+
+    Antes de usar una conexión se reserva un hueco (hay tantos como conexiones). Desde el event
+    loop la espera por un hueco es asíncrona, así que ningún hilo del pool queda bloqueado
+    esperando una conexión: quien tiene una reservada (una transacción, un listado en streaming)
+    siempre encuentra un hilo libre para terminar y devolverla.
+    """
+    def __init__(self, db_path, size=DB_POOL_SIZE, pragmas=None, timeout=DB_POOL_TIMEOUT_SECONDS):
+        """
+        Args:
+            db_path (str): Ruta a la base de datos SQLite.
+            size (int): Número máximo de conexiones abiertas.
+            pragmas (dict, opcional): Pragmas a aplicar en cada conexión.
+            timeout (float): Segundos máximos de espera por una conexión libre.
+        """
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = DEFAULT_PRAGMAS if pragmas is None else pragmas
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._free = size
+        # Funciones que conceden un hueco a quien espera (futuro asíncrono o evento), en orden de llegada
+        self._waiters = deque()
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="sqlite")
+        self.opened = 0
+        self.in_use = 0
+        self.acquisitions = 0
+        self.waits = 0
+        self.queries = 0
+        self.errors = 0
+        self._savepoints = 0
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
+
+    def _release(self):
+        # Cede el hueco al primero que espera o lo deja libre
+        with self._lock:
+            while self._waiters:
+                grant = self._waiters.popleft()
+                try:
+                    grant()
+                    return
+                except RuntimeError:
+                    # El event loop del que esperaba ya está cerrado
+                    continue
+            self._free += 1
+
+    def _grant(self, future):
+        # En el loop del que espera: si ya no espera (timeout, cancelación), el hueco pasa al siguiente
+        if future.done():
+            self._release()
+        else:
+            future.set_result(None)
+
+    async def _reserve(self):
+        """
+        Reserva un hueco sin ocupar un hilo del pool mientras espera.
+        Raises:
+            PoolExhausted: Si no queda ninguno libre en `timeout` segundos.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                return
+            future = loop.create_future()
+            grant = lambda: loop.call_soon_threadsafe(self._grant, future)
+            self._waiters.append(grant)
+            self.waits += 1
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except BaseException as e:
+            with self._lock:
+                queued = grant in self._waiters
+                if queued:
+                    self._waiters.remove(grant)
+            if not queued and future.done() and not future.cancelled():
+                # Concedido pero cancelados antes de usarlo: se cede
+                self._release()
+            # Si la concesión aún no ha llegado, `_grant` verá el futuro cancelado y lo cederá
+            if isinstance(e, asyncio.TimeoutError):
+                raise PoolExhausted(f"Sin conexiones libres tras {self.timeout}s (pool de {self.size})") from None
+            raise
+
+    def _reserve_blocking(self):
+        """
+        Igual que `_reserve`, para llamadas síncronas fuera del event loop.
+        """
+        event = threading.Event()
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                return
+            self._waiters.append(event.set)
+            self.waits += 1
+        if not event.wait(self.timeout):
+            with self._lock:
+                if event.set in self._waiters:
+                    self._waiters.remove(event.set)
+                    raise PoolExhausted(f"Sin conexiones libres tras {self.timeout}s (pool de {self.size})")
+            # Concedido justo al vencer el plazo: el hueco es nuestro
+
+    def _acquire(self):
+        # Con un hueco reservado siempre hay una conexión ociosa o sitio para abrir otra
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            self.opened += 1
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self.opened -= 1
+            raise
+
+    def _checkout(self):
+        # Requiere un hueco reservado; si no se consigue la conexión, el hueco se devuelve
+        try:
+            conn = self._acquire()
+        except BaseException:
+            self._release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.acquisitions += 1
+        return conn
+
+    def _checkin(self, conn, failed=False):
+        try:
+            if failed:
+                conn.rollback()
+        finally:
+            with self._lock:
+                self.in_use -= 1
+                if failed:
+                    self.errors += 1
+            self._idle.put(conn)
+            self._release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Presta una conexión del pool; se devuelve al salir del bloque. Si hubo un error
+        se deshace cualquier transacción abierta antes de devolverla. Para uso síncrono (la
+        espera por una conexión libre bloquea el hilo).
+        """
+        self._reserve_blocking()
+        conn = self._checkout()
+        failed = False
+        try:
+            yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._checkin(conn, failed)
+
+    def _execute_on(self, conn, query, params=(), commit=False):
+        rows = conn.execute(query, params).fetchall()
+        if commit:
+            conn.commit()
+        with self._lock:
+            self.queries += 1
+        return rows
+
+    def execute(self, query, params=(), commit=False):
+        """
+        Ejecuta una sentencia de forma síncrona con una conexión del pool.
+        Returns:
+            list: Filas devueltas por la sentencia.
+        """
+        with self.connection() as conn:
+            return self._execute_on(conn, query, params, commit)
+
+    def _execute_reserved(self, query, params=(), commit=False):
+        # Como `execute`, con el hueco ya reservado desde el event loop
+        conn = self._checkout()
+        failed = False
+        try:
+            return self._execute_on(conn, query, params, commit)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._checkin(conn, failed)
+
+    async def run(self, fn, *args):
+        """
+        Ejecuta `fn(*args)` en el pool de hilos de la base de datos.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _checkout_async(self):
+        # Con el hueco ya reservado. La tarea de checkout sigue aunque se cancele quien espera:
+        # en ese caso la conexión obtenida se devuelve al pool al terminar
+        future = asyncio.get_running_loop().run_in_executor(self._executor, self._checkout)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: f.cancelled() or f.exception() is not None or self._checkin(f.result()))
+            raise
+
+    async def run_query(self, query, params=(), commit=False):
+        """
+        Ejecuta una sentencia fuera del event loop. Dentro de `transaction()` usa la conexión
+        de la transacción y deja el commit para el final de la misma.
+        Returns:
+            list: Filas devueltas por la sentencia.
+        """
+        conn = _transaction_connection.get()
+        if conn is not None:
+            return await self.run(self._execute_on, conn, query, params)
+        await self._reserve()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, self._execute_reserved, query, params, commit)
+        except BaseException:
+            self._release()
+            raise
+        return await future
+
+    async def stream_query(self, query, params=(), batch_size=500):
+        """
+        Ejecuta una consulta y devuelve sus filas por tandas de `cursor.fetchmany`, sin cargar
+        el resultado completo en memoria. La conexión queda reservada hasta agotar (o cerrar)
+        el generador.
+        Args:
+            query (str): Consulta SQL.
+            params (tuple): Parámetros de la consulta.
+            batch_size (int): Filas leídas en cada tanda.
+        Yields:
+            list: Filas de cada tanda.
+        """
+        conn = _transaction_connection.get()
+        owned = conn is None
+        if owned:
+            await self._reserve()
+            conn = await self._checkout_async()
+        failed = False
+        cursor = None
+        try:
+            cursor = await self.run(conn.execute, query, params)
+            with self._lock:
+                self.queries += 1
+            while True:
+                rows = await self.run(cursor.fetchmany, batch_size)
+                if not rows:
+                    break
+                yield rows
+        except GeneratorExit:
+            # El consumidor dejó de leer (p.ej. el cliente cerró la conexión): no es un error
+            raise
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if cursor is not None:
+                await self.run(cursor.close)
+            if owned:
+                await self.run(self._checkin, conn, failed)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Reserva una única conexión y abre una transacción sobre ella; todas las llamadas a
+        `run_query` hechas dentro del bloque la comparten. Al salir se hace commit (o rollback
+        si hubo una excepción) y la conexión vuelve al pool.
+        """
+        await self._reserve()
+        conn = await self._checkout_async()
+        token = _transaction_connection.set(conn)
+        failed = False
+        try:
+            await self.run(conn.execute, "BEGIN")
+            yield conn
+            await self.run(conn.commit)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            _transaction_connection.reset(token)
+            await self.run(self._checkin, conn, failed)
+
+    @asynccontextmanager
+    async def savepoint(self):
+        """
+        Punto de guardado dentro de `transaction()`: si el bloque lanza una excepción se deshacen
+        solo sus cambios (ROLLBACK TO) y la transacción sigue; si no, se conservan para el commit.
+        Raises:
+            RuntimeError: Si no hay una transacción en curso.
+        """
+        conn = _transaction_connection.get()
+        if conn is None:
+            raise RuntimeError("savepoint() requiere una transacción en curso")
+        with self._lock:
+            self._savepoints += 1
+            name = f"sp_{self._savepoints}"
+        await self.run(conn.execute, f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            await self.run(conn.execute, f"ROLLBACK TO {name}")
+            raise
+        finally:
+            await self.run(conn.execute, f"RELEASE {name}")
+
+    def stats(self):
+        """
+        Retorna estadísticas del pool.
+        Returns:
+            dict: Tamaño, conexiones abiertas/ociosas/en uso, adquisiciones, esperas, consultas y errores.
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self.opened,
+                "idle": self._idle.qsize(),
+                "in_use": self.in_use,
+                "waiting": len(self._waiters),
+                "acquisitions": self.acquisitions,
+                "waits": self.waits,
+                "queries": self.queries,
+                "errors": self.errors,
+            }
+
+    def close(self):
+        """
+        Cierra todas las conexiones ociosas y detiene el pool de hilos.
+        """
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self.opened = self.in_use
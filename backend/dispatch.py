@@ -0,0 +1,53 @@
+import inspect
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, create_model
+
+def build_invokers(app, exclude=()):
+    """
+    Construye, para cada ruta POST de la aplicación, lo necesario para invocar su handler
+    directamente: el modelo pydantic que valida el cuerpo (igual que haría FastAPI) y, si el
+    cuerpo es un único modelo sin embed, el nombre del parámetro que lo recibe.
+    Args:
+        app (FastAPI): Aplicación cuyas rutas se registran.
+        exclude (iterable, opcional): Nombres de herramienta que no se registran.
+    Returns:
+        dict: Nombre de herramienta -> (handler, modelo, nombre del parámetro o None).
+    """
+    invokers = {}
+    for route in app.routes:
+        if not isinstance(route, APIRoute) or "POST" not in route.methods:
+            continue
+        name = route.path.lstrip("/")
+        if name in exclude:
+            continue
+        endpoint = route.endpoint
+        params = list(inspect.signature(endpoint).parameters.values())
+        if len(params) == 1 and inspect.isclass(params[0].annotation) and issubclass(params[0].annotation, BaseModel):
+            # Cuerpo con un único modelo sin embed: el JSON son directamente sus campos
+            invokers[name] = (endpoint, params[0].annotation, params[0].name)
+        else:
+            fields = {p.name: (p.annotation, p.default) for p in params}
+            invokers[name] = (endpoint, create_model(f"{endpoint.__name__}_body", **fields), None)
+    return invokers
+
+async def invoke(invokers, name, args):
+    """
+    Valida los argumentos y llama al handler de una herramienta.
+    Args:
+        invokers (dict): Resultado de build_invokers.
+        name (str): Nombre de la herramienta.
+        args (dict): Argumentos JSON.
+    Returns:
+        Respuesta con la misma forma JSON que devolvería la ruta HTTP.
+    """
+    if name not in invokers:
+        raise LookupError(f"Herramienta '{name}' no disponible en el backend")
+    endpoint, model, arg_name = invokers[name]
+    body = model.model_validate(args)
+    if arg_name:
+        out = await endpoint(**{arg_name: body})
+    else:
+        # Atributos del modelo tal cual (sin model_dump) para conservar los submodelos validados
+        out = await endpoint(**{field: getattr(body, field) for field in type(body).model_fields})
+    return jsonable_encoder(out)
@@ -0,0 +1,106 @@
+"""
+Migraciones versionadas del esquema de demo.db.
+
+La versión aplicada se guarda en `PRAGMA user_version`, así que `migrate()` es idempotente
+y se ejecuta en cada arranque del servidor. `check_query_plans()` comprueba con
+EXPLAIN QUERY PLAN que ninguna consulta de los endpoints recorre una tabla completa.
+
+Uso:
+    python -m backend.migrations            # aplica las migraciones pendientes
+    python -m backend.migrations --check    # aplica y verifica los planes de consulta
+"""
+import logging
+import os
+import sqlite3
+import sys
+from backend.queries import ENDPOINT_QUERIES
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "demo.db")
+
+# (versión, descripción, tablas requeridas, sentencias)
+MIGRATIONS = [
+    (1, "Índices para las consultas de los endpoints", ("abonados", "facturas", "incidencias", "usuarios"), [
+        "CREATE INDEX IF NOT EXISTS idx_abonados_dni ON abonados (dni)",
+        "CREATE INDEX IF NOT EXISTS idx_abonados_poliza ON abonados (poliza)",
+        # estado_pagos, ultimo_pago, deuda_total, facturas_pendientes
+        "CREATE INDEX IF NOT EXISTS idx_facturas_dni_estado_fecha ON facturas (dni_abonado, estado, fecha, importe)",
+        # todas_las_facturas (ORDER BY fecha DESC sin ordenación temporal)
+        "CREATE INDEX IF NOT EXISTS idx_facturas_dni_fecha ON facturas (dni_abonado, fecha, estado, importe)",
+        # incidencias_por_dni, actualizar_estado_incidencia
+        "CREATE INDEX IF NOT EXISTS idx_incidencias_usuario_ubicacion ON incidencias (usuario_id, ubicacion)",
+        "CREATE INDEX IF NOT EXISTS idx_incidencias_estado ON incidencias (estado)",
+        "CREATE INDEX IF NOT EXISTS idx_incidencias_ubicacion ON incidencias (ubicacion)",
+        "CREATE INDEX IF NOT EXISTS idx_usuarios_username ON usuarios (username)",
+    ]),
+    (2, "Índices para la paginación por clave de los listados", ("facturas", "incidencias"), [
+        # todas_las_facturas: ORDER BY fecha DESC, id DESC y cursor (fecha, id) < (?, ?)
+        "DROP INDEX IF EXISTS idx_facturas_dni_fecha",
+        "CREATE INDEX IF NOT EXISTS idx_facturas_dni_fecha_id ON facturas (dni_abonado, fecha, id, estado, importe)",
+        # incidencias_por_nombre: cursor id > ? dentro de cada usuario
+        "CREATE INDEX IF NOT EXISTS idx_incidencias_usuario_id ON incidencias (usuario_id, id)",
+    ]),
+]
+
+def _existing_tables(conn):
+    return {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+def migrate(db_path=DB_PATH):
+    """
+    Aplica las migraciones pendientes, en orden, cada una en su propia transacción.
+    Si faltan tablas que una migración necesita, se detiene sin marcarla como aplicada.
+    Args:
+        db_path (str): Ruta a la base de datos.
+    Returns:
+        int: Versión del esquema tras migrar.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, description, tables, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            missing = set(tables) - _existing_tables(conn)
+            if missing:
+                logging.warning(f"[migrations] No se aplica la migración {target}: faltan tablas {sorted(missing)}")
+                break
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {target}")
+            version = target
+            logging.info(f"[migrations] Aplicada migración {target}: {description}")
+        return version
+    finally:
+        conn.close()
+
+def check_query_plans(db_path=DB_PATH, queries=None):
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las consultas de los endpoints y devuelve las que
+    recorren una tabla completa.
+    Args:
+        db_path (str): Ruta a la base de datos.
+        queries (dict, opcional): Nombre -> (consulta, parámetros). Por defecto ENDPOINT_QUERIES.
+    Returns:
+        dict: Nombre de la consulta -> lista de pasos del plan con SCAN completo (vacío si todo usa índices).
+    """
+    queries = ENDPOINT_QUERIES if queries is None else queries
+    conn = sqlite3.connect(db_path)
+    try:
+        full_scans = {}
+        for name, (query, params) in queries.items():
+            plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+            scans = [step for step in plan if step.startswith("SCAN ") and "CONSTANT ROW" not in step]
+            if scans:
+                full_scans[name] = scans
+        return full_scans
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    print(f"Versión del esquema: {migrate()}")
+    if "--check" in sys.argv:
+        full_scans = check_query_plans()
+        for name, steps in full_scans.items():
+            print(f"SCAN completo en {name}: {steps}")
+        sys.exit(1 if full_scans else 0)
@@ -0,0 +1,100 @@
+"""
+Paginación por clave (keyset) de los listados del backend.
+
+La paginación es opcional: sin `limit` ni `cursor` el listado se devuelve completo, como
+siempre. Cada página se pide con `limit` y el `cursor` opaco devuelto por la anterior
+(`next_cursor`), que codifica la clave de ordenación de la última fila: la siguiente página
+empieza justo después sin OFFSET, recorriendo el índice desde ese punto.
+"""
+import base64
+import json
+import os
+
+BACKEND_PAGE_SIZE = int(os.getenv("BACKEND_PAGE_SIZE", "50"))
+BACKEND_MAX_PAGE_SIZE = int(os.getenv("BACKEND_MAX_PAGE_SIZE", "500"))
+# Filas leídas de SQLite en cada fetchmany al exportar un listado completo en NDJSON
+BACKEND_STREAM_BATCH_SIZE = int(os.getenv("BACKEND_STREAM_BATCH_SIZE", "500"))
+
+def encode_cursor(key):
+    """
+    Codifica la clave de una fila como cursor opaco (base64 url-safe de su JSON).
+    """
+    raw = json.dumps(list(key), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, size):
+    """
+    Decodifica un cursor de `encode_cursor`.
+    Args:
+        cursor (str): Cursor recibido.
+        size (int): Número de columnas de la clave del listado.
+    Returns:
+        tuple: Valores de la clave.
+    Raises:
+        ValueError: Si el cursor no es válido para este listado.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Cursor no válido")
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError("Cursor no válido")
+    return tuple(key)
+
+def page_size(limit):
+    """
+    Tamaño de página efectivo: BACKEND_PAGE_SIZE si se pagina (hay `cursor`) sin `limit`,
+    acotado a [1, BACKEND_MAX_PAGE_SIZE].
+    """
+    if limit is None:
+        return BACKEND_PAGE_SIZE
+    return max(1, min(int(limit), BACKEND_MAX_PAGE_SIZE))
+
+class Listing:
+    """
+    Consulta de un listado paginable por clave. Las columnas de la clave se seleccionan
+    antes que las del resultado y definen un orden total (la última suele ser `id`).
+    """
+    def __init__(self, key, source, fields, descending=False):
+        """
+        Args:
+            key (tuple): Columnas de la clave de ordenación (p.ej. ("fecha", "id")).
+            source (str): Tabla y filtro, con placeholders (p.ej. "facturas WHERE dni_abonado = ?").
+                Debe incluir un WHERE; el filtro del cursor se añade con AND.
+            fields (tuple): Columnas devueltas en cada elemento del listado.
+            descending (bool): Orden descendente de la clave.
+        """
+        self.key = tuple(key)
+        self.source = source
+        self.fields = tuple(fields)
+        self.descending = descending
+        # Las columnas del resultado que ya están en la clave no se seleccionan dos veces
+        self.columns = self.key + tuple(f for f in self.fields if f not in self.key)
+
+    def query(self, after=None, limited=True):
+        """
+        Construye la consulta de una página.
+        Args:
+            after (tuple, opcional): Clave de la última fila ya devuelta.
+            limited (bool): Si termina en `LIMIT ?` (el último parámetro).
+        Returns:
+            str: Consulta SQL.
+        """
+        sql = f"SELECT {', '.join(self.columns)} FROM {self.source}"
+        if after is not None:
+            # Comparación de row values: usa el índice a partir de la última clave, sin OFFSET
+            op = "<" if self.descending else ">"
+            sql += f" AND ({', '.join(self.key)}) {op} ({', '.join('?' * len(self.key))})"
+        order = " DESC" if self.descending else ""
+        sql += " ORDER BY " + ", ".join(f"{column}{order}" for column in self.key)
+        return sql + " LIMIT ?" if limited else sql
+
+    def count_query(self):
+        return f"SELECT COUNT(*) FROM {self.source}"
+
+    def item(self, row):
+        values = dict(zip(self.columns, row))
+        return {f: values[f] for f in self.fields}
+
+    def cursor_for(self, row):
+        return encode_cursor(row[:len(self.key)])
@@ -0,0 +1,88 @@
+"""
+Consultas SQL de los endpoints de backend/server.py, definidas una sola vez: los endpoints las
+ejecutan y `backend.migrations.check_query_plans` comprueba sus planes (ENDPOINT_QUERIES).
+"""
+from backend.pagination import Listing
+
+EXISTE_ABONADO = "SELECT 1 FROM abonados WHERE dni = ?"
+DIRECCION_ABONADO = "SELECT direccion FROM abonados WHERE dni = ?"
+ABONADO_ID_POR_DNI = "SELECT id FROM abonados WHERE dni = ?"
+DATOS_ABONADO_POR_DNI = "SELECT nombre, dni, direccion, email, telefono, poliza FROM abonados WHERE dni = ?"
+DATOS_ABONADO_POR_POLIZA = "SELECT nombre, dni, direccion, email, telefono, poliza FROM abonados WHERE poliza = ?"
+ESTADO_PAGOS = "SELECT estado FROM facturas WHERE dni_abonado = ?"
+ULTIMO_PAGO = "SELECT fecha, importe FROM facturas WHERE dni_abonado = ? AND estado = 'Pagado' ORDER BY fecha DESC LIMIT 1"
+DEUDA_TOTAL = "SELECT SUM(importe) FROM facturas WHERE dni_abonado = ? AND estado != 'Pagado'"
+FACTURAS_PENDIENTES = "SELECT fecha, estado, importe FROM facturas WHERE dni_abonado = ? AND estado != 'Pagado'"
+INCIDENCIAS_POR_USUARIO = "SELECT ubicacion, descripcion, estado FROM incidencias WHERE usuario_id = ?"
+ULTIMA_INCIDENCIA_EN_UBICACION = "SELECT id FROM incidencias WHERE usuario_id = ? AND ubicacion = ? ORDER BY id DESC LIMIT 1"
+CREAR_INCIDENCIA = "INSERT INTO incidencias (usuario_id, ubicacion, descripcion, estado) VALUES (?, ?, ?, ?)"
+ACTUALIZAR_ESTADO_INCIDENCIA = "UPDATE incidencias SET estado = ? WHERE id = ?"
+
+# Listados paginados por clave: la última columna de la clave es el id, para un orden total
+LISTADOS = {
+    "todas_las_facturas": Listing(("fecha", "id"), "facturas WHERE dni_abonado = ?", ("fecha", "estado", "importe"), descending=True),
+    "incidencias_pendientes": Listing(("id",), "incidencias WHERE estado = 'Pendiente'", ("ubicacion", "descripcion", "estado")),
+    "incidencias_por_ubicacion": Listing(("id",), "incidencias WHERE ubicacion = ?", ("ubicacion", "descripcion", "estado")),
+    "incidencias_por_nombre": Listing(("id",), "incidencias WHERE usuario_id IN (SELECT id FROM usuarios WHERE username = ?)", ("ubicacion", "descripcion", "estado")),
+}
+
+# Secciones de resumen_abonado: subconsulta correlacionada con el abonado `a` de cada una
+RESUMEN_SECCIONES = {
+    "deuda_total": "(SELECT COALESCE(SUM(importe), 0) FROM facturas WHERE dni_abonado = a.dni AND estado != 'Pagado')",
+    "facturas_pendientes": "(SELECT json_group_array(json_object('fecha', fecha, 'estado', estado, 'importe', importe)) FROM facturas WHERE dni_abonado = a.dni AND estado != 'Pagado')",
+    "ultimo_pago": "(SELECT json_object('fecha', fecha, 'importe', importe) FROM facturas WHERE dni_abonado = a.dni AND estado = 'Pagado' ORDER BY fecha DESC LIMIT 1)",
+    "incidencias": "(SELECT json_group_array(json_object('ubicacion', ubicacion, 'descripcion', descripcion, 'estado', estado)) FROM incidencias WHERE usuario_id = a.id)",
+}
+
+def resumen_query(secciones, por="dni"):
+    """
+    Construye la consulta única de resumen_abonado: datos del abonado + una subconsulta por sección.
+    Args:
+        secciones (list): Secciones de RESUMEN_SECCIONES a incluir, en ese orden.
+        por (str): Columna por la que se busca el abonado ("dni" o "poliza").
+    Returns:
+        str: Consulta SQL con un único parámetro (el valor buscado).
+    """
+    columnas = ["a.nombre", "a.dni", "a.direccion", "a.email", "a.telefono", "a.poliza"]
+    columnas += [f"{RESUMEN_SECCIONES[c]} AS {c}" for c in secciones]
+    return f"SELECT {', '.join(columnas)} FROM abonados a WHERE a.{por} = ?"
+
+def _params(query):
+    # Los planes no dependen de los valores, solo del número de parámetros
+    return ("x",) * query.count("?")
+
+def endpoint_queries():
+    """
+    Todas las consultas de lectura (y las actualizaciones con WHERE) que lanzan los endpoints,
+    con parámetros de ejemplo, para comprobar sus planes.
+    Returns:
+        dict: Nombre -> (consulta, parámetros).
+    """
+    queries = {
+        "existe_abonado": EXISTE_ABONADO,
+        "direccion_abonado": DIRECCION_ABONADO,
+        "abonado_id_por_dni": ABONADO_ID_POR_DNI,
+        "datos_abonado_dni": DATOS_ABONADO_POR_DNI,
+        "datos_abonado_poliza": DATOS_ABONADO_POR_POLIZA,
+        "estado_pagos": ESTADO_PAGOS,
+        "ultimo_pago": ULTIMO_PAGO,
+        "deuda_total": DEUDA_TOTAL,
+        "facturas_pendientes": FACTURAS_PENDIENTES,
+        "incidencias_por_dni": INCIDENCIAS_POR_USUARIO,
+        "actualizar_estado_incidencia": ULTIMA_INCIDENCIA_EN_UBICACION,
+        "actualizar_estado_incidencia:update": ACTUALIZAR_ESTADO_INCIDENCIA,
+    }
+    for name, listing in LISTADOS.items():
+        after = ("x",) * len(listing.key)
+        queries[f"{name}:completo"] = listing.query(limited=False)
+        queries[f"{name}:primera"] = listing.query()
+        queries[f"{name}:siguiente"] = listing.query(after)
+        queries[f"{name}:export"] = listing.query(after, limited=False)
+        queries[f"{name}:total"] = listing.count_query()
+    for por in ("dni", "poliza"):
+        queries[f"resumen_abonado:{por}"] = resumen_query(list(RESUMEN_SECCIONES), por)
+        for seccion in RESUMEN_SECCIONES:
+            queries[f"resumen_abonado:{por}:{seccion}"] = resumen_query([seccion], por)
+    return {name: (query, _params(query)) for name, query in queries.items()}
+
+ENDPOINT_QUERIES = endpoint_queries()
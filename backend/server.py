@@ -1,75 +1,177 @@
-from fastapi import FastAPI, Body
+from fastapi import FastAPI, Body, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, List
 from pydantic import BaseModel
-import sqlite3
 import logging
+import json
 import os
+import time
+from backend.db import ConnectionPool, PoolExhausted
+from backend.migrations import migrate
+from backend.dispatch import build_invokers, invoke
+from backend.pagination import decode_cursor, page_size, BACKEND_STREAM_BATCH_SIZE
+from backend import queries
+from backend.queries import LISTADOS, RESUMEN_SECCIONES, resumen_query
+from telemetry.metrics import registry, route_label, CONTENT_TYPE
+from telemetry.tracing import TRACE_HEADER, get_tracer, start_trace, end_trace
+from telemetry.logs import setup_logging
 
 app = FastAPI()
-# Usar ruta absoluta para la base de datos
-DB_PATH = os.path.join(os.path.dirname(__file__), "demo.db")
-
-# Configuración del logger
-logging.basicConfig(
-    filename=os.path.join(os.path.dirname(__file__), "../logs/server.log"),
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
+# Usar ruta absoluta para la base de datos (BACKEND_DB_PATH permite apuntar a otra, p.ej. en benchmarks)
+DB_PATH = os.getenv("BACKEND_DB_PATH", os.path.join(os.path.dirname(__file__), "demo.db"))
+# Conexiones persistentes (WAL + pragmas) compartidas por todas las peticiones
+db_pool = ConnectionPool(DB_PATH)
+
+@app.on_event("startup")
+def configure_logging():
+    # Logger JSONL escrito en segundo plano, al arrancar (no al importar el módulo). Dentro del
+    # agente no se ejecuta (ver init_in_process). Se registra antes que apply_migrations para que
+    # sus mensajes ya vayan al fichero
+    setup_logging(os.path.join(os.path.dirname(__file__), "..", "logs", "server.jsonl"), level=logging.INFO)
+
+tracer = get_tracer("backend")
+http_latency = registry.histogram(
+    "backend_http_request_duration_seconds", "Duración de las peticiones HTTP al backend", ("method", "path", "status")
+)
+registry.callback(
+    "backend_db_pool", "Estado del pool de conexiones SQLite",
+    lambda: {(stat,): value for stat, value in db_pool.stats().items()}, ("stat",)
 )
 
 @app.middleware("http")
-async def log_requests(request, call_next):
-    response = await call_next(request)
-    logging.info(f"{request.method} {request.url} - Status: {response.status_code}")
-    return response
-
-def run_query(query, params=(), commit=False):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        if commit:
-            conn.commit()
-        return cursor.fetchall()
+async def log_requests(request: Request, call_next):
+    # La traza llega del agente en la cabecera X-Trace-Id (si no, se abre una nueva)
+    trace, token = start_trace(request.headers.get(TRACE_HEADER))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_HEADER] = trace.trace_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        http_latency.observe(elapsed, method=request.method, path=route_label(request), status=status)
+        # El formateo y la escritura se hacen en el hilo del logger, no en el de la petición
+        logging.info("%s %s - Status: %s", request.method, request.url.path, status, extra={"data": {"duration_ms": round(elapsed * 1000, 3)}})
+        end_trace(trace, token, "backend")
+
+@app.exception_handler(PoolExhausted)
+async def pool_exhausted(request: Request, exc: PoolExhausted):
+    # Todas las conexiones ocupadas durante todo el plazo: saturación, no un error de la petición
+    logging.warning(f"{request.url.path}: {exc}")
+    return JSONResponse({"error": "Servicio saturado, inténtalo de nuevo en unos segundos"}, status_code=503, headers={"Retry-After": "1"})
+
+async def run_query(query, params=(), commit=False):
+    with tracer.span("db_query"):
+        return await db_pool.run_query(query, params, commit)
+
+async def list_page(listado, campo, params=(), limit=None, cursor=None):
+    """
+    Devuelve una página de un listado de LISTADOS, o el listado completo si no se pide
+    paginación (ni `limit` ni `cursor`).
+    Args:
+        listado (str): Nombre del listado.
+        campo (str): Clave de la respuesta con los elementos (p.ej. "facturas").
+        params (tuple): Parámetros del filtro del listado.
+        limit (int, opcional): Tamaño de página (ver backend.pagination.page_size).
+        cursor (str, opcional): `next_cursor` de la página anterior.
+    Returns:
+        dict: Elementos y, si se pagina, `next_cursor` (None en la última página) y, en la
+            primera, `totals` ({campo: filas del listado completo}).
+    """
+    listing = LISTADOS[listado]
+    if limit is None and cursor is None:
+        rows = await run_query(listing.query(limited=False), params)
+        return {campo: [listing.item(r) for r in rows]}
+    size = page_size(limit)
+    try:
+        after = decode_cursor(cursor, len(listing.key)) if cursor else None
+    except ValueError as e:
+        return {"error": str(e)}
+    # Una fila de más indica si hay página siguiente
+    rows = await run_query(listing.query(after), (*params, *(after or ()), size + 1))
+    page = {
+        campo: [listing.item(r) for r in rows[:size]],
+        "next_cursor": listing.cursor_for(rows[size - 1]) if len(rows) > size else None,
+    }
+    if after is None:
+        # El total solo se cuenta en la primera página, y solo si no cabe entera en ella
+        total = len(rows) if len(rows) <= size else (await run_query(listing.count_query(), params))[0][0]
+        page["totals"] = {campo: total}
+    return page
+
+def stream_listing(listado, params=(), cursor=None):
+    """
+    Exporta un listado completo (o desde `cursor`) como NDJSON, un elemento por línea, leyendo
+    de SQLite por tandas sin cargarlo en memoria. Para consumidores que no son el modelo.
+    """
+    listing = LISTADOS[listado]
+    try:
+        after = decode_cursor(cursor, len(listing.key)) if cursor else None
+    except ValueError as e:
+        return Response(json.dumps({"error": str(e)}, ensure_ascii=False), status_code=400, media_type="application/json")
+
+    async def lines():
+        async for rows in db_pool.stream_query(listing.query(after, limited=False), (*params, *(after or ())), BACKEND_STREAM_BATCH_SIZE):
+            yield "".join(json.dumps(listing.item(r), ensure_ascii=False) + "\n" for r in rows)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.on_event("startup")
+def apply_migrations():
+    # Idempotente: solo aplica las migraciones cuya versión aún no está en la base de datos
+    migrate(DB_PATH)
+
+def init_in_process():
+    """
+    Arranque del backend cuando sus handlers se llaman desde el agente (InProcessToolTransport):
+    lo mismo que el startup del servidor salvo el logging, que es el del agente.
+    """
+    apply_migrations()
+
+@app.on_event("shutdown")
+def close_db_pool():
+    db_pool.close()
+
+@app.get("/db_stats", operation_id="db_stats")
+async def db_stats():
+    return db_pool.stats()
+
+@app.get("/metrics", operation_id="metrics")
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
 
 # === ENDPOINTS DE CONSULTA ===
 
 @app.post("/existe_abonado", operation_id="existe_abonado")
 async def existe_abonado(dni: str = Body(..., embed=True)):
-    result = run_query("SELECT 1 FROM abonados WHERE dni = ?", (dni,))
+    result = await run_query(queries.EXISTE_ABONADO, (dni,))
     return {"existe": bool(result)}
 
 @app.post("/direccion_abonado", operation_id="direccion_abonado")
 async def direccion_abonado(dni: str = Body(..., embed=True)):
-    result = run_query("SELECT direccion FROM abonados WHERE dni = ?", (dni,))
+    result = await run_query(queries.DIRECCION_ABONADO, (dni,))
     return {"direccion": result[0][0] if result else None}
 
 @app.post("/estado_pagos", operation_id="estado_pagos")
 async def estado_pagos(dni: str = Body(..., embed=True)):
-    result = run_query("SELECT estado FROM facturas WHERE dni_abonado = ?", (dni,))
+    result = await run_query(queries.ESTADO_PAGOS, (dni,))
     return {"estados": [r[0] for r in result]}
 
 @app.post("/ultimo_pago", operation_id="ultimo_pago")
 async def ultimo_pago(dni: str = Body(..., embed=True)):
-    result = run_query(
-        "SELECT fecha, importe FROM facturas WHERE dni_abonado = ? AND estado = 'Pagado' ORDER BY fecha DESC LIMIT 1",
-        (dni,)
-    )
+    result = await run_query(queries.ULTIMO_PAGO, (dni,))
     return {"ultimo_pago": {"fecha": result[0][0], "importe": result[0][1]} if result else None}
 
 @app.post("/deuda_total", operation_id="deuda_total")
 async def deuda_total(dni: str = Body(..., embed=True)):
-    result = run_query(
-        "SELECT SUM(importe) FROM facturas WHERE dni_abonado = ? AND estado != 'Pagado'",
-        (dni,)
-    )
+    result = await run_query(queries.DEUDA_TOTAL, (dni,))
     return {"deuda": result[0][0] if result[0][0] else 0}
 
 @app.post("/facturas_pendientes", operation_id="facturas_pendientes")
 async def facturas_pendientes(dni: str = Body(..., embed=True)):
-    result = run_query(
-        "SELECT fecha, estado, importe FROM facturas WHERE dni_abonado = ? AND estado != 'Pagado'",
-        (dni,)
-    )
+    result = await run_query(queries.FACTURAS_PENDIENTES, (dni,))
     return {
         "facturas": [
             {
@@ -81,12 +183,12 @@ async def facturas_pendientes(dni: str = Body(..., embed=True)):
     }
 
 @app.post("/todas_las_facturas", operation_id="todas_las_facturas")
-async def todas_las_facturas(dni: str = Body(..., embed=True)):
-    result = run_query(
-        "SELECT fecha, estado, importe FROM facturas WHERE dni_abonado = ? ORDER BY fecha DESC",
-        (dni,)
-    )
-    return {"facturas": [{"fecha": r[0], "estado": r[1], "importe": r[2]} for r in result]}
+async def todas_las_facturas(
+    dni: str = Body(..., embed=True),
+    limit: Optional[int] = Body(None, embed=True),
+    cursor: Optional[str] = Body(None, embed=True)
+):
+    return await list_page("todas_las_facturas", "facturas", (dni,), limit, cursor)
 
 class DatosAbonadoInput(BaseModel):
     dni: Optional[str] = None
@@ -101,15 +203,9 @@ async def datos_abonado(data: DatosAbonadoInput):
         return {"error": "Debe proporcionar un DNI o una póliza"}
 
     if dni:
-        result = run_query(
-            "SELECT nombre, dni, direccion, email, telefono, poliza FROM abonados WHERE dni = ?",
-            (dni,)
-        )
+        result = await run_query(queries.DATOS_ABONADO_POR_DNI, (dni,))
     else:
-        result = run_query(
-            "SELECT nombre, dni, direccion, email, telefono, poliza FROM abonados WHERE poliza = ?",
-            (poliza,)
-        )
+        result = await run_query(queries.DATOS_ABONADO_POR_POLIZA, (poliza,))
 
     if result:
         nombre, dni, direccion, correo, telefono, poliza = result[0]
@@ -124,6 +220,43 @@ async def datos_abonado(data: DatosAbonadoInput):
     else:
         return {"error": "Abonado no encontrado"}
 
+class ResumenAbonadoInput(BaseModel):
+    dni: Optional[str] = None
+    poliza: Optional[str] = None
+    campos: Optional[List[str]] = None
+
+@app.post("/resumen_abonado", operation_id="resumen_abonado")
+async def resumen_abonado(data: ResumenAbonadoInput):
+    if not data.dni and not data.poliza:
+        return {"error": "Debe proporcionar un DNI o una póliza"}
+    campos = data.campos or ["datos", *RESUMEN_SECCIONES]
+    desconocidos = [c for c in campos if c != "datos" and c not in RESUMEN_SECCIONES]
+    if desconocidos:
+        return {"error": f"Campos no válidos: {', '.join(desconocidos)}"}
+    secciones = [c for c in RESUMEN_SECCIONES if c in campos]
+
+    # Una única consulta: datos del abonado + una subconsulta por sección pedida
+    por, valor = ("dni", data.dni) if data.dni else ("poliza", data.poliza)
+    result = await run_query(resumen_query(secciones, por), (valor,))
+    if not result:
+        return {"error": "Abonado no encontrado"}
+
+    row = result[0]
+    resumen = {}
+    if "datos" in campos:
+        nombre, dni, direccion, correo, telefono, poliza = row[:6]
+        resumen["datos"] = {
+            "nombre": nombre,
+            "dni": dni,
+            "direccion": direccion,
+            "correo": correo,
+            "telefono": telefono,
+            "poliza": poliza
+        }
+    for campo, valor in zip(secciones, row[6:]):
+        resumen[campo] = json.loads(valor) if campo != "deuda_total" and valor is not None else valor
+    return resumen
+
 @app.post("/crear_incidencia", operation_id="crear_incidencia")
 async def crear_incidencia(
     dni: str = Body(..., embed=True),
@@ -132,7 +265,7 @@ async def crear_incidencia(
     estado: str = Body("Abierto", embed=True)
 ):
     # Buscar el usuario_id usando el DNI
-    result = run_query("SELECT id FROM abonados WHERE dni = ?", (dni,))
+    result = await run_query(queries.ABONADO_ID_POR_DNI, (dni,))
     if not result:
         return {"error": "No se encontró un abonado con el DNI proporcionado."}
 
@@ -142,35 +275,28 @@ async def crear_incidencia(
     ubicacion = ubicacion.strip().capitalize()
 
     # Insertar la incidencia
-    run_query(
-        "INSERT INTO incidencias (usuario_id, ubicacion, descripcion, estado) VALUES (?, ?, ?, ?)",
-        (usuario_id, ubicacion, descripcion, estado),
-        commit=True
-    )
+    await run_query(queries.CREAR_INCIDENCIA, (usuario_id, ubicacion, descripcion, estado), commit=True)
     return {"message": f"Incidencia creada exitosamente para el abonado con DNI {dni}"}
 
 @app.post("/incidencias_por_dni", operation_id="incidencias_por_dni")
 async def incidencias_por_dni(dni: str = Body(..., embed=True)):
     
-    result = run_query("SELECT id FROM abonados WHERE dni = ?", (dni,))
+    result = await run_query(queries.ABONADO_ID_POR_DNI, (dni,))
     if not result:
         return {"error": "No se encontró un abonado con el DNI proporcionado."}
 
     usuario_id = result[0][0]
 
-    incidencias = run_query(
-        "SELECT ubicacion, descripcion, estado FROM incidencias WHERE usuario_id = ?",
-        (usuario_id,)
-    )
+    incidencias = await run_query(queries.INCIDENCIAS_POR_USUARIO, (usuario_id,))
     return {"incidencias": [{"ubicacion": r[0], "descripcion": r[1], "estado": r[2]} for r in incidencias]}
 
 @app.post("/incidencias_por_nombre", operation_id="incidencias_por_nombre")
-async def incidencias_por_nombre(nombre: str = Body(..., embed=True)):
-    result = run_query(
-        "SELECT ubicacion, descripcion, estado FROM incidencias WHERE usuario_id IN (SELECT id FROM usuarios WHERE username = ?)",
-        (nombre,)
-    )
-    return {"incidencias": [{"ubicacion": r[0], "descripcion": r[1], "estado": r[2]} for r in result]}
+async def incidencias_por_nombre(
+    nombre: str = Body(..., embed=True),
+    limit: Optional[int] = Body(None, embed=True),
+    cursor: Optional[str] = Body(None, embed=True)
+):
+    return await list_page("incidencias_por_nombre", "incidencias", (nombre,), limit, cursor)
 
 @app.post("/actualizar_estado_incidencia", operation_id="actualizar_estado_incidencia")
 async def actualizar_estado_incidencia(
@@ -179,47 +305,84 @@ async def actualizar_estado_incidencia(
     nuevo_estado: str = Body(..., embed=True)
 ):
     # Buscar el usuario_id usando el DNI
-    result = run_query("SELECT id FROM abonados WHERE dni = ?", (dni,))
+    result = await run_query(queries.ABONADO_ID_POR_DNI, (dni,))
     if not result:
         return {"error": "No se encontró un abonado con el DNI proporcionado."}
     usuario_id = result[0][0]
     # Capitalizar la ubicación para evitar problemas de mayúsculas/minúsculas
     ubicacion = ubicacion.strip().capitalize()
     # Buscar la incidencia por usuario y ubicación
-    incidencia = run_query(
-        "SELECT id FROM incidencias WHERE usuario_id = ? AND ubicacion = ? ORDER BY id DESC LIMIT 1",
-        (usuario_id, ubicacion)
-    )
+    incidencia = await run_query(queries.ULTIMA_INCIDENCIA_EN_UBICACION, (usuario_id, ubicacion))
     if not incidencia:
         return {"error": "No se encontró ninguna incidencia para el abonado en esa ubicación."}
     incidencia_id = incidencia[0][0]
-    run_query(
-        "UPDATE incidencias SET estado = ? WHERE id = ?",
-        (nuevo_estado, incidencia_id),
-        commit=True
-    )
+    await run_query(queries.ACTUALIZAR_ESTADO_INCIDENCIA, (nuevo_estado, incidencia_id), commit=True)
     return {"message": f"Estado de la incidencia {incidencia_id} actualizado a '{nuevo_estado}'"}
 
 @app.post("/incidencias_pendientes", operation_id="incidencias_pendientes")
-async def incidencias_pendientes():
+async def incidencias_pendientes(
+    limit: Optional[int] = Body(None, embed=True),
+    cursor: Optional[str] = Body(None, embed=True)
+):
     # Mostrar solo las incidencias pendientes
-    result = run_query("SELECT ubicacion, descripcion, estado FROM incidencias WHERE estado = 'Pendiente'")
-    return {"incidencias": [{"ubicacion": r[0], "descripcion": r[1], "estado": r[2]} for r in result]}
+    return await list_page("incidencias_pendientes", "incidencias", (), limit, cursor)
 
 @app.post("/incidencias_por_ubicacion", operation_id="incidencias_por_ubicacion")
-async def incidencias_por_ubicacion(ubicacion: str = Body(..., embed=True)):
+async def incidencias_por_ubicacion(
+    ubicacion: str = Body(..., embed=True),
+    limit: Optional[int] = Body(None, embed=True),
+    cursor: Optional[str] = Body(None, embed=True)
+):
     # Capitalizar solo la primera letra
-    ubicacion = ubicacion.capitalize()
-    result = run_query(
-        "SELECT ubicacion, descripcion, estado FROM incidencias WHERE ubicacion = ?",
-        (ubicacion,)
-    )
-    return {"incidencias": [{"ubicacion": r[0], "descripcion": r[1], "estado": r[2]} for r in result]}
+    return await list_page("incidencias_por_ubicacion", "incidencias", (ubicacion.capitalize(),), limit, cursor)
+
+# === EXPORTACIÓN NDJSON DE LISTADOS COMPLETOS ===
+
+@app.get("/export/todas_las_facturas", operation_id="export_todas_las_facturas")
+async def export_todas_las_facturas(dni: str, cursor: Optional[str] = None):
+    return stream_listing("todas_las_facturas", (dni,), cursor)
+
+@app.get("/export/incidencias_pendientes", operation_id="export_incidencias_pendientes")
+async def export_incidencias_pendientes(cursor: Optional[str] = None):
+    return stream_listing("incidencias_pendientes", (), cursor)
+
+@app.get("/export/incidencias_por_ubicacion", operation_id="export_incidencias_por_ubicacion")
+async def export_incidencias_por_ubicacion(ubicacion: str, cursor: Optional[str] = None):
+    return stream_listing("incidencias_por_ubicacion", (ubicacion.capitalize(),), cursor)
+
+@app.get("/export/incidencias_por_nombre", operation_id="export_incidencias_por_nombre")
+async def export_incidencias_por_nombre(nombre: str, cursor: Optional[str] = None):
+    return stream_listing("incidencias_por_nombre", (nombre,), cursor)
 
 @app.post("/weather_foo", operation_id="weather_foo")
 async def weather_foo(direccion: str = Body(..., embed=True)):
     return {"Clima": f"35 grados despejado en {direccion}"}
 
+class BatchCall(BaseModel):
+    tool: str
+    args: dict = {}
+
+@app.post("/batch", operation_id="batch")
+async def batch(calls: List[BatchCall] = Body(..., embed=True)):
+    """
+    Ejecuta varias herramientas en una sola petición, con una conexión y una transacción.
+    Cada elemento es independiente: corre en su propio SAVEPOINT, así que si falla se deshacen
+    solo sus escrituras (y se devuelve su error) y las del resto se confirman al final.
+    """
+    if not hasattr(app.state, "invokers"):
+        app.state.invokers = build_invokers(app, exclude=("batch",))
+    results = []
+    async with db_pool.transaction():
+        for call in calls:
+            try:
+                async with db_pool.savepoint():
+                    response = await invoke(app.state.invokers, call.tool, call.args)
+                results.append({"tool": call.tool, "response": response})
+            except Exception as e:
+                logging.warning(f"Error en /batch para {call.tool}: {e}")
+                results.append({"tool": call.tool, "error": str(e)})
+    return {"results": results}
+
 @app.get("/herramientas_disponibles", operation_id="herramientas_disponibles")
 async def herramientas_disponibles():
     return [
@@ -229,13 +392,16 @@ async def herramientas_disponibles():
         {"endpoint": "/ultimo_pago", "descripcion": "Obtiene el último pago realizado por un abonado por DNI."},
         {"endpoint": "/deuda_total", "descripcion": "Calcula la deuda total de un abonado por DNI."},
         {"endpoint": "/facturas_pendientes", "descripcion": "Lista las facturas pendientes de un abonado por DNI."},
-        {"endpoint": "/todas_las_facturas", "descripcion": "Muestra todas las facturas de un abonado por DNI."},
+        {"endpoint": "/todas_las_facturas", "descripcion": "Muestra las facturas de un abonado por DNI, paginadas (limit + cursor)."},
         {"endpoint": "/datos_abonado", "descripcion": "Obtiene los datos completos de un abonado por DNI o póliza."},
+        {"endpoint": "/resumen_abonado", "descripcion": "Obtiene en una sola consulta datos, deuda, facturas pendientes, último pago e incidencias de un abonado."},
         {"endpoint": "/crear_incidencia", "descripcion": "Crea una nueva incidencia para un abonado por DNI."},
         {"endpoint": "/incidencias_por_dni", "descripcion": "Consulta las incidencias asociadas a un abonado por DNI."},
-        {"endpoint": "/incidencias_por_nombre", "descripcion": "Consulta las incidencias registradas por nombre de usuario."},
-        {"endpoint": "/incidencias_por_ubicacion", "descripcion": "Consulta todas las incidencias registradas en una ubicación específica."},
+        {"endpoint": "/incidencias_por_nombre", "descripcion": "Consulta las incidencias registradas por nombre de usuario, paginadas (limit + cursor)."},
+        {"endpoint": "/incidencias_por_ubicacion", "descripcion": "Consulta las incidencias registradas en una ubicación específica, paginadas (limit + cursor)."},
         {"endpoint": "/actualizar_estado_incidencia", "descripcion": "Actualiza el estado de una incidencia por ID."},
-        {"endpoint": "/incidencias_pendientes", "descripcion": "Muestra todas las incidencias pendientes."},
-        {"endpoint": "/weather_foo", "descripcion": "Devuelve un clima simulado para una dirección."}
+        {"endpoint": "/incidencias_pendientes", "descripcion": "Muestra las incidencias pendientes, paginadas (limit + cursor)."},
+        {"endpoint": "/weather_foo", "descripcion": "Devuelve un clima simulado para una dirección."},
+        {"endpoint": "/batch", "descripcion": "Ejecuta varias herramientas en una sola petición."},
+        {"endpoint": "/export/<listado>", "descripcion": "GET: exporta completo en NDJSON uno de los listados paginados."}
     ]
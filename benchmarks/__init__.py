@@ -0,0 +1 @@
+# This file marks the benchmarks folder as a Python package.
@@ -0,0 +1,281 @@
+"""
+Sustituto local y determinista de la API de chat completions de Groq para benchmarks y
+pruebas de carga sin red.
+
+- `FakeChatModel` decide la respuesta: nombre de agente para el router, tool_calls cuando la
+  petición trae herramientas y un texto fijo en el resto de casos.
+- `FakeGroq` imita a `AsyncGroq` (`client.chat.completions.create`, con y sin `stream=True`)
+  devolviendo los tipos del SDK de groq.
+- `app` expone el mismo modelo como servidor HTTP compatible con la API de Groq, para arrancar
+  agent_server con `GROQ_BASE_URL=http://127.0.0.1:8100`:
+
+    python -m uvicorn benchmarks.fake_groq:app --port 8100
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+from types import SimpleNamespace
+import groq
+import httpx
+from groq.types.chat import ChatCompletion, ChatCompletionChunk
+from agent.tools.local_router import fold_text
+from agent.tools.llm_scheduler import ScheduledLLMClient, get_llm_scheduler
+
+FAKE_GROQ_LATENCY_MS = float(os.getenv("FAKE_GROQ_LATENCY_MS", "0"))
+FAKE_GROQ_JITTER_MS = float(os.getenv("FAKE_GROQ_JITTER_MS", "0"))
+# Fracción de llamadas que responden 429 (para probar reintentos y colas) y su retry-after
+FAKE_GROQ_429_RATE = float(os.getenv("FAKE_GROQ_429_RATE", "0"))
+FAKE_GROQ_RETRY_AFTER = float(os.getenv("FAKE_GROQ_RETRY_AFTER", "0.2"))
+
+# Palabras clave -> agente que devuelve el router simulado (primera coincidencia)
+ROUTING_RULES = [
+    (("factur", "deuda", "pago", "debo", "resumen"), "factura_agent"),
+    (("incidenc", "averia", "avería", "fuga", "corte"), "incidencia_agent"),
+    (("tiempo", "clima", "weather"), "weather_foo_agent"),
+    (("datos", "direcci", "existe", "telefono", "teléfono", "abonado"), "datos_agent"),
+]
+CHAT_REPLY = "Respuesta simulada."
+# Valores de ejemplo para argumentos obligatorios que no son entidades detectables por patrón
+DEFAULT_ARGS = {
+    "ubicacion": "Madrid",
+    "descripcion": "Incidencia de prueba",
+    "nuevo_estado": "Resuelto",
+    "nombre": "ana",
+    "direccion": "Madrid",
+}
+_ENTITIES_PREFIX = "Entidades detectadas: "
+# Lugares: palabras con mayúscula inicial que no empiezan la frase
+_CAPITALIZED = re.compile(r"(?<=[a-záéíóúñ,] )([A-ZÁÉÍÓÚ][a-záéíóúñ]{2,})")
+_WORD = re.compile(r"\w+")
+_USERNAME = re.compile(r"usuario\s+(\w+)", re.IGNORECASE)
+# Prefijos que aparecen en casi todas las herramientas y no ayudan a elegir
+_COMMON_TERMS = {"abon"}
+
+class FakeChatModel:
+    """
+    Genera respuestas deterministas (mismo mensaje -> misma respuesta) con latencia configurable.
+    """
+    def __init__(self, latency_ms=FAKE_GROQ_LATENCY_MS, jitter_ms=FAKE_GROQ_JITTER_MS, seed=0,
+                 rate_limit_rate=FAKE_GROQ_429_RATE, retry_after=FAKE_GROQ_RETRY_AFTER):
+        """
+        Args:
+            latency_ms (float): Latencia base simulada por llamada.
+            jitter_ms (float): Variación máxima (uniforme) sumada a la latencia.
+            seed (int): Semilla del generador de la variación.
+            rate_limit_rate (float): Fracción de llamadas que se rechazan con un 429.
+            retry_after (float): Segundos de `retry-after` de los 429 simulados.
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.rate_limited = 0
+
+    def should_rate_limit(self):
+        if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            self.rate_limited += 1
+            return True
+        return False
+
+    async def wait(self):
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def complete(self, request):
+        """
+        Construye la respuesta a una petición de chat completions.
+        Args:
+            request (dict): Cuerpo de la petición (model, messages, tools, ...).
+        Returns:
+            dict: Respuesta con la forma JSON de la API (sin streaming).
+        """
+        self.calls += 1
+        messages = request.get("messages") or []
+        user_input = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        tools = request.get("tools") or []
+        message = {"role": "assistant", "content": None}
+        if tools:
+            message["tool_calls"] = self._tool_calls(user_input, messages, tools)
+            finish_reason = "tool_calls"
+        elif request.get("max_completion_tokens") == 10:
+            message["content"] = self._route(user_input)
+            finish_reason = "stop"
+        else:
+            message["content"] = CHAT_REPLY
+            finish_reason = "stop"
+        prompt_tokens = sum(len((m.get("content") or "").split()) for m in messages) + len(json.dumps(tools)) // 4
+        completion_tokens = len((message["content"] or json.dumps(message.get("tool_calls"))).split())
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _route(self, user_input):
+        text = user_input.lower()
+        for keywords, agent in ROUTING_RULES:
+            if any(k in text for k in keywords):
+                return agent
+        return "ninguno"
+
+    def _tool_calls(self, user_input, messages, tools):
+        entidades = {}
+        for m in messages:
+            content = m.get("content") or ""
+            if m.get("role") == "system" and content.startswith(_ENTITIES_PREFIX):
+                entidades = json.loads(content[len(_ENTITIES_PREFIX):])
+        tool = max(tools, key=lambda t: self._score(t["function"], user_input, entidades))["function"]
+        params = tool.get("parameters") or {}
+        capitalized = _CAPITALIZED.findall(user_input)
+        args = {}
+        for name in params.get("required", []):
+            if name in entidades:
+                args[name] = entidades[name]
+            elif name in ("ubicacion", "direccion") and capitalized:
+                args[name] = capitalized[-1]
+            elif name == "nombre" and _USERNAME.search(user_input):
+                args[name] = _USERNAME.search(user_input).group(1)
+            else:
+                args[name] = DEFAULT_ARGS.get(name, "")
+        # Herramientas sin obligatorios que aceptan dni/póliza (datos_abonado, resumen_abonado)
+        for name in ("dni", "poliza"):
+            if name in params.get("properties", {}) and name in entidades and not args:
+                args[name] = entidades[name]
+        return [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": tool["name"], "arguments": json.dumps(args, ensure_ascii=False)},
+        }]
+
+    def _score(self, tool, user_input, entidades):
+        """
+        Puntúa una herramienta: términos en común con el mensaje (prefijos de 4 letras, más uno si
+        pide un lugar y el mensaje lo nombra) y, a igualdad, la que necesita menos argumentos
+        inventados. Con empate gana la primera.
+        """
+        words = {w[:4] for w in _WORD.findall(fold_text(user_input)) if len(w) > 3}
+        terms = {w[:4] for w in _WORD.findall(fold_text(f"{tool['name'].replace('_', ' ')} {tool.get('description', '')}")) if len(w) > 3}
+        has_place = bool(_CAPITALIZED.findall(user_input))
+        required = (tool.get("parameters") or {}).get("required", [])
+        place = has_place and any(a in ("ubicacion", "direccion") for a in required)
+        missing = [a for a in required if a not in entidades and not (a in ("ubicacion", "direccion") and has_place)]
+        return (len((words & terms) - _COMMON_TERMS) + place, -len(missing))
+
+    def chunks(self, response, size=4):
+        """
+        Trocea una respuesta completa en los chunks que enviaría la API con `stream=True`.
+        Returns:
+            list: Chunks con la forma JSON de la API.
+        """
+        message = response["choices"][0]["message"]
+        base = {"id": response["id"], "object": "chat.completion.chunk", "created": response["created"], "model": response["model"]}
+        def chunk(delta, finish_reason=None):
+            return dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}])
+        out = [chunk({"role": "assistant", "content": ""})]
+        content = message.get("content") or ""
+        words = re.findall(r"\S+\s*", content)
+        for i in range(0, len(words), size):
+            out.append(chunk({"content": "".join(words[i:i + size])}))
+        for index, call in enumerate(message.get("tool_calls") or []):
+            out.append(chunk({"tool_calls": [dict(call, index=index)]}))
+        out.append(chunk({}, response["choices"][0]["finish_reason"]))
+        return out
+
+class _FakeCompletions:
+    def __init__(self, model):
+        self.model = model
+
+    async def create(self, stream=False, **request):
+        await self.model.wait()
+        if self.model.should_rate_limit():
+            raise _rate_limit_error(self.model.retry_after)
+        response = self.model.complete(request)
+        if stream:
+            return self._stream(response)
+        return ChatCompletion.model_validate(response)
+
+    async def _stream(self, response):
+        for chunk in self.model.chunks(response):
+            yield ChatCompletionChunk.model_validate(chunk)
+
+def _rate_limit_error(retry_after):
+    response = httpx.Response(
+        429, headers={"retry-after": str(retry_after)},
+        request=httpx.Request("POST", "http://fake-groq/openai/v1/chat/completions"),
+    )
+    return groq.RateLimitError("Rate limit reached (simulado)", response=response, body=None)
+
+class FakeGroq:
+    """
+    Cliente con la misma interfaz que `AsyncGroq` para lo que usa el agente.
+    """
+    def __init__(self, model=None, **kwargs):
+        """
+        Args:
+            model (FakeChatModel, opcional): Modelo simulado; si no se da se crea con `kwargs`.
+        """
+        self.model = model if model is not None else FakeChatModel(**kwargs)
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self.model))
+
+def install_fake_groq(orchestrator, agents, client=None, scheduled=True):
+    """
+    Sustituye el cliente de Groq del orquestador y de los agentes por un FakeGroq compartido.
+    Args:
+        scheduled (bool): Pasar las llamadas por el planificador compartido (colas, cuotas y
+            reintentos), como las del cliente real.
+    Returns:
+        FakeGroq: Cliente instalado.
+    """
+    client = client if client is not None else FakeGroq()
+    installed = ScheduledLLMClient(client, get_llm_scheduler()) if scheduled else client
+    orchestrator.client = installed
+    for agent in agents:
+        agent.client = installed
+    return client
+
+def _build_app():
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, StreamingResponse
+
+    app = FastAPI()
+    model = FakeChatModel()
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await model.wait()
+        if model.should_rate_limit():
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (simulado)", "type": "tokens", "code": "rate_limit_exceeded"}},
+                status_code=429, headers={"retry-after": str(model.retry_after)},
+            )
+        response = model.complete(body)
+        if not body.get("stream"):
+            return response
+        async def events():
+            for chunk in model.chunks(response):
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": model.calls, "rate_limited": model.rate_limited, "latency_ms": model.latency_ms, "jitter_ms": model.jitter_ms}
+
+    return app
+
+app = _build_app()
@@ -0,0 +1,148 @@
+"""
+Generador de una demo.db sintética con N abonados, sus facturas, usuarios e incidencias.
+
+La distribución imita datos reales: pocos abonados concentran muchas facturas e incidencias
+(ley de Zipf), la mayoría de facturas están pagadas y las incidencias se concentran en unas
+pocas ubicaciones. Con la misma semilla se genera siempre la misma base de datos.
+
+Uso:
+    python -m benchmarks.generate_db --abonados 10000 --db /tmp/bench.db
+    python -m benchmarks.generate_db --abonados 500 --replace     # sobrescribe backend/demo.db
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+from backend.migrations import DB_PATH, migrate
+
+SCHEMA = [
+    "CREATE TABLE abonados (id INTEGER PRIMARY KEY, nombre TEXT, dni TEXT, direccion TEXT, email TEXT, telefono TEXT, poliza TEXT)",
+    "CREATE TABLE facturas (id INTEGER PRIMARY KEY, dni_abonado TEXT, fecha TEXT, estado TEXT, importe REAL)",
+    "CREATE TABLE usuarios (id INTEGER PRIMARY KEY, username TEXT)",
+    "CREATE TABLE incidencias (id INTEGER PRIMARY KEY, usuario_id INTEGER, ubicacion TEXT, descripcion TEXT, estado TEXT)",
+]
+TABLES = ("abonados", "facturas", "usuarios", "incidencias")
+
+NOMBRES = ["Ana", "Juan", "María", "José", "Lucía", "Carlos", "Elena", "Pablo", "Sara", "Javier", "Laura", "Miguel"]
+APELLIDOS = ["García", "López", "Martínez", "Sánchez", "Pérez", "Gómez", "Ruiz", "Díaz", "Moreno", "Álvarez"]
+CALLES = ["Mayor", "Sol", "Luna", "Real", "Nueva", "Iglesia", "Estación", "Mar", "Río", "Castillo"]
+# Ubicaciones de incidencias, de más a menos frecuente
+UBICACIONES = ["Madrid", "Barcelona", "Valencia", "Sevilla", "Zaragoza", "Málaga", "Murcia", "Bilbao", "Albacete", "Alicante", "Córdoba", "Valladolid"]
+DESCRIPCIONES = ["Fuga de agua", "Corte de suministro", "Baja presión", "Contador averiado", "Agua turbia", "Factura incorrecta"]
+# (estado, peso)
+ESTADOS_FACTURA = [("Pagado", 0.75), ("Pendiente", 0.2), ("Vencido", 0.05)]
+ESTADOS_INCIDENCIA = [("Resuelto", 0.5), ("Pendiente", 0.3), ("Abierto", 0.2)]
+DNI_LETTERS = "TRWAGMYFPDXBNJZSQVHLCKE"
+
+def dni_for(number):
+    """
+    DNI con letra de control válida para un número de 8 cifras.
+    """
+    return f"{number:08d}{DNI_LETTERS[number % 23]}"
+
+def zipf_counts(rng, n, mean, exponent=1.1, cap=None):
+    """
+    Reparte aproximadamente `n * mean` elementos entre `n` dueños siguiendo una ley de Zipf.
+    Returns:
+        list: Número de elementos de cada dueño (en orden aleatorio).
+    """
+    weights = [1 / (rank ** exponent) for rank in range(1, n + 1)]
+    scale = n * mean / sum(weights)
+    counts = [int(w * scale + rng.random()) for w in weights]
+    if cap is not None:
+        counts = [min(c, cap) for c in counts]
+    rng.shuffle(counts)
+    return counts
+
+def _choice(rng, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights)[0]
+
+def generate(db_path, abonados=1000, facturas_por_abonado=12, incidencias_por_abonado=0.5, seed=42, replace=False):
+    """
+    Crea (o rellena) la base de datos con datos sintéticos y aplica las migraciones.
+    Args:
+        db_path (str): Ruta de la base de datos.
+        abonados (int): Número de abonados (y de usuarios).
+        facturas_por_abonado (float): Media de facturas por abonado.
+        incidencias_por_abonado (float): Media de incidencias por abonado.
+        seed (int): Semilla; la misma semilla genera los mismos datos.
+        replace (bool): Borra las tablas existentes; si es False y ya existen, se lanza un error.
+    Returns:
+        dict: Número de filas generadas por tabla y los DNI de ejemplo (más y menos activos).
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if existing & set(TABLES):
+            if not replace:
+                raise FileExistsError(f"{db_path} ya tiene datos; usa replace=True (--replace) para sobrescribirlos")
+            for table in TABLES:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute("PRAGMA user_version = 0")
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+        numbers = rng.sample(range(10_000_000, 99_999_999), abonados)
+        dnis = [dni_for(n) for n in numbers]
+        abonado_rows = []
+        for i, dni in enumerate(dnis, start=1):
+            nombre = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}"
+            # El patrón de póliza admite POL + 3 cifras: solo los primeros 1000 abonados la tienen "válida"
+            poliza = f"POL{i:03d}" if i < 1000 else f"POL{i:06d}"
+            abonado_rows.append((
+                i, nombre, dni, f"Calle {rng.choice(CALLES)} {rng.randint(1, 200)}",
+                f"abonado{i}@example.com", f"6{rng.randint(0, 99_999_999):08d}", poliza,
+            ))
+        conn.executemany("INSERT INTO abonados VALUES (?, ?, ?, ?, ?, ?, ?)", abonado_rows)
+        conn.executemany("INSERT INTO usuarios VALUES (?, ?)", [(i, f"usuario{i}") for i in range(1, abonados + 1)])
+
+        start = date(2020, 1, 1)
+        factura_rows = []
+        for dni, count in zip(dnis, zipf_counts(rng, abonados, facturas_por_abonado, cap=240)):
+            for _ in range(count):
+                fecha = start + timedelta(days=rng.randint(0, 5 * 365))
+                importe = round(rng.lognormvariate(3.5, 0.6), 2)
+                factura_rows.append((dni, fecha.isoformat(), _choice(rng, ESTADOS_FACTURA), importe))
+        conn.executemany("INSERT INTO facturas (dni_abonado, fecha, estado, importe) VALUES (?, ?, ?, ?)", factura_rows)
+
+        ubicaciones = [(u, 1 / rank) for rank, u in enumerate(UBICACIONES, start=1)]
+        incidencia_rows = []
+        for usuario_id, count in enumerate(zipf_counts(rng, abonados, incidencias_por_abonado, cap=50), start=1):
+            for _ in range(count):
+                incidencia_rows.append((usuario_id, _choice(rng, ubicaciones), rng.choice(DESCRIPCIONES), _choice(rng, ESTADOS_INCIDENCIA)))
+        conn.executemany("INSERT INTO incidencias (usuario_id, ubicacion, descripcion, estado) VALUES (?, ?, ?, ?)", incidencia_rows)
+        conn.commit()
+    finally:
+        conn.close()
+    migrate(db_path)
+
+    por_dni = {}
+    for dni, *_ in factura_rows:
+        por_dni[dni] = por_dni.get(dni, 0) + 1
+    ranked = sorted(dnis, key=lambda d: por_dni.get(d, 0))
+    return {
+        "abonados": abonados,
+        "facturas": len(factura_rows),
+        "usuarios": abonados,
+        "incidencias": len(incidencia_rows),
+        "dni_mas_facturas": ranked[-1],
+        "dni_mediano": ranked[len(ranked) // 2],
+        "dni_sin_facturas": ranked[0],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una demo.db sintética para benchmarks.")
+    parser.add_argument("--db", default=DB_PATH, help="Ruta de la base de datos (por defecto backend/demo.db)")
+    parser.add_argument("--abonados", type=int, default=1000)
+    parser.add_argument("--facturas", type=float, default=12, help="Media de facturas por abonado")
+    parser.add_argument("--incidencias", type=float, default=0.5, help="Media de incidencias por abonado")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--replace", action="store_true", help="Sobrescribe las tablas si ya existen")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    summary = generate(args.db, args.abonados, args.facturas, args.incidencias, args.seed, args.replace)
+    print(f"{os.path.abspath(args.db)}: {summary}")
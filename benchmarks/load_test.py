@@ -0,0 +1,325 @@
+"""
+Prueba de carga de extremo a extremo sobre `/api/chat` de agent_server.
+
+N usuarios simulados concurrentes ejecutan conversaciones de varios turnos (roles cliente,
+soporte y admin, con referencias como "este abonado") o reproducen conversaciones grabadas en
+un JSONL. Se informa del throughput, latencias p50/p95/p99, tasa de errores y desglose por
+etapa (a partir de `/metrics`). Con varios niveles de usuarios (`--users 1,10,50`) se ve dónde
+se satura el despliegue.
+
+Dos modos:
+- `--inprocess` (por defecto si no se da `--url`): agent_server, el backend y un Groq simulado en
+  el mismo proceso, sobre una base de datos sintética temporal. No necesita red.
+- `--url http://127.0.0.1:8001`: contra servidores ya arrancados. Para no gastar cuota de Groq,
+  arranca agent_server con `GROQ_BASE_URL` apuntando a `python -m uvicorn benchmarks.fake_groq:app --port 8100`.
+
+Uso:
+    python -m benchmarks.load_test --users 1,10,50 --duration 20
+    python -m benchmarks.load_test --url http://127.0.0.1:8001 --db backend/demo.db --users 20
+    python -m benchmarks.load_test --replay conversaciones.jsonl --users 10 --out load.json
+
+Formato de `--replay`: una línea JSON por turno con `message` (o `body`/`title`) y, opcionalmente,
+`session` (o `session_id`/`request_id`) para agrupar turnos en conversaciones y `role`.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from benchmarks.stats import summarize
+
+ROLES = ("cliente", "soporte", "admin")
+CIUDADES = ("Madrid", "Valencia", "Sevilla", "Bilbao", "Zaragoza")
+# Conversaciones de varios turnos por rol: el primer turno nombra el DNI y los siguientes lo referencian
+SCRIPTS = {
+    "cliente": [
+        ["¿Cuál es la deuda total del abonado {dni}?", "¿Y cuándo fue el último pago de este abonado?", "Dame las facturas pendientes de este abonado"],
+        ["Dame un resumen completo del abonado {dni}", "¿Qué tiempo hace en {ciudad}?"],
+    ],
+    "soporte": [
+        ["¿Qué incidencias tiene el abonado {dni}?", "Crea una incidencia en {ciudad} para este abonado: fuga de agua", "¿Qué incidencias hay en {ciudad}?"],
+        ["Muestra las incidencias pendientes", "Actualiza el estado de la incidencia de este abonado {dni} en {ciudad} a Resuelto"],
+    ],
+    "admin": [
+        ["Dame los datos del abonado {dni}", "¿Cuál es la dirección de este abonado?", "¿Existe el abonado {dni}?"],
+        ["Hola, ¿qué puedes hacer?", "Dame todas las facturas del abonado {dni}"],
+    ],
+}
+_METRIC_LINE = re.compile(r'^(\w+)_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+def load_replay(path):
+    """
+    Lee conversaciones grabadas de un JSONL.
+    Returns:
+        list: Conversaciones como (rol, [mensajes]) en el orden del fichero.
+    """
+    conversations = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for n, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            message = item.get("message") or item.get("body") or item.get("title")
+            if not message:
+                continue
+            key = item.get("session") or item.get("session_id") or item.get("request_id") or f"linea-{n}"
+            role, messages = conversations.setdefault(key, (item.get("role", "admin"), []))
+            messages.append(message)
+    return list(conversations.values())
+
+def sample_dnis(db_path, limit=500):
+    """
+    DNI reales de la base de datos, para que las consultas encuentren abonados.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        return [r[0] for r in conn.execute("SELECT dni FROM abonados ORDER BY random() LIMIT ?", (limit,))]
+    finally:
+        conn.close()
+
+def parse_stage_metrics(text):
+    """
+    Extrae de un /metrics las sumas y cuentas de `<servicio>_stage_duration_seconds`.
+    Returns:
+        dict: "servicio:etapa" -> {"sum": segundos, "count": n}.
+    """
+    stages = defaultdict(lambda: {"sum": 0.0, "count": 0})
+    for line in text.splitlines():
+        match = _METRIC_LINE.match(line)
+        if match and match.group(1).endswith("_stage_duration_seconds"):
+            service = match.group(1)[: -len("_stage_duration_seconds")]
+            stages[f"{service}:{match.group(3)}"][match.group(2)] += float(match.group(4))
+    return stages
+
+def stage_breakdown(before, after):
+    """
+    Diferencia entre dos lecturas de /metrics: veces y media por etapa durante la prueba.
+    """
+    out = {}
+    for stage, end in after.items():
+        start = before.get(stage, {"sum": 0.0, "count": 0})
+        count = int(end["count"] - start["count"])
+        if count:
+            out[stage] = {"count": count, "mean_ms": round((end["sum"] - start["sum"]) / count * 1000, 3)}
+    return dict(sorted(out.items(), key=lambda item: -item[1]["mean_ms"] * item[1]["count"]))
+
+class LoadTest:
+    """
+    Lanza usuarios simulados contra /api/chat y acumula las latencias de cada turno.
+    """
+    def __init__(self, clients, conversations, think_time=0.0, seed=0):
+        """
+        Args:
+            clients (list): (httpx.AsyncClient, ruta de /metrics) por servidor; el primero es agent_server.
+            conversations (iterable): Generador infinito de (rol, [mensajes]).
+            think_time (float): Pausa máxima (segundos, aleatoria) entre turnos de un usuario.
+            seed (int): Semilla de las pausas.
+        """
+        self.clients = clients
+        self.conversations = conversations
+        self.think_time = think_time
+        self._random = random.Random(seed)
+
+    async def _scrape(self):
+        stages = {}
+        for client, path in self.clients:
+            try:
+                r = await client.get(path)
+                stages.update(parse_stage_metrics(r.text))
+            except Exception:
+                pass
+        return stages
+
+    async def _user(self, deadline, turns, samples):
+        client = self.clients[0][0]
+        done = 0
+        while time.perf_counter() < deadline and (turns is None or done < turns):
+            role, messages = next(self.conversations)
+            session_id = None
+            for message in messages:
+                if time.perf_counter() >= deadline or (turns is not None and done >= turns):
+                    break
+                start = time.perf_counter()
+                error = None
+                try:
+                    r = await client.post("/api/chat", json={"message": message, "role": role, "session_id": session_id})
+                    if r.status_code != 200:
+                        error = f"HTTP {r.status_code}"
+                    else:
+                        data = r.json()
+                        session_id = data.get("session_id", session_id)
+                        reply = data.get("reply") or ""
+                        if reply.startswith("❌") or '"type": "error"' in reply:
+                            error = "respuesta de error"
+                except Exception as e:
+                    error = type(e).__name__
+                samples.append((role, time.perf_counter() - start, error))
+                done += 1
+                if self.think_time:
+                    await asyncio.sleep(self._random.uniform(0, self.think_time))
+
+    async def run(self, users, duration, turns=None):
+        """
+        Ejecuta un nivel de carga.
+        Args:
+            users (int): Usuarios concurrentes.
+            duration (float): Segundos máximos de la prueba.
+            turns (int, opcional): Turnos máximos por usuario.
+        Returns:
+            dict: Throughput, latencias, errores (total y por tipo), resultados por rol y desglose por etapa.
+        """
+        before = await self._scrape()
+        samples = []
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(self._user(deadline, turns, samples) for _ in range(users)))
+        elapsed = time.perf_counter() - started
+        after = await self._scrape()
+        errors = defaultdict(int)
+        by_role = defaultdict(list)
+        for role, seconds, error in samples:
+            by_role[role].append(seconds)
+            if error:
+                errors[error] += 1
+        total = len(samples)
+        return {
+            "users": users,
+            "requests": total,
+            "duration_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(sum(errors.values()) / total, 4) if total else 0.0,
+            "errors": dict(errors),
+            "latency": summarize([s for _, s, _ in samples]),
+            "by_role": {role: summarize(values) for role, values in sorted(by_role.items())},
+            "stages": stage_breakdown(before, after),
+        }
+
+def scripted_conversations(dnis, roles, seed=0):
+    """
+    Generador infinito de conversaciones de SCRIPTS con DNI y ciudades aleatorios.
+    """
+    rng = random.Random(seed)
+    while True:
+        role = rng.choice(roles)
+        script = rng.choice(SCRIPTS[role])
+        values = {"dni": rng.choice(dnis), "ciudad": rng.choice(CIUDADES)}
+        yield role, [m.format(**values) for m in script]
+
+def _inprocess_app(abonados, seed):
+    # La configuración se lee al importar: base de datos temporal, backend en proceso y Groq simulado
+    from benchmarks.generate_db import generate
+    tmp = tempfile.mkdtemp(prefix="agente-load-")
+    db_path = os.path.join(tmp, "load.db")
+    generate(db_path, abonados=abonados, seed=seed)
+    os.environ["BACKEND_DB_PATH"] = db_path
+    os.environ["TOOL_TRANSPORT"] = "inprocess"
+    os.environ.setdefault("GROQ_API_KEY", "offline-load-test")
+    import agent.agent as A
+    import agent_server
+    return agent_server.app, A, db_path
+
+def main(argv=None):
+    import httpx
+    import logging
+    from benchmarks.fake_groq import FakeGroq, install_fake_groq
+
+    parser = argparse.ArgumentParser(description="Prueba de carga de /api/chat.")
+    parser.add_argument("--url", help="URL de agent_server; sin ella todo corre en proceso")
+    parser.add_argument("--backend-url", help="URL del backend, para incluir sus etapas en el desglose")
+    parser.add_argument("--db", help="Base de datos de la que tomar DNI existentes (modo --url)")
+    parser.add_argument("--users", default="10", help="Usuarios concurrentes; varios niveles separados por comas")
+    parser.add_argument("--duration", type=float, default=10.0, help="Segundos por nivel")
+    parser.add_argument("--turns", type=int, help="Turnos máximos por usuario y nivel")
+    parser.add_argument("--roles", default=",".join(ROLES), help="Roles simulados")
+    parser.add_argument("--replay", help="JSONL con conversaciones a reproducir en lugar de los guiones")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pausa máxima entre turnos (segundos)")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Latencia de Groq simulada (modo en proceso)")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Variación de la latencia simulada (modo en proceso)")
+    parser.add_argument("--abonados", type=int, default=2000, help="Abonados de la base sintética (modo en proceso)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por petición (segundos)")
+    parser.add_argument("--lane", choices=["interactive", "batch"], default="interactive", help="Carril de prioridad de las llamadas al modelo (cabecera X-Priority)")
+    parser.add_argument("--out", help="Fichero JSON de resultados")
+    args = parser.parse_args(argv)
+
+    levels = [int(u) for u in args.users.split(",")]
+    roles = [r.strip() for r in args.roles.split(",") if r.strip() in SCRIPTS]
+    if args.url:
+        app = None
+        db_path = args.db
+    else:
+        app, A, db_path = _inprocess_app(args.abonados, args.seed)
+        logging.getLogger().setLevel(logging.WARNING)
+        install_fake_groq(A.orchestrator, A.agents, FakeGroq(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed))
+    dnis = sample_dnis(db_path) if db_path and os.path.exists(db_path) else ["12345678A", "87654321B"]
+
+    if args.replay:
+        recorded = load_replay(args.replay)
+        if not recorded:
+            parser.error(f"{args.replay} no contiene conversaciones")
+        conversations = itertools.cycle(recorded)
+    else:
+        conversations = scripted_conversations(dnis, roles, args.seed)
+
+    async def run_levels():
+        limits = httpx.Limits(max_connections=max(levels) * 2, max_keepalive_connections=max(levels))
+        headers = {"X-Priority": args.lane}
+        if app is not None:
+            agent_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://agent", timeout=args.timeout, headers=headers)
+        else:
+            agent_client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout, headers=headers)
+        clients = [(agent_client, "/metrics")]
+        if args.backend_url:
+            clients.append((httpx.AsyncClient(base_url=args.backend_url, timeout=args.timeout), "/metrics"))
+        test = LoadTest(clients, conversations, think_time=args.think_time, seed=args.seed)
+        results = []
+        try:
+            for users in levels:
+                result = await test.run(users, args.duration, args.turns)
+                results.append(result)
+                lat = result["latency"]
+                print(
+                    f"usuarios={users:4d}  rps={result['throughput_rps']:8.2f}  p50={lat.get('p50_ms', 0):9.1f}ms  "
+                    f"p99={lat.get('p99_ms', 0):9.1f}ms  errores={result['error_rate']:.2%}",
+                    file=sys.stderr,
+                )
+        finally:
+            for client, _ in clients:
+                await client.aclose()
+            if app is not None:
+                await A.tool_transport.close()
+        return results
+
+    results = asyncio.run(run_levels())
+    report = {
+        "meta": {
+            "target": args.url or "inprocess",
+            "roles": roles,
+            "replay": args.replay,
+            "duration_s": args.duration,
+            "turns": args.turns,
+            "think_time_s": args.think_time,
+            "lane": args.lane,
+            "groq_latency_ms": None if args.url else args.latency_ms,
+            "groq_jitter_ms": None if args.url else args.jitter_ms,
+        },
+        "levels": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+Benchmarks sin red del agente y del backend. Genera una base de datos sintética temporal,
+sustituye Groq por `FakeGroq` y ejecuta las herramientas en proceso (TOOL_TRANSPORT=inprocess).
+
+- micro: extracción de entidades, router local, validación de argumentos, cada endpoint de
+  backend/server.py y `AgentBase._process_tool_calls` (una y varias herramientas).
+- macro: `Orchestrator.route` y turnos completos de `Orchestrator.responder`.
+
+El resultado es un JSON con p50/p95/p99 por benchmark, comparable entre commits:
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --compare bench.json      # muestra la variación respecto a otra ejecución
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from benchmarks.generate_db import generate
+from benchmarks.stats import measure, measure_async
+
+# Mensajes representativos (se recorren en orden en cada iteración)
+MESSAGES = [
+    "¿Cuál es la deuda total del abonado {dni}?",
+    "Dame las facturas pendientes del DNI {dni}",
+    "¿Cuándo fue el último pago de este abonado?",
+    "Dame los datos del abonado con póliza POL001",
+    "¿Qué incidencias hay en Madrid?",
+    "¿Qué incidencias tiene el usuario usuario7?",
+    "Crea una incidencia en Valencia para {dni}: fuga de agua",
+    "¿Qué tiempo hace en Sevilla?",
+    "Hola, ¿qué puedes hacer?",
+]
+
+def _prepare_environment(db_path):
+    # Debe hacerse antes de importar el agente: la configuración se lee al importar
+    os.environ["BACKEND_DB_PATH"] = db_path
+    os.environ["TOOL_TRANSPORT"] = "inprocess"
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def endpoint_calls(summary):
+    """
+    Llamadas de ejemplo a cada endpoint del backend.
+    Returns:
+        list: (nombre del benchmark, herramienta, argumentos).
+    """
+    dni = summary["dni_mediano"]
+    return [
+        ("existe_abonado", "existe_abonado", {"dni": dni}),
+        ("direccion_abonado", "direccion_abonado", {"dni": dni}),
+        ("estado_pagos", "estado_pagos", {"dni": dni}),
+        ("ultimo_pago", "ultimo_pago", {"dni": dni}),
+        ("deuda_total", "deuda_total", {"dni": dni}),
+        ("facturas_pendientes", "facturas_pendientes", {"dni": dni}),
+        ("todas_las_facturas", "todas_las_facturas", {"dni": dni}),
+        ("todas_las_facturas:abonado_mas_activo", "todas_las_facturas", {"dni": summary["dni_mas_facturas"]}),
+        ("datos_abonado", "datos_abonado", {"dni": dni}),
+        ("datos_abonado:poliza", "datos_abonado", {"poliza": "POL001"}),
+        ("resumen_abonado", "resumen_abonado", {"dni": dni}),
+        ("crear_incidencia", "crear_incidencia", {"dni": dni, "ubicacion": "Madrid", "descripcion": "Benchmark"}),
+        ("incidencias_por_dni", "incidencias_por_dni", {"dni": dni}),
+        ("incidencias_por_nombre", "incidencias_por_nombre", {"nombre": "usuario1"}),
+        ("incidencias_por_ubicacion", "incidencias_por_ubicacion", {"ubicacion": "Madrid"}),
+        ("actualizar_estado_incidencia", "actualizar_estado_incidencia", {"dni": dni, "ubicacion": "Madrid", "nuevo_estado": "Resuelto"}),
+        ("incidencias_pendientes", "incidencias_pendientes", {}),
+        ("weather_foo", "weather_foo", {"direccion": "Madrid"}),
+        ("batch:2_tools", "batch", {"calls": [{"tool": "deuda_total", "args": {"dni": dni}}, {"tool": "ultimo_pago", "args": {"dni": dni}}]}),
+    ]
+
+def _tool_call(name, args):
+    return SimpleNamespace(function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+async def run_micro(A, summary, iterations):
+    from backend.dispatch import invoke
+    results = {}
+    dni = summary["dni_mediano"]
+    messages = [m.format(dni=dni) for m in MESSAGES]
+    engine = A.entity_engine
+    results["entity_extract"] = measure(lambda i: engine.extract(messages[i % len(messages)]), iterations * 10)
+    results["entity_extract_and_resolve"] = measure(
+        lambda i: A.orchestrator._resolve_entities(messages[i % len(messages)], "bench-micro"), iterations * 10
+    )
+    router = A.orchestrator.local_router
+    results["local_router_classify"] = measure(lambda i: router.classify(messages[i % len(messages)]), iterations * 10)
+    registry = A.tool_registry
+    results["tool_args_validation"] = measure(lambda i: registry.validation_error("deuda_total", {"dni": dni}), iterations * 10)
+
+    transport = A.tool_transport
+    await transport.call("existe_abonado", {"dni": dni})  # arranque del backend (migraciones) fuera de la medición
+    for label, tool, args in endpoint_calls(summary):
+        results[f"endpoint:{label}"] = await measure_async(lambda i, t=tool, a=args: invoke(transport.invokers, t, a), iterations)
+
+    agent = next(a for a in A.agents if a.name == "factura_agent")
+    clear_cache = A.tool_cache.cache.clear
+    single = [_tool_call("deuda_total", {"dni": dni})]
+    multi = [_tool_call("deuda_total", {"dni": dni}), _tool_call("ultimo_pago", {"dni": dni}), _tool_call("facturas_pendientes", {"dni": dni})]
+    tools = A.tool_registry.tools_for(agent.name, agent.tools)
+    results["process_tool_calls:1_tool_cold"] = await measure_async(
+        lambda i: agent._process_tool_calls(single, tools, {"dni": dni}), iterations, setup=clear_cache
+    )
+    results["process_tool_calls:3_tools_cold"] = await measure_async(
+        lambda i: agent._process_tool_calls(multi, tools, {"dni": dni}), iterations, setup=clear_cache
+    )
+    results["process_tool_calls:3_tools_cached"] = await measure_async(
+        lambda i: agent._process_tool_calls(multi, tools, {"dni": dni}), iterations
+    )
+    return results
+
+async def run_macro(A, summary, iterations):
+    results = {}
+    dni = summary["dni_mediano"]
+    messages = [m.format(dni=dni) for m in MESSAGES]
+    orchestrator = A.orchestrator
+    results["orchestrator_route:factura_agent"] = await measure_async(
+        lambda i: orchestrator.route(messages[0], {"dni": dni}, agent_name="factura_agent"), iterations,
+        setup=A.tool_cache.cache.clear
+    )
+    results["responder:turn_mix"] = await measure_async(
+        lambda i: orchestrator.responder(messages[i % len(messages)], user_role="admin", session_id=f"bench-{i % 50}"),
+        iterations
+    )
+    results["responder:turn_mix_cold_caches"] = await measure_async(
+        lambda i: orchestrator.responder(messages[i % len(messages)], user_role="admin", session_id=f"bench-cold-{i}"),
+        iterations,
+        setup=lambda: (A.tool_cache.cache.clear(), orchestrator.routing_cache.clear())
+    )
+    return results
+
+def compare(current, baseline_path, threshold):
+    """
+    Imprime la variación de p50/p95 respecto a una ejecución anterior.
+    Returns:
+        list: Benchmarks cuyo p95 ha empeorado más que `threshold` (p.ej. 1.2 = +20%).
+    """
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n{'benchmark':48} {'p50 base':>10} {'p50 ahora':>10} {'p95 ratio':>10}")
+    for name, now in current.items():
+        base = baseline.get(name)
+        if not base or not base.get("p95_ms"):
+            continue
+        ratio = now["p95_ms"] / base["p95_ms"]
+        flag = "  <-- regresión" if ratio > threshold else ""
+        print(f"{name:48} {base['p50_ms']:>10.3f} {now['p50_ms']:>10.3f} {ratio:>10.2f}{flag}")
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks sin red del agente y del backend.")
+    parser.add_argument("--abonados", type=int, default=2000, help="Abonados de la base de datos sintética")
+    parser.add_argument("--iterations", type=int, default=200, help="Iteraciones medidas por benchmark")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia simulada de cada llamada a Groq")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Variación de la latencia simulada")
+    parser.add_argument("--only", choices=["micro", "macro"], help="Ejecuta solo una de las suites")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="Fichero JSON de resultados (por defecto, salida estándar)")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio de p95 a partir del que se marca una regresión")
+    parser.add_argument("--log-level", default="WARNING", help="Nivel de log del agente durante la medición")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="agente-bench-") as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        summary = generate(db_path, abonados=args.abonados, seed=args.seed)
+        _prepare_environment(db_path)
+        import agent.agent as A
+        from benchmarks.fake_groq import FakeGroq, install_fake_groq
+        logging.getLogger().setLevel(args.log_level)
+        install_fake_groq(A.orchestrator, A.agents, FakeGroq(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed))
+
+        async def run_all():
+            results = {}
+            try:
+                if args.only in (None, "micro"):
+                    results.update(await run_micro(A, summary, args.iterations))
+                if args.only in (None, "macro"):
+                    results.update(await run_macro(A, summary, args.iterations))
+            finally:
+                await A.tool_transport.close()
+            return results
+
+        started = time.time()
+        results = asyncio.run(run_all())
+        from backend.server import db_pool
+        db_pool.close()
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": int(started),
+            "duration_s": round(time.time() - started, 2),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "abonados": args.abonados,
+            "iterations": args.iterations,
+            "groq_latency_ms": args.latency_ms,
+            "groq_jitter_ms": args.jitter_ms,
+            "seed": args.seed,
+            "db": {k: v for k, v in summary.items() if not k.startswith("dni_")},
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
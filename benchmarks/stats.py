@@ -0,0 +1,73 @@
+import math
+import time
+
+def percentile(sorted_samples, q):
+    """
+    Percentil `q` (0-100) por interpolación lineal entre las dos muestras más próximas.
+    Args:
+        sorted_samples (list): Muestras ordenadas de menor a mayor.
+        q (float): Percentil.
+    Returns:
+        float: Valor del percentil.
+    """
+    if not sorted_samples:
+        return 0.0
+    pos = (len(sorted_samples) - 1) * q / 100
+    low, high = math.floor(pos), math.ceil(pos)
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (pos - low)
+
+def summarize(samples_seconds):
+    """
+    Resume una lista de duraciones.
+    Args:
+        samples_seconds (list): Duraciones en segundos.
+    Returns:
+        dict: count, mean, min, max, p50, p95 y p99 en milisegundos.
+    """
+    ordered = sorted(s * 1000 for s in samples_seconds)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 4),
+        "min_ms": round(ordered[0], 4),
+        "p50_ms": round(percentile(ordered, 50), 4),
+        "p95_ms": round(percentile(ordered, 95), 4),
+        "p99_ms": round(percentile(ordered, 99), 4),
+        "max_ms": round(ordered[-1], 4),
+    }
+
+def measure(fn, iterations, warmup=5, setup=None):
+    """
+    Mide una función síncrona `iterations` veces tras `warmup` ejecuciones sin medir.
+    Args:
+        fn (callable): Función que recibe el índice de la iteración.
+        iterations (int): Ejecuciones medidas.
+        warmup (int): Ejecuciones previas descartadas.
+        setup (callable, opcional): Se llama antes de cada ejecución, fuera de la medición.
+    Returns:
+        dict: Resumen (ver `summarize`).
+    """
+    samples = []
+    for i in range(warmup + iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn(i)
+        if i >= warmup:
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+async def measure_async(fn, iterations, warmup=5, setup=None):
+    """
+    Igual que `measure` para una corrutina `fn(i)`.
+    """
+    samples = []
+    for i in range(warmup + iterations):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        await fn(i)
+        if i >= warmup:
+            samples.append(time.perf_counter() - start)
+    return summarize(samples)
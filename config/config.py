@@ -7,3 +7,92 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
 ROUTING_MODEL = os.getenv("ROUTING_MODEL", "llama-3.3-70b-versatile")
 SERVER_URL = os.getenv("SERVER_URL", "http://localhost:8000")
+# URL base de la API de Groq (vacía = la oficial); p.ej. benchmarks/fake_groq.py para pruebas de carga
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+# Cliente de Groq compartido por el orquestador y los agentes (un solo pool de conexiones)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_TIMEOUT_SECONDS", "60"))
+LLM_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+# Reintentos del propio SDK; por defecto 0 porque los hace el planificador (LLM_MAX_ATTEMPTS)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "0"))
+
+# Planificador de llamadas a Groq: concurrencia y cuotas por modelo, colas por prioridad y reintentos.
+# LLM_MODEL_LIMITS es un JSON modelo -> {"concurrency", "rpm", "tpm"}, p.ej. las cuotas del plan de Groq:
+# {"llama-3.3-70b-versatile": {"rpm": 30, "tpm": 12000}, "meta-llama/llama-4-scout-17b-16e-instruct": {"rpm": 30, "tpm": 30000}}
+# rpm/tpm = 0 significa sin límite
+LLM_MODEL_LIMITS = os.getenv("LLM_MODEL_LIMITS", "{}")
+LLM_DEFAULT_CONCURRENCY = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "32"))
+LLM_DEFAULT_RPM = float(os.getenv("LLM_DEFAULT_RPM", "0"))
+LLM_DEFAULT_TPM = float(os.getenv("LLM_DEFAULT_TPM", "0"))
+LLM_QUEUE_LIMIT_INTERACTIVE = int(os.getenv("LLM_QUEUE_LIMIT_INTERACTIVE", "200"))
+LLM_QUEUE_LIMIT_BATCH = int(os.getenv("LLM_QUEUE_LIMIT_BATCH", "50"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "20"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "0.5"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "8"))
+LLM_MAX_RATE_WAIT_SECONDS = float(os.getenv("LLM_MAX_RATE_WAIT_SECONDS", "20"))
+
+# Construir el grafo de agentes al crear la aplicación (antes del fork con gunicorn --preload)
+# en lugar de en la primera petición
+AGENT_PRELOAD = os.getenv("AGENT_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+# Almacén de contexto por sesión
+SESSION_CAPACITY = int(os.getenv("SESSION_CAPACITY", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+
+# Router local: confianza mínima para no consultar al ROUTING_MODEL (>1 lo desactiva)
+LOCAL_ROUTER_THRESHOLD = float(os.getenv("LOCAL_ROUTER_THRESHOLD", "0.75"))
+
+# Caché de decisiones de enrutamiento
+ROUTING_CACHE_SIZE = int(os.getenv("ROUTING_CACHE_SIZE", "2048"))
+ROUTING_CACHE_TTL_SECONDS = float(os.getenv("ROUTING_CACHE_TTL_SECONDS", "3600"))
+
+# Caché de resultados de herramientas (el TTL de cada una se define en tools_schema.json)
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "4096"))
+
+# Ejecución concurrente de las herramientas pedidas en un mismo turno
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+TOOL_CALL_TIMEOUT_SECONDS = float(os.getenv("TOOL_CALL_TIMEOUT_SECONDS", "10"))
+# Filas máximas de cada listado en el resultado de una herramienta: los listados paginados se
+# piden con este `limit` y los demás se recortan, con las filas de cada uno en `totals`
+TOOL_RESULT_MAX_ROWS = int(os.getenv("TOOL_RESULT_MAX_ROWS", "20"))
+
+# Transporte de herramientas: "http" (backend remoto) o "inprocess" (backend.server en el mismo proceso)
+TOOL_TRANSPORT = os.getenv("TOOL_TRANSPORT", "http")
+TOOL_HTTP_MAX_CONNECTIONS = int(os.getenv("TOOL_HTTP_MAX_CONNECTIONS", "50"))
+TOOL_HTTP_MAX_KEEPALIVE = int(os.getenv("TOOL_HTTP_MAX_KEEPALIVE", "20"))
+TOOL_HTTP_TIMEOUT_SECONDS = float(os.getenv("TOOL_HTTP_TIMEOUT_SECONDS", "10"))
+TOOL_HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("TOOL_HTTP_CONNECT_TIMEOUT_SECONDS", "2"))
+
+# Errores de formato en argumentos: catálogo local (por defecto) o mensaje redactado por el modelo
+PATTERN_ERROR_USE_LLM = os.getenv("PATTERN_ERROR_USE_LLM", "false").lower() in ("1", "true", "yes")
+ERROR_LOCALE = os.getenv("ERROR_LOCALE", "es")
+
+# Presupuesto de prompt: máximo de tokens de entrada por llamada (0 = sin límite), filtrado de
+# herramientas por relevancia y modo del prompt del router ("full" o "compact")
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "6000"))
+PROMPT_FILTER_TOOLS = os.getenv("PROMPT_FILTER_TOOLS", "true").lower() in ("1", "true", "yes")
+ROUTER_PROMPT_MODE = os.getenv("ROUTER_PROMPT_MODE", "full")
+
+# Logging: JSONL (o texto) escrito desde un hilo en segundo plano con rotación por tamaño. Los
+# volcados grandes (respuestas crudas, mensajes) solo se registran para una muestra y recortados
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "4000"))
+
+# Precarga especulativa: mientras el router decide, se ejecutan las herramientas de solo lectura
+# más probables de los PREFETCH_TOP_AGENTS agentes candidatos con las entidades del mensaje. Una
+# herramienta deja de precargarse si desperdicia más de PREFETCH_WASTE_BUDGET de sus últimas
+# PREFETCH_WINDOW precargas (salvo PREFETCH_PROBE_RATE de sondeo)
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "false").lower() in ("1", "true", "yes")
+PREFETCH_TOP_AGENTS = int(os.getenv("PREFETCH_TOP_AGENTS", "2"))
+PREFETCH_MAX_TOOLS = int(os.getenv("PREFETCH_MAX_TOOLS", "3"))
+PREFETCH_WASTE_BUDGET = float(os.getenv("PREFETCH_WASTE_BUDGET", "0.5"))
+PREFETCH_WINDOW = int(os.getenv("PREFETCH_WINDOW", "100"))
+PREFETCH_PROBE_RATE = float(os.getenv("PREFETCH_PROBE_RATE", "0.05"))
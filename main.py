@@ -1,22 +1,64 @@
-import sys
-from agent.agent import responder
+import asyncio
+import threading
+from agent.agent import responder, configure_logging
 
-def main():
+def _resolve(future, result=None, error=None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+async def read_input(prompt):
+    """
+    Lee una línea de stdin sin bloquear el event loop. Se lee en un hilo daemon (no en el
+    executor por defecto): si se sale con Ctrl+C mientras espera en input(), el hilo no impide
+    que asyncio.run termine.
+    Args:
+        prompt (str): Texto que se muestra antes de leer.
+    Returns:
+        str: Línea leída.
+    Raises:
+        EOFError: Si stdin se ha cerrado.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def read():
+        try:
+            line, error = input(prompt), None
+        except Exception as e:
+            line, error = None, e
+        try:
+            loop.call_soon_threadsafe(_resolve, future, line, error)
+        except RuntimeError:
+            # El loop ya se ha cerrado: nadie espera esta línea
+            pass
+
+    threading.Thread(target=read, name="stdin", daemon=True).start()
+    return await future
+
+async def main():
     print("Agente CLI. Escribe tu consulta o 'salir' para terminar.")
     while True:
         try:
-            user_input = input("\n> ").strip()
-        except (EOFError, KeyboardInterrupt):
+            user_input = (await read_input("\n> ")).strip()
+        except EOFError:
             print("\nSaliendo...")
             break
-        if user_input.lower() in ("salir", "exit", "quit"): 
+        if user_input.lower() in ("salir", "exit", "quit"):
             print("Adiós!")
             break
         if not user_input:
             continue
-        respuesta = responder(user_input)
+        respuesta = await responder(user_input, session_id="cli")
         print("\nRespuesta:")
         print(respuesta)
 
 if __name__ == "__main__":
-    main()
+    configure_logging()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nSaliendo...")
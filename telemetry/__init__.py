@@ -0,0 +1 @@
+# This file marks the telemetry folder as a Python package.
@@ -0,0 +1,146 @@
+"""
+Logging sin bloqueo: los registros se encolan en el hilo de la petición y un hilo en segundo
+plano los formatea como JSONL y los escribe en un fichero con rotación por tamaño.
+
+Los volcados grandes (respuestas crudas del modelo, listas de mensajes) pasan por
+`log_payload`, que solo los construye para una muestra (LOG_PAYLOAD_SAMPLE_RATE) y los recorta
+a LOG_PAYLOAD_MAX_CHARS.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config.config import LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_QUEUE_SIZE, LOG_PAYLOAD_SAMPLE_RATE, LOG_PAYLOAD_MAX_CHARS
+from telemetry.metrics import registry
+from telemetry.tracing import current_trace_id
+
+records_dropped = registry.counter("log_records_dropped_total", "Registros de log descartados por cola llena")
+payloads_logged = registry.counter("log_payloads_total", "Volcados de payload por tipo y decisión de muestreo", ("kind", "sampled"))
+
+class JsonFormatter(logging.Formatter):
+    """
+    Un objeto JSON por línea: ts, level, logger, msg, trace_id y los campos de `extra={"data": {...}}`.
+    """
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        data = getattr(record, "data", None)
+        if data:
+            entry["data"] = data
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """
+    Formato de texto clásico (LOG_FORMAT=text), con los datos estructurados en JSON al final.
+    """
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        data = getattr(record, "data", None)
+        return f"{line} {json.dumps(data, ensure_ascii=False, default=str)}" if data else line
+
+class _NonBlockingQueueHandler(QueueHandler):
+    # El formateo se hace en el hilo del listener; aquí solo se copia el registro y la traza en curso
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.trace_id = current_trace_id()
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped.inc()
+
+_listeners = {}
+_setup_lock = threading.Lock()
+
+def setup_logging(path, level=logging.INFO, fmt=LOG_FORMAT, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, queue_size=LOG_QUEUE_SIZE):
+    """
+    Configura el logger raíz para escribir en `path` a través de una cola y un hilo escritor.
+    Si el proceso ya tiene el logging configurado con esta función, no hace nada (p.ej. el
+    backend importado en proceso por el agente escribe en el log del agente).
+
+    Args:
+        path (str): Fichero de log; se rota al superar `max_bytes`.
+        level (int): Nivel del logger raíz.
+        fmt (str): "json" (JSONL) o "text".
+        max_bytes (int): Tamaño máximo de cada fichero (0 = sin rotación).
+        backup_count (int): Ficheros rotados que se conservan.
+        queue_size (int): Registros pendientes máximos; los que no caben se descartan.
+    Returns:
+        QueueListener: Hilo escritor (se detiene al salir del proceso).
+    """
+    with _setup_lock:
+        if _listeners:
+            return next(iter(_listeners.values()))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        records = queue.Queue(maxsize=queue_size)
+        listener = QueueListener(records, file_handler, respect_handler_level=True)
+        handler = _NonBlockingQueueHandler(records)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(level)
+        listener.start()
+        atexit.register(listener.stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=lambda: _restart_in_child(handler, listener, queue_size))
+        _listeners[path] = listener
+        return listener
+
+def _restart_in_child(handler, listener, queue_size):
+    # El hilo escritor no sobrevive al fork (gunicorn --preload): cola y hilo nuevos en cada worker
+    records = queue.Queue(maxsize=queue_size)
+    handler.queue = records
+    listener.queue = records
+    listener._thread = None
+    listener.start()
+
+def log_payload(kind, payload, message=None, sample_rate=None, max_chars=None, **fields):
+    """
+    Registra en DEBUG un volcado grande solo para una fracción de las llamadas.
+
+    Args:
+        kind (str): Tipo de volcado (p.ej. "llm_response", "llm_messages").
+        payload: Objeto a volcar, o una función sin argumentos que lo devuelve (para no
+            construirlo si la llamada no entra en la muestra).
+        message (str, opcional): Mensaje del registro; por defecto `kind`.
+        sample_rate (float, opcional): Fracción registrada; por defecto LOG_PAYLOAD_SAMPLE_RATE.
+        max_chars (int, opcional): Longitud máxima del volcado; por defecto LOG_PAYLOAD_MAX_CHARS.
+        **fields: Campos adicionales del registro (agente, etapa...).
+    Returns:
+        bool: True si se ha registrado.
+    """
+    rate = LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+    if not logging.getLogger().isEnabledFor(logging.DEBUG) or rate <= 0 or (rate < 1 and random.random() >= rate):
+        payloads_logged.inc(kind=kind, sampled="false")
+        return False
+    payloads_logged.inc(kind=kind, sampled="true")
+    if callable(payload):
+        payload = payload()
+    text = payload if isinstance(payload, str) else repr(payload)
+    limit = LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+    if limit and len(text) > limit:
+        fields["truncated_chars"] = len(text) - limit
+        text = text[:limit]
+    logging.debug(message or kind, extra={"data": dict(fields, kind=kind, payload=text)})
+    return True
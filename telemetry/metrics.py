@@ -0,0 +1,170 @@
+import math
+import threading
+
+# Tipo de contenido del formato de texto de Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Límites superiores (segundos) de los buckets de latencia
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Contador monótono con etiquetas.
+    """
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, (), value) for key, value in sorted(self._values.items())]
+
+class Histogram:
+    """
+    Histograma acumulativo con etiquetas (buckets, suma y número de observaciones).
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values = {}  # etiquetas -> [cuentas por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    out.append((f"{self.name}_bucket", key, (("le", _format_value(bound)),), cumulative))
+                out.append((f"{self.name}_sum", key, (), total))
+                out.append((f"{self.name}_count", key, (), count))
+        return out
+
+class CallbackMetric:
+    """
+    Métrica cuyo valor se lee en el momento de exponerla, a partir de las estadísticas que ya
+    mantienen otros componentes (cachés, pools...). `callback` devuelve un número o un dict
+    {tupla de valores de etiqueta: número}.
+    """
+    def __init__(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def samples(self):
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, tuple(str(v) for v in key), (), value)
+                for key, value in sorted(values.items()) if value is not None]
+
+class MetricsRegistry:
+    """
+    Registro de métricas de un proceso, exportable en el formato de texto de Prometheus.
+    Registrar dos veces el mismo nombre devuelve la métrica ya existente.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, callback, labelnames=(), kind="gauge"):
+        """
+        Registra (o sustituye) una métrica calculada al exponerla. Ver CallbackMetric.
+        """
+        metric = CallbackMetric(name, documentation, callback, labelnames, kind)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self):
+        """
+        Returns:
+            str: Todas las métricas en el formato de texto de Prometheus.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception:
+                # Una estadística que falla no debe romper la exposición del resto
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in samples:
+                lines.append(f"{name}{_format_labels(metric.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Registro compartido por el proceso (agente y/o backend)
+registry = MetricsRegistry()
+
+def route_label(request):
+    """
+    Etiqueta `path` de las métricas HTTP: la plantilla de la ruta (p.ej. "/export/{listado}"),
+    no la URL concreta, para que la cardinalidad no crezca con cada DNI o cursor distinto.
+    Args:
+        request: Petición de Starlette/FastAPI, ya atendida (el router deja la ruta en el scope).
+    Returns:
+        str: Plantilla de la ruta, o "unmatched" si ninguna coincidió.
+    """
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
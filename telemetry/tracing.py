@@ -0,0 +1,140 @@
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from telemetry.metrics import registry
+
+# Cabecera con la que se propaga el identificador de traza entre agent_server y el backend
+TRACE_HEADER = "X-Trace-Id"
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Trace:
+    """
+    Spans de una petición. Las tareas lanzadas durante la petición (asyncio.gather) heredan el
+    contexto y registran sus spans en la misma traza.
+    """
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Identificador, duración total y spans (nombre, padre, inicio y duración en ms).
+        """
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": spans,
+        }
+
+def start_trace(trace_id=None):
+    """
+    Abre una traza en el contexto actual, reutilizando el identificador recibido si lo hay.
+    Returns:
+        tuple: (Trace, token) para pasar a `end_trace`.
+    """
+    trace = Trace(trace_id)
+    return trace, _current_trace.set(trace)
+
+def end_trace(trace, token, service):
+    """
+    Cierra la traza y deja en el log el desglose de sus spans.
+    """
+    _current_trace.reset(token)
+    if trace.spans:
+        logging.info("[trace] %s", service, extra={"data": trace.summary()})
+
+def current_trace_id():
+    """
+    Returns:
+        str | None: Identificador de la traza en curso.
+    """
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+def trace_headers():
+    """
+    Returns:
+        dict: Cabeceras para propagar la traza en curso a otro servicio (vacío si no hay).
+    """
+    trace_id = current_trace_id()
+    return {TRACE_HEADER: trace_id} if trace_id else {}
+
+class Tracer:
+    """
+    Crea spans para las etapas de un servicio y registra su latencia y sus errores en
+    `<service>_stage_duration_seconds` y `<service>_stage_errors_total`.
+    """
+    def __init__(self, service):
+        self.service = service
+        self.durations = registry.histogram(
+            f"{service}_stage_duration_seconds", f"Duración de cada etapa de {service}", ("stage",)
+        )
+        self.errors = registry.counter(
+            f"{service}_stage_errors_total", f"Etapas de {service} terminadas con excepción", ("stage",)
+        )
+
+    def observe(self, stage, seconds, error=False, **attrs):
+        """
+        Registra una etapa ya medida (p.ej. la duración de un stream consumido poco a poco).
+        """
+        self.durations.observe(seconds, stage=stage)
+        if error:
+            self.errors.inc(stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            span = {
+                "name": stage,
+                "parent": _current_span.get(),
+                "start_ms": round((time.perf_counter() - seconds - trace.started) * 1000, 2),
+                "duration_ms": round(seconds * 1000, 2),
+            }
+            if error:
+                span["error"] = True
+            if attrs:
+                span["attrs"] = attrs
+            trace.add(span)
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """
+        Mide el bloque como una etapa de la traza en curso. Los spans abiertos dentro del bloque
+        quedan como hijos de este.
+        """
+        token = _current_span.set(stage)
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            _current_span.reset(token)
+            self.observe(stage, time.perf_counter() - start, error, **attrs)
+
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+def get_tracer(service):
+    """
+    Devuelve el Tracer compartido de un servicio ("agent" o "backend").
+    """
+    tracer = _tracers.get(service)
+    if tracer is None:
+        with _tracers_lock:
+            tracer = _tracers.setdefault(service, Tracer(service))
+    return tracer
@@ -0,0 +1,23 @@
+import os
+import sys
+
+# Los tests importan los paquetes del proyecto (agent, backend, config, telemetry) desde la raíz
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture
+def backend_pool(tmp_path, monkeypatch):
+    """
+    Base de datos generada (benchmarks.generate_db) y pool propio para llamar a los handlers de
+    backend.server directamente.
+    """
+    from backend import server
+    from backend.db import ConnectionPool
+    from benchmarks.generate_db import generate
+    path = str(tmp_path / "backend.db")
+    generate(path, abonados=20)
+    pool = ConnectionPool(path, size=2, timeout=5)
+    monkeypatch.setattr(server, "db_pool", pool)
+    yield pool
+    pool.close()
@@ -0,0 +1,13 @@
+import importlib
+import sys
+import agent.agent
+
+def test_app_is_created_on_first_access(monkeypatch):
+    calls = []
+    monkeypatch.setattr(agent.agent, "configure_logging", lambda *args, **kwargs: calls.append(args))
+    monkeypatch.delitem(sys.modules, "agent_server", raising=False)
+    module = importlib.import_module("agent_server")
+    # Importar no configura el logging ni crea la aplicación
+    assert calls == [] and module._app is None
+    app = module.app
+    assert module.app is app and len(calls) == 1
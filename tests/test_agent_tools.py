@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+import pytest
+from agent.agents.agent_base import AgentBase
+from agent.tools.tool_cache import ToolResultCache
+from agent.tools.tool_registry import ToolRegistry
+from agent.tools.transport import ToolTransport
+from config.config import TOOL_RESULT_MAX_ROWS
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class RecordingTransport(ToolTransport):
+    """
+    Transporte de prueba: devuelve respuestas fijas por herramienta y anota cada llamada al backend.
+    """
+    def __init__(self, responses, delay=0.0):
+        self.responses = responses
+        self.delay = delay
+        self.calls = []
+
+    async def call(self, name, args):
+        if name == "batch":
+            return {"results": [{"tool": c["tool"], "response": await self.call(c["tool"], c["args"])} for c in args["calls"]]}
+        self.calls.append((name, args))
+        await asyncio.sleep(self.delay)
+        return self.responses[name]
+
+@pytest.fixture(scope="module")
+def registry():
+    with open(os.path.join(PROJECT_DIR, "agent", "tools_schema.json"), encoding="utf-8") as f:
+        return ToolRegistry(json.load(f))
+
+def _agent(registry, transport, tools):
+    return AgentBase(
+        "test_agent", "", "", tools, tool_registry=registry, tool_transport=transport,
+        tool_cache=ToolResultCache(registry.metadata), llm_client=object(),
+    )
+
+def _tool_call(name, args):
+    return SimpleNamespace(function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+
+def test_cap_rows_caps_every_oversized_list(registry):
+    facturas = [{"fecha": f"2024-01-{i:02d}"} for i in range(TOOL_RESULT_MAX_ROWS + 10)]
+    incidencias = [{"estado": "Abierto"}] * (TOOL_RESULT_MAX_ROWS + 30)
+    out = {"deuda_total": 10.0, "facturas_pendientes": facturas, "incidencias": incidencias}
+    capped = _agent(registry, RecordingTransport({}), [])._cap_rows(out)
+    assert len(capped["facturas_pendientes"]) == TOOL_RESULT_MAX_ROWS
+    assert len(capped["incidencias"]) == TOOL_RESULT_MAX_ROWS
+    assert capped["totals"] == {"facturas_pendientes": len(facturas), "incidencias": len(incidencias)}
+    assert capped["deuda_total"] == 10.0
+    # La respuesta original (la del backend) no se modifica
+    assert len(out["incidencias"]) == len(incidencias)
+
+def test_identical_calls_in_one_turn_run_once(registry):
+    transport = RecordingTransport({"deuda_total": {"deuda": 12.5}})
+    agent = _agent(registry, transport, ["deuda_total"])
+    calls = [_tool_call("deuda_total", {"dni": "12345678Z"}), _tool_call("deuda_total", {"dni": "12345678Z"})]
+    results = asyncio.run(agent._process_tool_calls(calls, None, {}))
+    assert transport.calls == [("deuda_total", {"dni": "12345678Z"})]
+    assert [r["response"] for r in results] == [{"deuda": 12.5}, {"deuda": 12.5}]
+    assert agent.tool_flight.stats()["deduplicated"] == 1
+
+def test_write_tools_are_never_coalesced(registry):
+    transport = RecordingTransport({"crear_incidencia": {"message": "ok"}})
+    agent = _agent(registry, transport, ["crear_incidencia"])
+    args = {"dni": "12345678Z", "ubicacion": "Madrid", "descripcion": "fuga"}
+    asyncio.run(agent._process_tool_calls([_tool_call("crear_incidencia", args)] * 2, None, {}))
+    assert len(transport.calls) == 2
+
+def test_identifier_filled_from_session_for_tools_without_required(registry):
+    transport = RecordingTransport({"resumen_abonado": {"deuda_total": 0}})
+    agent = _agent(registry, transport, ["resumen_abonado", "datos_abonado"])
+    entidades = {"dni": "12345678Z", "poliza": "POL123456"}
+    asyncio.run(agent._process_tool_calls([_tool_call("resumen_abonado", {"campos": ["deuda_total"]})], None, entidades))
+    assert transport.calls == [("resumen_abonado", {"campos": ["deuda_total"], "dni": "12345678Z"})]
+    # Si el modelo ya pasa uno de los dos, no se añade el otro
+    assert agent._fill_missing_args({"poliza": "POL999999"}, "resumen_abonado", entidades) == {"poliza": "POL999999"}
+    assert agent._fill_missing_args({}, "datos_abonado", {"poliza": "POL123456"}) == {"poliza": "POL123456"}
+
+class FailingBatchTransport(RecordingTransport):
+    """
+    Transporte cuya petición /batch falla (timeout o respuesta incompleta); las llamadas sueltas funcionan.
+    """
+    def __init__(self, responses, batch_error=None, batch_items=None):
+        super().__init__(responses)
+        self.batch_error = batch_error
+        self.batch_items = batch_items
+
+    async def call_batch(self, calls):
+        if self.batch_error is not None:
+            raise self.batch_error
+        return self.batch_items
+
+WRITE_ARGS = {"dni": "12345678Z", "ubicacion": "Madrid", "descripcion": "fuga"}
+
+@pytest.mark.parametrize("transport_kwargs, error", [
+    ({"batch_error": asyncio.TimeoutError()}, "backend timeout"),
+    ({"batch_items": [{"tool": "deuda_total", "response": {"deuda": 1}}]}, "backend failure"),
+])
+def test_failed_batch_retries_only_read_tools(registry, transport_kwargs, error):
+    transport = FailingBatchTransport({"deuda_total": {"deuda": 12.5}}, **transport_kwargs)
+    agent = _agent(registry, transport, ["deuda_total", "crear_incidencia"])
+    calls = [("deuda_total", {"dni": "12345678Z"}), ("crear_incidencia", WRITE_ARGS)]
+    outcomes = asyncio.run(agent._execute_batch(calls))
+    # La escritura puede haberse aplicado ya en el backend: no se repite
+    assert transport.calls == [("deuda_total", {"dni": "12345678Z"})]
+    assert outcomes[0]["response"] == {"deuda": 12.5}
+    assert outcomes[1] == {"tool": "crear_incidencia", "error": error}
+
+def test_batch_item_errors_are_passed_through(registry):
+    items = [{"tool": "deuda_total", "response": {"deuda": 1}}, {"tool": "crear_incidencia", "error": "UNIQUE constraint failed"}]
+    transport = FailingBatchTransport({}, batch_items=items)
+    agent = _agent(registry, transport, ["deuda_total", "crear_incidencia"])
+    outcomes = asyncio.run(agent._execute_batch([("deuda_total", {"dni": "12345678Z"}), ("crear_incidencia", WRITE_ARGS)]))
+    assert outcomes[1] == {"tool": "crear_incidencia", "error": "UNIQUE constraint failed"}
+    assert transport.calls == []
+
+def test_cap_rows_keeps_backend_totals(registry):
+    out = {"facturas": [{"fecha": "2024-01-01"}] * (TOOL_RESULT_MAX_ROWS + 5), "totals": {"facturas": 500}, "next_cursor": "x"}
+    capped = _agent(registry, RecordingTransport({}), [])._cap_rows(out)
+    assert len(capped["facturas"]) == TOOL_RESULT_MAX_ROWS
+    assert capped["totals"] == {"facturas": 500}
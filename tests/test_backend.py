@@ -0,0 +1,41 @@
+import asyncio
+import sqlite3
+from backend import server
+
+def test_batch_items_are_independent(backend_pool):
+    pool = backend_pool
+    dni = sqlite3.connect(pool.db_path).execute("SELECT dni FROM abonados LIMIT 1").fetchone()[0]
+    calls = [
+        server.BatchCall(tool="crear_incidencia", args={"dni": dni, "ubicacion": "madrid", "descripcion": "fuga"}),
+        server.BatchCall(tool="crear_incidencia", args={"dni": dni}),
+        server.BatchCall(tool="no_existe", args={}),
+    ]
+    results = asyncio.run(server.batch(calls))["results"]
+    assert "response" in results[0]
+    assert "error" in results[1] and "error" in results[2]
+    assert "no_existe" in results[2]["error"]
+    # La escritura del elemento correcto se confirma aunque fallen los demás
+    count = sqlite3.connect(pool.db_path).execute("SELECT COUNT(*) FROM incidencias WHERE descripcion = 'fuga'").fetchone()[0]
+    assert count == 1
+
+def _facturas_dni(pool):
+    # Abonado con más facturas, para que el listado no quepa en una página
+    return sqlite3.connect(pool.db_path).execute(
+        "SELECT dni_abonado FROM facturas GROUP BY dni_abonado ORDER BY COUNT(*) DESC LIMIT 1"
+    ).fetchone()[0]
+
+def test_listing_without_limit_or_cursor_is_complete(backend_pool):
+    dni = _facturas_dni(backend_pool)
+    total = sqlite3.connect(backend_pool.db_path).execute("SELECT COUNT(*) FROM facturas WHERE dni_abonado = ?", (dni,)).fetchone()[0]
+    out = asyncio.run(server.list_page("todas_las_facturas", "facturas", (dni,)))
+    assert list(out) == ["facturas"]
+    assert len(out["facturas"]) == total
+
+def test_listing_pages_report_totals(backend_pool):
+    dni = _facturas_dni(backend_pool)
+    full = asyncio.run(server.list_page("todas_las_facturas", "facturas", (dni,)))["facturas"]
+    first = asyncio.run(server.list_page("todas_las_facturas", "facturas", (dni,), limit=2))
+    assert first["totals"] == {"facturas": len(full)}
+    second = asyncio.run(server.list_page("todas_las_facturas", "facturas", (dni,), cursor=first["next_cursor"]))
+    assert "totals" not in second
+    assert first["facturas"] + second["facturas"] == full[:2 + len(second["facturas"])]
@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+import pytest
+from backend.db import ConnectionPool, PoolExhausted
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "pool.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [(str(i),) for i in range(10)])
+    conn.commit()
+    conn.close()
+    return path
+
+def test_queries_wait_for_transactions_without_blocking_threads(db_path):
+    # Con todas las conexiones en transacciones abiertas, las consultas sueltas esperan su turno
+    # sin ocupar los hilos que las transacciones necesitan para terminar
+    pool = ConnectionPool(db_path, size=2, timeout=5)
+
+    async def transaction(started):
+        async with pool.transaction():
+            started.set()
+            await asyncio.sleep(0.1)
+            return await pool.run_query("SELECT COUNT(*) FROM t")
+
+    async def main():
+        started = [asyncio.Event(), asyncio.Event()]
+        transactions = [asyncio.create_task(transaction(e)) for e in started]
+        await asyncio.gather(*(e.wait() for e in started))
+        plain = [asyncio.create_task(pool.run_query("SELECT v FROM t WHERE id = ?", (i,))) for i in (1, 2)]
+        return await asyncio.wait_for(asyncio.gather(*transactions, *plain), 2)
+
+    try:
+        results = asyncio.run(main())
+    finally:
+        pool.close()
+    assert results == [[(10,)], [(10,)], [("0",)], [("1",)]]
+    assert pool.stats()["in_use"] == 0
+
+def test_exhausted_pool_raises_pool_exhausted(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=0.1)
+
+    async def hold(started, done):
+        async with pool.transaction():
+            started.set()
+            await done.wait()
+
+    async def main():
+        started, done = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(started, done))
+        await started.wait()
+        with pytest.raises(PoolExhausted):
+            await pool.run_query("SELECT 1")
+        done.set()
+        await holder
+        # Al terminar la transacción el hueco vuelve a estar libre
+        return await pool.run_query("SELECT 1")
+
+    try:
+        assert asyncio.run(main()) == [(1,)]
+    finally:
+        pool.close()
+    assert pool.stats()["waiting"] == 0
+
+def test_stream_query_releases_connection_when_closed_early(db_path):
+    pool = ConnectionPool(db_path, size=1, timeout=1)
+
+    async def main():
+        stream = pool.stream_query("SELECT id FROM t ORDER BY id", batch_size=3)
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first, await pool.run_query("SELECT COUNT(*) FROM t")
+
+    try:
+        first, count = asyncio.run(main())
+    finally:
+        pool.close()
+    assert first == [(1,), (2,), (3,)]
+    assert count == [(10,)]
+    assert pool.stats()["errors"] == 0
+
+def test_savepoint_rolls_back_only_the_failing_block(db_path):
+    pool = ConnectionPool(db_path, size=2, timeout=5)
+
+    async def main():
+        async with pool.transaction():
+            async with pool.savepoint():
+                await pool.run_query("INSERT INTO t (v) VALUES ('a')", commit=True)
+            with pytest.raises(ValueError):
+                async with pool.savepoint():
+                    await pool.run_query("INSERT INTO t (v) VALUES ('b')", commit=True)
+                    raise ValueError("falla")
+        return await pool.run_query("SELECT v FROM t WHERE v IN ('a', 'b')")
+
+    try:
+        assert asyncio.run(main()) == [("a",)]
+    finally:
+        pool.close()
@@ -0,0 +1,49 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+import pytest
+from agent.agents.agent_base import AgentBase
+from agent.tools.error_catalog import ErrorCatalog
+from agent.tools.tool_registry import ToolRegistry
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="module")
+def catalog():
+    return ErrorCatalog(locale="es")
+
+def test_entity_message_uses_its_format_and_example(catalog):
+    message = catalog.render("deuda_total", [("dni", "1234")])
+    assert message == "El DNI '1234' no tiene el formato correcto: debe tener 8 dígitos seguidos de una letra mayúscula (por ejemplo, 12345678A)."
+
+def test_tool_specific_message_takes_precedence(catalog):
+    message = catalog.render("crear_incidencia", [("dni", "1234")])
+    assert message.startswith("No he podido registrar la incidencia: el DNI '1234' no es válido.")
+
+def test_unknown_field_uses_default_and_errors_are_joined(catalog):
+    message = catalog.render("deuda_total", [("dni", "1"), ("matricula", "X")])
+    assert "El DNI '1'" in message
+    assert message.endswith("El valor 'X' para 'matricula' no tiene el formato correcto. Por favor, revísalo.")
+
+def test_locale_and_fallback(catalog):
+    english = catalog.render("deuda_total", [("dni", "1234")], locale="en")
+    assert "1234" in english and english != catalog.render("deuda_total", [("dni", "1234")])
+    # Idioma sin mensajes: se usa el del catálogo
+    assert catalog.render("deuda_total", [("dni", "1234")], locale="fr") == catalog.render("deuda_total", [("dni", "1234")])
+
+def test_undefined_placeholders_are_left_intact(tmp_path):
+    path = tmp_path / "error_messages.json"
+    path.write_text(json.dumps({"es": {"default": "'{valor}' no vale para {campo} ({ayuda})"}}), encoding="utf-8")
+    assert ErrorCatalog(str(path), locale="es").render("x", [("dni", "1")]) == "'1' no vale para dni ({ayuda})"
+
+def test_agent_answers_pattern_errors_from_catalog():
+    with open(os.path.join(PROJECT_DIR, "agent", "tools_schema.json"), encoding="utf-8") as f:
+        registry = ToolRegistry(json.load(f))
+    # Sin cliente de Groq real: si el agente llamase al modelo, fallaría
+    agent = AgentBase("test_agent", "", "", ["crear_incidencia"], tool_registry=registry, llm_client=object())
+    call = SimpleNamespace(function=SimpleNamespace(name="crear_incidencia", arguments=json.dumps(
+        {"dni": "1234", "ubicacion": "Madrid", "descripcion": "fuga"})))
+    [result] = asyncio.run(agent._process_tool_calls([call], None, {}))
+    assert result["tool"] == "crear_incidencia"
+    assert result["error"].startswith("No he podido registrar la incidencia: el DNI '1234'")
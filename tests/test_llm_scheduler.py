@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from agent.tools.llm_scheduler import LLMScheduler, LLMOverloaded
+from benchmarks.fake_groq import _rate_limit_error
+
+class RateLimitedClient:
+    """
+    Cliente cuyas llamadas siempre devuelven un 429 con el retry-after indicado.
+    """
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **request):
+        self.calls += 1
+        raise _rate_limit_error(self.retry_after)
+
+REQUEST = {"model": "m", "messages": [{"role": "user", "content": "hola"}], "max_tokens": 100}
+
+def test_exhausted_retries_raise_overloaded_and_refund_tokens():
+    scheduler = LLMScheduler(model_limits={}, default_tpm=60000, max_attempts=2, backoff_base=0.01, max_rate_wait=5)
+    client = RateLimitedClient(0.01)
+    with pytest.raises(LLMOverloaded) as info:
+        asyncio.run(scheduler.create(client, **REQUEST))
+    assert client.calls == 2
+    assert info.value.retry_after is not None
+    state = scheduler._state("m")
+    assert state.in_flight == 0
+    assert state.tokens.tokens == pytest.approx(state.tokens.capacity, abs=50)
+
+def test_retry_after_beyond_max_rate_wait_raises_overloaded():
+    scheduler = LLMScheduler(model_limits={}, max_attempts=3, backoff_base=0.01, max_rate_wait=1)
+    client = RateLimitedClient(30)
+    with pytest.raises(LLMOverloaded) as info:
+        asyncio.run(scheduler.create(client, **REQUEST))
+    assert client.calls == 1
+    assert info.value.retry_after >= 30
+
+class StreamingClient:
+    """
+    Cliente cuyas llamadas devuelven un stream con los chunks indicados.
+    """
+    def __init__(self, chunks=("a", "b")):
+        self.chunks = chunks
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **request):
+        async def stream():
+            for chunk in self.chunks:
+                yield chunk
+        return stream()
+
+def test_rate_limited_caller_waits_without_holding_a_slot():
+    scheduler = LLMScheduler(model_limits={}, default_concurrency=1, default_rpm=60, default_tpm=0, max_rate_wait=5)
+    state = scheduler._state("m")
+    state.requests.tokens = -0.5  # Cuota agotada: la siguiente petición espera ~1,5 s
+
+    async def run():
+        waiting = asyncio.create_task(scheduler._admit(state, "interactive", 100))
+        await asyncio.sleep(0.05)
+        assert state.in_flight == 0
+        # Otra llamada sin esperar cuota (hueco libre) entra mientras tanto
+        await state.acquire("interactive", 1, 1)
+        state.release()
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
+    assert state.in_flight == 0
+    # La reserva de la llamada cancelada se devuelve
+    assert state.requests.tokens == pytest.approx(-0.5, abs=0.1)
+
+@pytest.mark.parametrize("consume", ["full", "aclose", "abandon"])
+def test_stream_releases_slot(consume):
+    scheduler = LLMScheduler(model_limits={}, default_concurrency=1, default_rpm=0, default_tpm=0)
+    state = scheduler._state("m")
+
+    async def run():
+        stream = await scheduler.create(StreamingClient(), stream=True, **REQUEST)
+        assert state.in_flight == 1
+        if consume == "full":
+            assert [chunk async for chunk in stream] == ["a", "b"]
+        elif consume == "aclose":
+            await stream.aclose()
+        else:
+            del stream
+
+    asyncio.run(run())
+    assert state.in_flight == 0
@@ -0,0 +1,39 @@
+from agent.tools.lru_cache import LRUCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(capacity=2, ttl_seconds=None)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" pasa a ser la menos usada
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire_after_their_ttl():
+    clock = FakeClock()
+    cache = LRUCache(capacity=10, ttl_seconds=30, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=120)
+    clock.now = 31
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_pop_and_clear_count_invalidations():
+    cache = LRUCache(capacity=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    cache.pop("a")
+    cache.pop("no_existe")
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["invalidations"] == 3
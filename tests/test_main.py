@@ -0,0 +1,31 @@
+import asyncio
+import builtins
+import threading
+import time
+import pytest
+import main
+
+def test_cancelled_read_does_not_block_shutdown(monkeypatch):
+    blocked = threading.Event()
+    monkeypatch.setattr(builtins, "input", lambda prompt: blocked.wait())
+
+    async def interrupted():
+        task = asyncio.create_task(main.read_input("> "))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    start = time.monotonic()
+    # Como con Ctrl+C: asyncio.run termina aunque el hilo siga esperando en input()
+    asyncio.run(interrupted())
+    assert time.monotonic() - start < 1
+    blocked.set()
+
+def test_read_input_raises_eof(monkeypatch):
+    def closed(prompt):
+        raise EOFError
+
+    monkeypatch.setattr(builtins, "input", closed)
+    with pytest.raises(EOFError):
+        asyncio.run(main.read_input("> "))
@@ -0,0 +1,23 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from telemetry.metrics import route_label
+
+def test_route_label_uses_route_template():
+    app = FastAPI()
+    labels = []
+
+    @app.middleware("http")
+    async def record(request: Request, call_next):
+        response = await call_next(request)
+        labels.append(route_label(request))
+        return response
+
+    @app.get("/abonados/{dni}")
+    async def abonado(dni: str):
+        return {"dni": dni}
+
+    client = TestClient(app)
+    client.get("/abonados/12345678Z")
+    client.get("/abonados/87654321X")
+    client.get("/no/existe")
+    assert labels == ["/abonados/{dni}", "/abonados/{dni}", "unmatched"]
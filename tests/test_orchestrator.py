@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import pytest
+from types import SimpleNamespace
+from agent.orchestrator import Orchestrator
+
+CONFIG = [
+    {"name": "factura_agent", "system_prompt": "", "specialization": "facturas, pagos y deuda", "tools": ["deuda_total", "ultimo_pago"], "allowed_roles": ["cliente", "admin"]},
+    {"name": "admin_agent", "system_prompt": "", "specialization": "auditoria de cuentas y permisos", "tools": ["auditoria_cuentas"], "allowed_roles": ["admin"]},
+]
+
+class FakeRouterClient:
+    """
+    Cliente del router LLM de prueba: responde siempre con el mismo agente y cuenta las llamadas.
+    """
+    def __init__(self, agent_name):
+        self.agent_name = agent_name
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    async def create(self, **request):
+        self.calls += 1
+        message = SimpleNamespace(content=self.agent_name)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+def _write_config(path, configs):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(configs, f)
+
+def _orchestrator(path, client):
+    with open(path, encoding="utf-8") as f:
+        agents = [SimpleNamespace(**cfg) for cfg in json.load(f)]
+    context_manager = SimpleNamespace(normalize_query=lambda text: text.lower())
+    return Orchestrator(agents, None, [], context_manager, local_router_threshold=0.5, agents_config_path=path, llm_client=client)
+
+def test_local_router_only_picks_allowed_agents(tmp_path):
+    path = str(tmp_path / "agents_config.json")
+    _write_config(path, CONFIG)
+    client = FakeRouterClient("factura_agent")
+    orchestrator = _orchestrator(path, client)
+    query = "necesito la auditoria de cuentas y permisos"
+    admin = orchestrator.get_allowed_agents("admin")
+    assert asyncio.run(orchestrator.select_agent_name(query, admin)) == "admin_agent"
+    assert client.calls == 0
+    # Para un cliente el router local no puede elegir admin_agent: decide el router LLM
+    cliente = orchestrator.get_allowed_agents("cliente")
+    assert asyncio.run(orchestrator.select_agent_name(query, cliente)) == "factura_agent"
+    assert client.calls == 1
+
+def test_local_router_rebuilt_when_config_changes(tmp_path):
+    path = str(tmp_path / "agents_config.json")
+    _write_config(path, CONFIG)
+    client = FakeRouterClient("factura_agent")
+    orchestrator = _orchestrator(path, client)
+    query = "quiero revisar los contadores del suministro"
+    assert orchestrator.local_router.classify(query)[0] is None
+    changed = [dict(CONFIG[0]), dict(CONFIG[1], specialization="contadores del suministro y lecturas")]
+    _write_config(path, changed)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert asyncio.run(orchestrator.select_agent_name(query)) == "admin_agent"
+    assert client.calls == 0
+
+PROJECT_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "agents_config.json")
+
+@pytest.mark.parametrize("query", ["¿Cuál es la deuda total del abonado X?", "facturas pendientes"])
+def test_forbidden_domain_is_not_routed_to_an_allowed_agent(query):
+    with open(PROJECT_CONFIG, encoding="utf-8") as f:
+        configs = [SimpleNamespace(**cfg) for cfg in json.load(f)]
+    router_agent = next(c for c in configs if c.name == "router_agent")
+    agents = [c for c in configs if c.name != "router_agent"]
+    client = FakeRouterClient("factura_agent")
+    context_manager = SimpleNamespace(normalize_query=lambda text: text.lower())
+    # Umbral bajo: aun así, sin factura_agent el router local no reparte su dominio entre los demás
+    orchestrator = Orchestrator(agents, router_agent, [], context_manager, local_router_threshold=0.3, llm_client=client)
+    cliente = orchestrator.get_allowed_agents("cliente")
+    assert "factura_agent" not in {a.name for a in cliente}
+    assert asyncio.run(orchestrator.select_agent_name(query, cliente)) == "factura_agent"
+    assert client.calls == 1
+
+def _real_context_manager():
+    from agent.agent import PATTERNS_PATH, REFERENCE_MAP_PATH
+    from agent.tools.context_manager import ContextManager
+    from agent.tools.entity_engine import get_entity_engine
+    return ContextManager(PATTERNS_PATH, REFERENCE_MAP_PATH, entity_engine=get_entity_engine())
+
+def test_router_decisions_are_cached_by_query_shape(tmp_path):
+    path = str(tmp_path / "agents_config.json")
+    _write_config(path, CONFIG)
+    client = FakeRouterClient("factura_agent")
+    with open(path, encoding="utf-8") as f:
+        agents = [SimpleNamespace(**cfg) for cfg in json.load(f)]
+    # Umbral inalcanzable: todas las decisiones pasan por la caché o por el router LLM
+    orchestrator = Orchestrator(agents, None, [], _real_context_manager(), local_router_threshold=1.1,
+                                agents_config_path=path, llm_client=client)
+
+    async def main():
+        first = await orchestrator.select_agent_name("Deuda del DNI 12345678Z")
+        # Misma forma con otra entidad, mayúsculas y acentos: mismo resultado sin llamar al LLM
+        second = await orchestrator.select_agent_name("deuda  del dni 87654321X")
+        return first, second
+
+    assert asyncio.run(main()) == ("factura_agent", "factura_agent")
+    assert client.calls == 1
+    # Cambiar agents_config.json invalida las decisiones guardadas
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    asyncio.run(orchestrator.select_agent_name("Deuda del DNI 12345678Z"))
+    assert client.calls == 2
+
+class RecordingPrefetcher:
+    def __init__(self):
+        self.candidates = []
+
+    def plan(self, candidates, user_input, entidades, flight=None):
+        self.candidates.append([a.name for a in candidates])
+        return []
+
+def test_prefetch_only_for_allowed_agents():
+    with open(PROJECT_CONFIG, encoding="utf-8") as f:
+        configs = [SimpleNamespace(**cfg) for cfg in json.load(f)]
+    router_agent = next(c for c in configs if c.name == "router_agent")
+    prefetcher = RecordingPrefetcher()
+    orchestrator = Orchestrator([c for c in configs if c.name != "router_agent"], router_agent, [], _real_context_manager(),
+                                llm_client=FakeRouterClient("factura_agent"), prefetcher=prefetcher)
+    query = "¿Cuál es la deuda total del DNI 12345678Z?"
+    # Para un cliente (sin factura_agent) no se precarga nada de otro agente
+    assert orchestrator._start_prefetch(query, orchestrator.get_allowed_agents("cliente"), "s1") == []
+    assert prefetcher.candidates == []
+    orchestrator._start_prefetch(query, orchestrator.get_allowed_agents("admin"), "s2")
+    assert prefetcher.candidates[0][0] == "factura_agent"
+    assert set(prefetcher.candidates[0]) <= {a.name for a in orchestrator.get_allowed_agents("admin")}
@@ -0,0 +1,53 @@
+import json
+import os
+import pytest
+from agent.tools.entity_engine import EntityEngine
+from agent.tools.prompt_budget import PromptBudget
+from agent.tools.tool_registry import ToolRegistry
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _load(*path):
+    with open(os.path.join(PROJECT_DIR, *path), encoding="utf-8") as f:
+        return json.load(f)
+
+@pytest.fixture(scope="module")
+def registry():
+    return ToolRegistry(_load("agent", "tools_schema.json"))
+
+@pytest.fixture(scope="module")
+def engine():
+    return EntityEngine(os.path.join(PROJECT_DIR, "config", "entity_patterns.json"))
+
+@pytest.fixture(scope="module")
+def agent_tools():
+    return {a["name"]: a.get("tools", []) for a in _load("config", "agents_config.json")}
+
+def _names(tools):
+    return [t["function"]["name"] for t in tools]
+
+def _relevant(registry, engine, agent_tools, agent, message):
+    budget = PromptBudget(entity_types=engine.patterns)
+    tools = registry.tools_for(agent, agent_tools[agent])
+    return _names(budget.relevant_tools(tools, message, engine.extract(message)))
+
+def test_malformed_dni_keeps_intended_tool(registry, engine, agent_tools):
+    # "1234567A" tiene 7 cifras: no se detecta como DNI, pero el modelo debe poder llamar a
+    # deuda_total para que la validación de patrones responda con el error de formato
+    message = "¿Cuál es la deuda total del abonado 1234567A?"
+    assert engine.extract(message) == {}
+    assert "deuda_total" in _relevant(registry, engine, agent_tools, "factura_agent", message)
+
+def test_malformed_dni_keeps_incidencia_tools(registry, engine, agent_tools):
+    message = "Crea una incidencia en Valencia para 1234567A: fuga de agua"
+    assert "crear_incidencia" in _relevant(registry, engine, agent_tools, "incidencia_agent", message)
+    message = "Dame las incidencias del abonado 1234567A"
+    tools = _relevant(registry, engine, agent_tools, "incidencia_agent", message)
+    assert "incidencias_por_dni" in tools
+
+def test_tools_with_detected_entities_rank_first(registry, engine, agent_tools):
+    # Sin términos coincidentes se envían todas, primero las que no exigen una entidad ausente
+    tools = _relevant(registry, engine, agent_tools, "incidencia_agent", "hola")
+    assert set(tools) == set(agent_tools["incidencia_agent"])
+    needs_dni = [n for n in tools if "dni" in registry.required[n]]
+    assert tools.index(needs_dni[0]) > tools.index("incidencias_pendientes")
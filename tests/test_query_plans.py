@@ -0,0 +1,30 @@
+import ast
+import os
+import pytest
+from backend import queries, server
+from backend.migrations import ENDPOINT_QUERIES, check_query_plans
+from benchmarks.generate_db import generate
+
+@pytest.fixture(scope="module")
+def db_path(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "plans.db")
+    generate(path, abonados=200)
+    return path
+
+def test_endpoint_queries_use_indexes(db_path):
+    assert check_query_plans(db_path) == {}
+
+def test_plan_check_covers_every_listing_and_resumen_section():
+    for name in queries.LISTADOS:
+        for variant in ("completo", "primera", "siguiente", "export", "total"):
+            assert f"{name}:{variant}" in ENDPOINT_QUERIES
+    for seccion in queries.RESUMEN_SECCIONES:
+        assert f"resumen_abonado:dni:{seccion}" in ENDPOINT_QUERIES
+
+def test_server_has_no_inline_sql():
+    # Toda consulta de los endpoints sale de backend.queries, la misma que se comprueba arriba
+    with open(server.__file__, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    literals = [node.value for node in ast.walk(tree) if isinstance(node, ast.Constant) and isinstance(node.value, str)]
+    keywords = ("SELECT ", "INSERT ", "UPDATE ", "DELETE ")
+    assert [s for s in literals if s.lstrip().upper().startswith(keywords)] == []
@@ -0,0 +1,52 @@
+import pytest
+from agent.tools.session_store import SessionStore
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_context_persists_per_session():
+    store = SessionStore(capacity=10)
+    store.get("a")["dni"] = "12345678Z"
+    assert store.get("a") == {"dni": "12345678Z"}
+    assert store.get("b") == {}
+    assert store.stats()["hits"] == 1
+
+def test_least_recently_used_session_is_evicted():
+    store = SessionStore(capacity=2)
+    store.get("a")["dni"] = "12345678Z"
+    store.get("b")
+    store.get("a")  # "b" pasa a ser la menos usada
+    store.get("c")
+    assert "a" in store and "c" in store and "b" not in store
+    assert store.stats()["evictions"] == 1
+
+def test_inactive_session_expires():
+    clock = FakeClock()
+    store = SessionStore(capacity=10, ttl_seconds=60, clock=clock)
+    store.get("a")["dni"] = "12345678Z"
+    clock.now = 59
+    assert store.get("a") == {"dni": "12345678Z"}
+    # La inactividad se cuenta desde el último acceso
+    clock.now = 59 + 61
+    assert store.get("a", create=False) is None
+    assert store.get("a") == {}
+    assert store.stats()["expirations"] == 1
+
+def test_expired_sessions_are_purged_before_evicting():
+    clock = FakeClock()
+    store = SessionStore(capacity=2, ttl_seconds=60, clock=clock)
+    store.get("viejo")
+    clock.now = 30
+    store.get("reciente")
+    clock.now = 70
+    store.get("nuevo")
+    assert "reciente" in store and "nuevo" in store
+    assert store.stats()["evictions"] == 0 and store.stats()["expirations"] == 1
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        SessionStore(capacity=0)
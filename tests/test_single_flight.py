@@ -0,0 +1,34 @@
+import asyncio
+from agent.tools.single_flight import SingleFlight
+
+def test_lead_returns_existing_future():
+    async def main():
+        flight = SingleFlight("test")
+        first = flight.lead("k")
+        second = flight.lead("k")
+        assert second is first
+        flight.resolve("k", first, "ok")
+        assert await second == "ok"
+        assert not flight.running("k")
+        return flight.stats()
+
+    stats = asyncio.run(main())
+    assert stats["calls"] == 1
+
+def test_do_coalesces_concurrent_calls():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def main():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        return results, flight.stats()
+
+    results, stats = asyncio.run(main())
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert stats["deduplicated"] == 4
@@ -0,0 +1,82 @@
+import asyncio
+import json
+import os
+import pytest
+from types import SimpleNamespace
+from agent.agents.agent_base import AgentBase
+from agent.tools.tool_cache import ToolResultCache, canonical_args
+from agent.tools.tool_registry import ToolRegistry
+from agent.tools.transport import ToolTransport
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DNI, OTRO_DNI = "12345678Z", "87654321X"
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class CountingTransport(ToolTransport):
+    def __init__(self):
+        self.calls = []
+
+    async def call(self, name, args):
+        self.calls.append(name)
+        return {"tool": name, "n": len(self.calls)}
+
+@pytest.fixture(scope="module")
+def registry():
+    with open(os.path.join(PROJECT_DIR, "agent", "tools_schema.json"), encoding="utf-8") as f:
+        return ToolRegistry(json.load(f))
+
+@pytest.fixture
+def cache(registry):
+    cache = ToolResultCache(registry.metadata)
+    cache.cache._clock = FakeClock()
+    return cache
+
+def test_canonical_args_ignore_order_and_padding():
+    assert canonical_args({"dni": f" {DNI} ", "campos": ["datos"]}) == canonical_args({"campos": ["datos"], "dni": DNI})
+
+def test_hit_until_tool_ttl_expires(cache):
+    cache.store("deuda_total", {"dni": DNI}, {"deuda": 10})
+    assert cache.get("deuda_total", {"dni": f"{DNI} "}) == {"deuda": 10}
+    cache.cache._clock.now = 61  # cache_ttl de deuda_total: 60 s
+    assert cache.get("deuda_total", {"dni": DNI}) is None
+
+def test_errors_and_write_tools_are_not_cached(cache):
+    cache.store("deuda_total", {"dni": DNI}, {"error": "Abonado no encontrado"})
+    cache.store("crear_incidencia", {"dni": DNI}, {"message": "ok"})
+    assert cache.get("deuda_total", {"dni": DNI}) is None
+    assert cache.get("crear_incidencia", {"dni": DNI}) is None
+
+@pytest.mark.parametrize("write", ["crear_incidencia", "actualizar_estado_incidencia"])
+def test_writes_invalidate_affected_entries(cache, write):
+    for dni in (DNI, OTRO_DNI):
+        cache.store("incidencias_por_dni", {"dni": dni}, {"incidencias": []})
+    cache.store("incidencias_pendientes", {}, {"incidencias": []})
+    cache.store("deuda_total", {"dni": DNI}, {"deuda": 10})
+    cache.invalidate_for(write, {"dni": DNI, "ubicacion": "Madrid"})
+    # Las de ese DNI y los listados globales de incidencias, no las de otros abonados ni las facturas
+    assert cache.get("incidencias_por_dni", {"dni": DNI}) is None
+    assert cache.get("incidencias_pendientes", {}) is None
+    assert cache.get("incidencias_por_dni", {"dni": OTRO_DNI}) is not None
+    assert cache.get("deuda_total", {"dni": DNI}) is not None
+
+def test_agent_serves_cache_and_refetches_after_write(registry):
+    transport = CountingTransport()
+    tools = ["incidencias_por_dni", "crear_incidencia"]
+    agent = AgentBase("test_agent", "", "", tools, tool_registry=registry, tool_transport=transport,
+                      tool_cache=ToolResultCache(registry.metadata), llm_client=object())
+
+    def call(name, args):
+        tool_call = SimpleNamespace(function=SimpleNamespace(name=name, arguments=json.dumps(args)))
+        return asyncio.run(agent._process_tool_calls([tool_call], None, {}))[0]
+
+    first = call("incidencias_por_dni", {"dni": DNI})
+    assert call("incidencias_por_dni", {"dni": DNI})["response"] == first["response"]
+    call("crear_incidencia", {"dni": DNI, "ubicacion": "Madrid", "descripcion": "fuga"})
+    call("incidencias_por_dni", {"dni": DNI})
+    assert transport.calls == ["incidencias_por_dni", "crear_incidencia", "incidencias_por_dni"]
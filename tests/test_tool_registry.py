@@ -0,0 +1,48 @@
+import json
+import os
+import pytest
+from jsonschema.exceptions import SchemaError
+from agent.tools.tool_registry import ToolRegistry
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope="module")
+def registry():
+    with open(os.path.join(PROJECT_DIR, "agent", "tools_schema.json"), encoding="utf-8") as f:
+        return ToolRegistry(json.load(f))
+
+def _tool(name, parameters, metadata=None):
+    tool = {"type": "function", "function": {"name": name, "description": "", "parameters": parameters}}
+    if metadata:
+        tool["metadata"] = metadata
+    return tool
+
+def test_valid_arguments_pass(registry):
+    assert registry.validation_error("deuda_total", {"dni": "12345678Z"}) is None
+    assert registry.validation_error("resumen_abonado", {"poliza": "POL123456", "campos": ["datos"]}) is None
+
+def test_missing_required_and_wrong_types_are_reported(registry):
+    assert "dni" in registry.validation_error("deuda_total", {})
+    assert registry.validation_error("deuda_total", {"dni": 123}) is not None
+    assert registry.validation_error("resumen_abonado", {"dni": "12345678Z", "campos": ["no_existe"]}) is not None
+
+def test_required_fields_and_metadata_are_indexed(registry):
+    assert registry.required["crear_incidencia"] == ("dni", "ubicacion", "descripcion")
+    assert registry.required["incidencias_pendientes"] == ()
+    assert "invalidates" in registry.metadata["crear_incidencia"]
+    # La metadata no se envía al modelo
+    assert all("metadata" not in tool for tool in registry.tools)
+
+def test_invalid_schema_fails_at_startup():
+    with pytest.raises(SchemaError):
+        ToolRegistry([_tool("rota", {"type": "object", "properties": {"dni": {"type": "texto"}}})])
+
+def test_tools_for_keeps_schema_order_and_is_memoized(registry):
+    tools = registry.tools_for("factura_agent", ["deuda_total", "existe_abonado"])
+    assert [t["function"]["name"] for t in tools] == ["existe_abonado", "deuda_total"]
+    assert registry.tools_for("factura_agent", ["deuda_total", "existe_abonado"]) is tools
+
+def test_unknown_tool_is_not_validated():
+    registry = ToolRegistry([_tool("sin_parametros", None)])
+    assert registry.validation_error("sin_parametros", {"x": 1}) is None
+    assert registry.validation_error("no_existe", {}) is None
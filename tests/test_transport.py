@@ -0,0 +1,32 @@
+import asyncio
+import pytest
+from fastapi import FastAPI, Body
+from agent.tools.transport import ToolTransport, InProcessToolTransport
+
+def test_transport_requires_call():
+    class Incomplete(ToolTransport):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_in_process_runs_only_its_init_once():
+    app = FastAPI()
+    events = []
+
+    @app.on_event("startup")
+    def configure_logging():
+        events.append("logging")
+
+    @app.post("/eco", operation_id="eco")
+    async def eco(texto: str = Body(..., embed=True)):
+        return {"texto": texto}
+
+    transport = InProcessToolTransport(app, init=lambda: events.append("init"))
+
+    async def main():
+        return [await transport.call("eco", {"texto": t}) for t in ("a", "b")]
+
+    assert asyncio.run(main()) == [{"texto": "a"}, {"texto": "b"}]
+    # El startup del servidor (su logging) no se ejecuta dentro del agente
+    assert events == ["init"]